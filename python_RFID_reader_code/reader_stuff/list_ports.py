@@ -2,7 +2,6 @@
 #
 import sys
 import glob
-import serial
 
 
 def serial_ports():
@@ -23,6 +22,8 @@ def serial_ports():
     else:
         raise EnvironmentError('Unsupported platform')
 
+    import serial  # only needed once we go looking
+
     result = []
     for port in ports:
         try:
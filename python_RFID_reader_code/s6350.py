@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+#
+
+#
+# The s6350 program is a single entry point for all the TI S6350 RFID
+# reader tools.  Instead of running a separate script for each job, the
+# job is given as a subcommand:
+#
+# s6350.py inventory serial_port_to_use [--afi AFI] [--budget ms]
+# s6350.py inventory-read serial_port_to_use start_block_number number_of_blocks [--afi AFI] [--db file]
+# s6350.py read serial_port_to_use tag_UID tag_block_number
+# s6350.py read-multi serial_port_to_use tag_UID start_block_number number_of_blocks
+# s6350.py write serial_port_to_use tag_UID tag_block_number data_to_write
+# s6350.py details serial_port_to_use
+# s6350.py find serial_port_to_use tag_UID [tag_UID ...]
+# s6350.py version serial_port_to_use
+# s6350.py carrier serial_port_to_use ON|OFF
+# s6350.py fields serial_port_to_use tag_UID schema_file [field | field=value ...]
+# s6350.py ndef serial_port_to_use tag_UID
+# s6350.py dump serial_port_to_use archive_file [tag_UID ...] [--blocks N]
+# s6350.py restore serial_port_to_use archive_file [tag_UID [target_UID]]
+# s6350.py images archive_file
+# s6350.py provision manifest_file journal_file serial_port_to_use [serial_port_to_use ...]
+# s6350.py ports
+# s6350.py gui tool_name
+#
+# All numbers are in hex, the same as for the separate scripts.
+#
+# A tool's module is only imported when its subcommand is run, and
+# pyserial is only imported once a port is opened, so scripts that call
+# this program over and over don't pay for loading what they don't use.
+# tkinter is only imported by the gui subcommand, which runs the tkinter
+# version of a tool, or with 'gui panel' the control panel that has all
+# the tools in one window.
+#
+# The separate scripts in tag_stuff and reader_stuff still work as
+# before.  This program just puts those two directories on the module
+# search path and calls the same ti_ functions.
+#
+
+import os
+import sys
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TAG_STUFF = os.path.join(HERE, "tag_stuff")
+READER_STUFF = os.path.join(HERE, "reader_stuff")
+
+sys.path[:0] = [TAG_STUFF, READER_STUFF]
+
+
+#
+# The tkinter version of each tool, for the gui subcommand.
+#
+
+GUI_TOOLS = {
+    "panel": os.path.join(HERE, "s6350_panel.py"),
+    "inventory": os.path.join(TAG_STUFF, "s6350_iso_inventory_tcl.py"),
+    "read": os.path.join(TAG_STUFF, "s6350_iso_read_addressed_block_tcl.py"),
+    "read-multi": os.path.join(TAG_STUFF, "s6350_iso_read_multiple_blocks_tcl.py"),
+    "write": os.path.join(TAG_STUFF, "s6350_iso_write_addressed_block_tcl.py"),
+    "details": os.path.join(TAG_STUFF, "s6350_iso_transponder_details_tcl.py"),
+    "version": os.path.join(READER_STUFF, "s6350_reader_version_tcl.py"),
+    "carrier": os.path.join(READER_STUFF, "s6350_RF_carrier_on_off_tcl.py"),
+}
+
+
+#
+# One function per subcommand.  Each imports the module it needs and
+# returns the list of lines to print, like the ti_ functions do.
+#
+
+def do_inventory(args):
+
+    import s6350_iso_inventory
+
+    afi = None
+    if args.afi is not None:
+        afi = int(args.afi, base=16) & 0xff
+
+    return s6350_iso_inventory.ti_iso_inventory(args.port, budget_ms=args.budget,
+                                                afi=afi)
+
+
+def do_inventory_read(args):
+
+    import s6350_inventory_read
+
+    afi = None
+    if args.afi is not None:
+        afi = int(args.afi, base=16) & 0xff
+
+    return s6350_inventory_read.ti_inventory_read(args.port, args.start, args.count, afi,
+                                                  args.db)
+
+
+def do_read(args):
+
+    import s6350_iso_read_addressed_block
+    return s6350_iso_read_addressed_block.ti_read_addressed_block(
+        args.port, args.uid, args.block)
+
+
+def do_read_multi(args):
+
+    import s6350_iso_read_multiple_blocks
+    return s6350_iso_read_multiple_blocks.ti_read_multiple_blocks(
+        args.port, args.uid, args.start, args.count)
+
+
+def do_write(args):
+
+    import s6350_iso_write_addressed_block
+    return s6350_iso_write_addressed_block.ti_write_addressed_block(
+        args.port, args.uid, args.block, args.data)
+
+
+def do_details(args):
+
+    import s6350_iso_transponder_details
+    return s6350_iso_transponder_details.ti_iso_transponder_details(args.port)
+
+
+def do_find(args):
+
+    import s6350_iso_find_tags
+    return s6350_iso_find_tags.ti_find_tags(args.port, args.uids)
+
+
+def do_version(args):
+
+    import s6350_reader_version
+    return s6350_reader_version.ti_reader_version(args.port)
+
+
+def do_carrier(args):
+
+    import s6350_RF_carrier_on_off
+    return s6350_RF_carrier_on_off.ti_toggle_carrier(args.port, args.state)
+
+
+def do_fields(args):
+
+    import s6350_tag_schema
+    return s6350_tag_schema.ti_fields(args.port, args.uid, args.schema, args.fields)
+
+
+def do_ndef(args):
+
+    import s6350_ndef
+    return s6350_ndef.ti_read_ndef(args.port, args.uid)
+
+
+def do_dump(args):
+
+    import s6350_tag_image
+    return s6350_tag_image.ti_dump_image(args.port, args.archive, args.uids, args.blocks)
+
+
+def do_restore(args):
+
+    import s6350_tag_image
+    return s6350_tag_image.ti_restore_image(args.port, args.archive, args.uid, args.target)
+
+
+def do_images(args):
+
+    import s6350_tag_image
+    return s6350_tag_image.ti_list_images(args.archive)
+
+
+def do_provision(args):
+
+    import s6350_provision
+    return s6350_provision.ti_provision(args.ports, args.manifest, args.journal)
+
+
+def do_ports(args):
+
+    import list_ports
+    return list_ports.serial_ports()
+
+
+def do_gui(args):
+
+    import runpy
+    runpy.run_path(GUI_TOOLS[args.tool], run_name="__main__")
+    return []
+
+
+#
+# The makeParser function sets up the subcommands and their arguments.
+#
+
+def makeParser():
+
+    parser = argparse.ArgumentParser(prog="s6350",
+                                     description="TI S6350 RFID reader tools.")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    commands.required = True
+
+    cmd = commands.add_parser("inventory", help="list the tags in the reader field")
+    cmd.add_argument("port", help="serial port, ie /dev/ttyUSB0 or COM8")
+    cmd.add_argument("--afi", help="only tags with this AFI, in hex")
+    cmd.add_argument("--budget", type=int, metavar="ms",
+                     help="stop after about this many milliseconds")
+    cmd.set_defaults(run=do_inventory)
+
+    cmd = commands.add_parser("inventory-read",
+                              help="inventory the field and read blocks from every tag")
+    cmd.add_argument("port")
+    cmd.add_argument("start", help="first block number in hex")
+    cmd.add_argument("count", help="number of blocks in hex")
+    cmd.add_argument("--afi", help="only tags with this AFI, in hex")
+    cmd.add_argument("--db", help="also keep the sightings and block reads in this database")
+    cmd.set_defaults(run=do_inventory_read)
+
+    cmd = commands.add_parser("read", help="read one block of a tag")
+    cmd.add_argument("port")
+    cmd.add_argument("uid", help="tag UID in hex")
+    cmd.add_argument("block", help="block number in hex")
+    cmd.set_defaults(run=do_read)
+
+    cmd = commands.add_parser("read-multi", help="read a range of blocks of a tag")
+    cmd.add_argument("port")
+    cmd.add_argument("uid", help="tag UID in hex")
+    cmd.add_argument("start", help="first block number in hex")
+    cmd.add_argument("count", help="number of blocks in hex")
+    cmd.set_defaults(run=do_read_multi)
+
+    cmd = commands.add_parser("write", help="write one block of a tag")
+    cmd.add_argument("port")
+    cmd.add_argument("uid", help="tag UID in hex")
+    cmd.add_argument("block", help="block number in hex")
+    cmd.add_argument("data", help="up to 4 bytes of data in hex")
+    cmd.set_defaults(run=do_write)
+
+    cmd = commands.add_parser("details", help="show the system information of a tag")
+    cmd.add_argument("port")
+    cmd.set_defaults(run=do_details)
+
+    cmd = commands.add_parser("find", help="check if tags with known UIDs are in the field")
+    cmd.add_argument("port")
+    cmd.add_argument("uids", nargs="+", metavar="uid", help="tag UID in hex")
+    cmd.set_defaults(run=do_find)
+
+    cmd = commands.add_parser("version", help="show the reader firmware version")
+    cmd.add_argument("port")
+    cmd.set_defaults(run=do_version)
+
+    cmd = commands.add_parser("carrier", help="turn the RF carrier on or off")
+    cmd.add_argument("port")
+    cmd.add_argument("state", metavar="ON|OFF")
+    cmd.set_defaults(run=do_carrier)
+
+    cmd = commands.add_parser("fields", help="read or write named fields of a tag")
+    cmd.add_argument("port")
+    cmd.add_argument("uid", help="tag UID in hex")
+    cmd.add_argument("schema", help="CSV file of name,format[,offset] lines")
+    cmd.add_argument("fields", nargs="*", metavar="field[=value]",
+                     help="fields to read, or to write with =value; all are read if none given")
+    cmd.set_defaults(run=do_fields)
+
+    cmd = commands.add_parser("ndef", help="read the NDEF messages of a tag")
+    cmd.add_argument("port")
+    cmd.add_argument("uid", help="tag UID in hex")
+    cmd.set_defaults(run=do_ndef)
+
+    cmd = commands.add_parser("dump", help="add binary images of tags to an archive file")
+    cmd.add_argument("port")
+    cmd.add_argument("archive", help="archive file the images are added to")
+    cmd.add_argument("uids", nargs="*", metavar="uid",
+                     help="tag UID in hex; every tag in the field if none given")
+    cmd.add_argument("--blocks", help="number of blocks in hex, for tags that don't report it")
+    cmd.set_defaults(run=do_dump)
+
+    cmd = commands.add_parser("restore", help="write tag images from an archive file back")
+    cmd.add_argument("port")
+    cmd.add_argument("archive", help="archive file made by dump")
+    cmd.add_argument("uid", nargs="?", help="only restore the image of this tag UID, in hex")
+    cmd.add_argument("target", nargs="?", help="write it into this tag UID instead, in hex")
+    cmd.set_defaults(run=do_restore)
+
+    cmd = commands.add_parser("images", help="list the tag images in an archive file")
+    cmd.add_argument("archive")
+    cmd.set_defaults(run=do_images)
+
+    cmd = commands.add_parser("provision", help="write block images into a batch of tags")
+    cmd.add_argument("manifest", help="CSV file of uid,start_block,data lines")
+    cmd.add_argument("journal", help="file recording the jobs done")
+    cmd.add_argument("ports", nargs="+", metavar="port")
+    cmd.set_defaults(run=do_provision)
+
+    cmd = commands.add_parser("ports", help="list the serial ports that can be opened")
+    cmd.set_defaults(run=do_ports)
+
+    cmd = commands.add_parser("gui", help="run the tkinter version of a tool")
+    cmd.add_argument("tool", choices=sorted(GUI_TOOLS))
+    cmd.set_defaults(run=do_gui)
+
+    return parser
+
+
+####################################
+#
+# The real application code starts here.
+#
+####################################
+
+def main(argv=None):
+
+    args = makeParser().parse_args(argv)
+
+    for line in args.run(args):
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
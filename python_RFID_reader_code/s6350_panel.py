@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+#
+
+#
+# The s6350_panel program is one tkinter window for all the TI S6350
+# RFID reader tools.  It has a tab for each job: inventory, block read
+# and write, transponder details, and the reader itself (version and RF
+# carrier).
+#
+# The separate _tcl programs each scan all the serial ports when they
+# start and open the port again on every button click.  The panel scans
+# the ports once, in the background, and keeps the list until 'Rescan
+# Ports' is clicked.  The port is opened once, with 'Connect', and the
+# one S6350Session is used by all the tabs until 'Disconnect' or the
+# window is closed.
+#
+# The Inventory tab has a 'Continuous' switch that does one inventory
+# after another, with a live chart of the read rate, rounds, collisions
+# and command latency under the tag table (see s6350_rate_chart).
+#
+# The reader commands are run one at a time on a worker thread so the
+# window doesn't freeze while the reader is busy.  tkinter widgets must
+# only be touched from the main thread, so the worker puts what it wants
+# done on a queue and the main thread picks it up every POLL_MS
+# milliseconds.
+#
+# See TI 6350 user manual and the ISO 15693-3 document for more information.
+#
+
+import os
+import sys
+import time
+import queue
+import threading
+import concurrent.futures
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(HERE, "tag_stuff"), os.path.join(HERE, "reader_stuff")]
+
+import tkinter
+from tkinter import *
+from tkinter import ttk
+import list_ports
+import s6350_session
+import s6350_tag_view
+import s6350_rate_chart
+import s6350_iso_inventory
+import s6350_iso_read_addressed_block
+import s6350_iso_read_multiple_blocks
+import s6350_iso_write_addressed_block
+import s6350_iso_transponder_details
+
+POLL_MS = 50  # how often the main thread looks for results
+
+
+#
+# The ControlPanel class builds the window and holds the shared session.
+#
+
+class ControlPanel:
+
+    def __init__(self, master):
+
+        self.master = master
+        self.session = None  # the shared S6350Session once connected
+        self.cycling = False  # True while continuous inventories are going
+        self.ports = []  # cached list of serial ports
+        self.todo = queue.SimpleQueue()  # functions for the main thread to run
+        self.worker = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+        master.title('TI S6350 RFID Reader')
+
+#
+# Next is the container that holds the serial port, the buttons to
+# rescan and connect, and the connection status.
+#
+        topbox = Label(master, relief=RAISED, bd=2)
+        topbox.pack(side=TOP, fill='x')
+
+        self.port = ttk.Combobox(topbox, width=25)
+        self.rescan = Button(topbox, relief=RAISED, text='Rescan Ports',
+                             command=self.scanPorts)
+        self.connect_button = Button(topbox, relief=RAISED, text='Connect',
+                                     command=self.toggleConnection)
+        self.status = StringVar(value='Not connected')
+
+        Label(topbox, text='Serial Port: ').pack(side=LEFT)
+        self.port.pack(side=LEFT)
+        self.rescan.pack(side=LEFT)
+        self.connect_button.pack(side=LEFT, padx='2m')
+        Label(topbox, textvariable=self.status).pack(side=LEFT, padx='2m')
+
+#
+# The tabs.
+#
+        self.tabs = ttk.Notebook(master)
+        self.tabs.pack(side=TOP, fill='both', expand=True)
+
+        self.makeInventoryTab()
+        self.makeBlocksTab()
+        self.makeDetailsTab()
+        self.makeReaderTab()
+
+        master.protocol("WM_DELETE_WINDOW", self.quit)
+        master.after(POLL_MS, self.poll)
+        self.scanPorts()
+
+#
+# The makeOutput function adds the text box and the scroll bar that goes
+# with it to a tab.
+#
+
+    def makeOutput(self, tab):
+
+        text = Text(tab, relief=RAISED, bd=2)
+        scroll = Scrollbar(tab, background='#ffffff', command=text.yview)
+        text['yscrollcommand'] = scroll.set
+        scroll.pack(side=RIGHT, fill='y')
+        text.pack(side=TOP, fill='both', expand=True)
+        return text
+
+    def makeInventoryTab(self):
+
+        tab = Frame(self.tabs)
+        self.tabs.add(tab, text='Inventory')
+
+        box = Label(tab, relief=RAISED, bd=2)
+        box.pack(side=TOP, fill='x')
+        Label(box, text='AFI in hex (blank for all): ').pack(side=LEFT)
+        self.afi = Entry(box, width=6, relief=SUNKEN, bd=2)
+        self.afi.pack(side=LEFT)
+        Button(box, relief=RAISED, text='Inventory',
+               command=self.doInventory).pack(side=LEFT, padx='8m')
+        self.continuous = BooleanVar(value=False)
+        Checkbutton(box, text='Continuous', variable=self.continuous,
+                    command=self.toggleContinuous).pack(side=LEFT)
+        Button(box, relief=RAISED, text='Clear',
+               command=self.clearInventory).pack(side=LEFT, padx='8m')
+
+        self.inventory_chart = s6350_rate_chart.RateChart(tab, relief=RAISED, bd=2)
+        self.inventory_chart.pack(side=BOTTOM, fill='x')
+        self.inventory_view = s6350_tag_view.TagView(tab)
+        self.inventory_view.pack(side=TOP, fill='both', expand=True)
+
+    def makeBlocksTab(self):
+
+        tab = Frame(self.tabs)
+        self.tabs.add(tab, text='Blocks')
+
+        box = Label(tab, relief=RAISED, bd=2)
+        box.pack(side=TOP, fill='x')
+        Label(box, text='Tag ID: ').pack(side=LEFT)
+        self.uid = Entry(box, width=20, relief=SUNKEN, bd=2)
+        self.uid.pack(side=LEFT)
+        Label(box, text='Block # in hex: ').pack(side=LEFT)
+        self.block = Entry(box, width=6, relief=SUNKEN, bd=2)
+        self.block.pack(side=LEFT)
+        Label(box, text='# of blocks: ').pack(side=LEFT)
+        self.count = Entry(box, width=4, relief=SUNKEN, bd=2)
+        self.count.insert(0, '1')
+        self.count.pack(side=LEFT)
+        Label(box, text='Data: ').pack(side=LEFT)
+        self.data = Entry(box, width=10, relief=SUNKEN, bd=2)
+        self.data.pack(side=LEFT)
+
+        buttons = Label(tab, relief=RAISED, bd=2)
+        buttons.pack(side=TOP, fill='x')
+        Button(buttons, relief=RAISED, text='Read Block',
+               command=self.doRead).pack(side=LEFT)
+        Button(buttons, relief=RAISED, text='Read Blocks',
+               command=self.doReadMultiple).pack(side=LEFT, padx='2m')
+        Button(buttons, relief=RAISED, text='Write Block',
+               command=self.doWrite).pack(side=LEFT)
+
+        self.blocks_text = self.makeOutput(tab)
+
+    def makeDetailsTab(self):
+
+        tab = Frame(self.tabs)
+        self.tabs.add(tab, text='Details')
+
+        box = Label(tab, relief=RAISED, bd=2)
+        box.pack(side=TOP, fill='x')
+        Button(box, relief=RAISED, text='Get Details',
+               command=self.doDetails).pack(side=LEFT)
+
+        self.details_text = self.makeOutput(tab)
+
+    def makeReaderTab(self):
+
+        tab = Frame(self.tabs)
+        self.tabs.add(tab, text='Reader')
+
+        box = Label(tab, relief=RAISED, bd=2)
+        box.pack(side=TOP, fill='x')
+        Button(box, relief=RAISED, text='Version',
+               command=self.doVersion).pack(side=LEFT)
+        Button(box, relief=RAISED, text='RF ON',
+               command=lambda: self.doCarrier(True)).pack(side=LEFT, padx='8m')
+        Button(box, relief=RAISED, text='RF OFF',
+               command=lambda: self.doCarrier(False)).pack(side=LEFT)
+
+        self.reader_text = self.makeOutput(tab)
+
+#
+# The poll method runs on the main thread.  It runs whatever the worker
+# threads have queued up for it and then schedules itself again.
+#
+
+    def poll(self):
+
+        while True:
+            try:
+                job = self.todo.get_nowait()
+            except queue.Empty:
+                break
+            job()
+
+        self.master.after(POLL_MS, self.poll)
+
+#
+# The writeLines method shows lines in a text box, or in the message line
+# of a TagView, where there is only room for the last of them.
+#
+
+    def writeLines(self, text, lines):
+
+        if isinstance(text, s6350_tag_view.TagView):
+            if len(lines) > 0:
+                text.setMessage(lines[-1])
+            return
+
+        for line in lines:
+            text.insert(END, line + '\n')
+        text.see(END)
+
+#
+# The scanPorts method looks for serial ports on a thread of its own,
+# because checking every port takes a while, and fills in the port list
+# when it is done.  The first port found is picked if none is picked yet.
+#
+
+    def scanPorts(self):
+
+        self.rescan['state'] = DISABLED
+
+        def scan():
+            try:
+                ports = list_ports.serial_ports()
+            except Exception as error:  # no pyserial, or an unknown platform
+                self.todo.put(lambda: self.status.set("Can't list ports: " + str(error)))
+                ports = []
+            self.todo.put(lambda: self.showPorts(ports))
+
+        threading.Thread(target=scan, daemon=True).start()
+
+    def showPorts(self, ports):
+
+        self.ports = ports
+        self.port['values'] = ports
+        self.rescan['state'] = NORMAL
+
+        if len(ports) == 0:
+            self.status.set("No connected serial ports found.  "
+                            "Connect RFID reader and click 'Rescan Ports'.")
+        elif self.port.get() == '':
+            self.port.set(ports[0])
+
+#
+# The connect method opens the shared session if it isn't open yet, and
+# returns it, or None if the port can't be opened.
+#
+
+    def connect(self):
+
+        if self.session is not None:
+            return self.session
+
+        port = self.port.get()
+        session = s6350_session.openSession(port)
+        if isinstance(session, list):  # the port could not be opened
+            self.status.set(session[0])
+            return None
+
+        self.session = session
+        self.status.set('Connected to ' + port)
+        self.connect_button['text'] = 'Disconnect'
+        return session
+
+    def disconnect(self):
+
+        self.continuous.set(False)
+        if self.session is not None:
+            self.worker.submit(self.session.close)  # after the commands already waiting
+            self.session = None
+        self.status.set('Not connected')
+        self.connect_button['text'] = 'Connect'
+
+    def toggleConnection(self):
+
+        if self.session is None:
+            self.connect()
+        else:
+            self.disconnect()
+
+#
+# The run method runs job(session, *args) on the worker thread and shows
+# the lines it returns in the given text box or TagView.  If 'then' is
+# given it is called on the main thread afterwards.  It returns False if
+# the port could not be opened.
+#
+
+    def run(self, text, job, *args, then=None):
+
+        session = self.connect()
+        if session is None:
+            return False
+
+        def show(lines):
+            self.writeLines(text, lines)
+            if then is not None:
+                then()
+
+        def done(future):
+            try:
+                lines = future.result()
+            except Exception as error:  # the port went away, for example
+                lines = ["Error: " + str(error)]
+            self.todo.put(lambda: show(lines))
+
+        self.worker.submit(job, session, *args).add_done_callback(done)
+        return True
+
+#
+# The button commands.
+#
+
+    def doInventory(self):
+
+        if self.cycling:  # the continuous inventories will pick it up
+            return
+
+        afi = None
+        if self.afi.get().strip() != '':
+            try:
+                afi = int(self.afi.get(), base=16) & 0xff
+            except ValueError:
+                self.writeLines(self.inventory_view, ["AFI must be a number in hex."])
+                self.continuous.set(False)
+                return
+
+        self.cycling = self.run(self.inventory_view, self.inventory, afi,
+                                then=self.nextInventory)
+        if not self.cycling:
+            self.continuous.set(False)
+
+#
+# After each inventory the next one is started if 'Continuous' is still
+# on.  Each one goes to the back of the worker's line, so the other tabs
+# still get their turn with the reader.
+#
+
+    def nextInventory(self):
+
+        self.cycling = False
+        if self.continuous.get():
+            self.doInventory()
+
+    def toggleContinuous(self):
+
+        if self.continuous.get():
+            self.doInventory()
+
+    def clearInventory(self):
+
+        self.inventory_view.clear()
+        self.inventory_chart.clear()
+
+#
+# The inventory method runs on the worker thread.  The tags found go
+# straight to the TagView and the figures to the chart, only the totals
+# or the error come back as lines.
+#
+
+    def inventory(self, session, afi):
+
+        state, errors, stats = s6350_iso_inventory.measureInventory(session, afi)
+        self.inventory_view.addTags(state.tags, time.time())
+        self.inventory_chart.addSample(stats)
+
+        if len(errors) > 0:
+            return [" ".join(errors)]
+        return [time.strftime("%H:%M:%S") + "  Tags found: " + str(len(state.tags))]
+
+    def doRead(self):
+
+        self.run(self.blocks_text,
+                 s6350_iso_read_addressed_block.ti_read_addressed_block,
+                 self.uid.get(), self.block.get())
+
+    def doReadMultiple(self):
+
+        self.run(self.blocks_text,
+                 s6350_iso_read_multiple_blocks.ti_read_multiple_blocks,
+                 self.uid.get(), self.block.get(), self.count.get())
+
+    def doWrite(self):
+
+        self.run(self.blocks_text,
+                 s6350_iso_write_addressed_block.ti_write_addressed_block,
+                 self.uid.get(), self.block.get(), self.data.get())
+
+    def doDetails(self):
+
+        self.run(self.details_text,
+                 s6350_iso_transponder_details.ti_iso_transponder_details)
+
+    def doVersion(self):
+
+        self.run(self.reader_text, lambda session: session.readVersion())
+
+    def doCarrier(self, on):
+
+        def carrier(session):
+            errors = session.setCarrier(on)
+            if len(errors) > 0:
+                return errors
+            return ["Carrier successfully turned " + ("ON." if on else "OFF.")]
+
+        self.run(self.reader_text, carrier)
+
+    def quit(self):
+
+        self.disconnect()
+        self.worker.shutdown(wait=True)
+        self.master.destroy()
+
+
+#
+# The main part of the program starts here.  It just forms the GUI
+# and starts the event loop to handle GUI events.
+#
+
+if __name__ == '__main__':
+
+    root = Tk()
+    panel = ControlPanel(root)
+    root.mainloop()
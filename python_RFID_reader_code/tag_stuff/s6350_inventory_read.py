@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+#
+
+#
+# The s6350_inventory_read program does "inventory the field and read
+# blocks X to Y from every tag" as one job over one session.
+#
+# Doing it with the separate tools takes one inventory and then one
+# ti_read_multiple_blocks per tag, each opening the port again, and no
+# tag is read until the whole inventory is done.  Here each tag's read is
+# put on the session's command queue as soon as the inventory round that
+# found it is done, while the inventory goes on with the next round.  The
+# reads and the inventory rounds take turns on the reader, so by the time
+# the last tag is found most of the others have been read already.
+#
+# The result is one TagReading per tag, with its UID, DSFID and blocks.
+#
+# See TI 6350 user manual and the ISO 15693-3 document for more information.
+#
+# This is the CLI tool version.
+#
+
+import io
+import sys
+import time
+import itertools
+import s6350_session
+import s6350_tags
+import s6350_iso_inventory
+import s6350_iso_read_multiple_blocks
+
+
+#
+# A TagReading is the record for one tag.  'blocks' is a list with
+# [security byte, 4 data bytes] for each block read, and 'error' is None,
+# or a string saying why the blocks could not be read.
+#
+
+class TagReading:
+
+    def __init__(self, uid, dsfid, blocks=None, error=None):
+
+        self.uid = uid
+        self.dsfid = dsfid
+        self.blocks = blocks
+        self.error = error
+
+
+#
+# The inventoryAndRead function does the fused inventory and read on an
+# open session, reading 'count' blocks from block 'start' of every tag.
+# If 'afi' is given only tags with that AFI are inventoried.  It returns
+# the list of TagReadings, in the order the tags were found, and the
+# error strings from the inventory if it stopped early.  Tags found
+# before the inventory stopped are still read.
+#
+# If a 'store' is given (see s6350_sightings) every tag found is written
+# to it as a sighting, and every block read as a block read.
+#
+
+def inventoryAndRead(session, start, count, afi=None, store=None):
+
+    state = s6350_iso_inventory.InventoryState(afi)
+    reads = []  # (uid, dsfid, futures) in the order the tags were found
+    errors = []
+
+    while not state.done():
+        found = len(state.tags)
+        errors = s6350_iso_inventory.inventoryRound(session, state)
+
+        now = time.time()
+        for uid, dsfid in itertools.islice(state.tags.items(), found, None):
+            futures = s6350_iso_read_multiple_blocks.submitReadBlocks(session, uid,
+                                                                      start, count)
+            reads.append((uid, dsfid, futures))
+            if store is not None:
+                store.addSighting(uid, session.port_to_use, dsfid, now)
+
+        if len(errors) > 0:
+            break
+
+    readings = []
+    for uid, dsfid, futures in reads:
+        blocks = s6350_iso_read_multiple_blocks.collectBlocks(futures)
+        if isinstance(blocks, str):
+            readings.append(TagReading(uid, dsfid, error=blocks))
+            continue
+
+        readings.append(TagReading(uid, dsfid, blocks))
+        if store is not None:
+            now = time.time()
+            for idx, block in enumerate(blocks):
+                store.addBlockRead(uid, session.port_to_use, start + idx, block[1],
+                                   block[0], now)
+
+    return readings, errors
+
+
+####################################
+#
+# The real application code starts here.
+#
+####################################
+
+#
+# The ti_inventory_read function is the CLI version.  It returns a line
+# for each tag with its UID, DSFID and the blocks as hex, or the error.
+# Start and count are numbers in hex, like the other tools take.  With a
+# 'db_path' the sightings and block reads are also kept in that database
+# (see s6350_sightings).
+#
+
+def ti_inventory_read(port_to_use, tag_BLK, num_BLKS, afi=None, db_path=None):
+
+    result = []
+
+    try:
+        start = int(tag_BLK, base=16)
+        count = int(num_BLKS, base=16)
+    except ValueError:
+        result.append("Error: User input contains non-hex characters.")
+        return result
+
+    if count < 1:
+        result.append("Error: Number of blocks must be at least 1.")
+        return result
+
+    session = s6350_session.openSession(port_to_use)
+    if isinstance(session, list):  # the port could not be opened
+        return session
+
+    store = None
+    if db_path is not None:
+        import s6350_sightings  # only needed with a database
+        store = s6350_sightings.SightingStore(db_path)
+
+    readings, errors = inventoryAndRead(session, start, count, afi, store)
+
+    if store is not None:
+        store.close()  # writes out what is still queued
+
+    for reading in readings:
+        line = "ID: " + s6350_tags.uidToHex(reading.uid) + " DSFID: " + "0x%0.2x" % reading.dsfid
+        if reading.error is not None:
+            line += " Error: " + reading.error
+        else:
+            line += " Data: " + " ".join(block[1].hex() for block in reading.blocks)
+        result.append(line)
+
+    result.extend(errors)
+    result.append("Total tags found: " + str(len(readings)))
+
+    session.release()
+    return result
+
+#
+# Standalone 'main' starts here.
+#
+
+if __name__ == '__main__':
+#
+# Check that there are at least three arguments which hopefully will be
+# the serial port ID that is to be used, the first block and the number
+# of blocks.
+#
+
+    if len(sys.argv) < 4 :
+        print ("Usage: ")
+        print (sys.argv[0] + " serial_port_to_use start_block_number number_of_blocks [AFI]")
+        print ("Where start_block_number, number_of_blocks and AFI are numbers in hex.")
+        sys.exit()
+
+    afi = None
+    if len(sys.argv) > 4:
+        afi = int(sys.argv[4], base=16) & 0xff
+
+    all_results = ti_inventory_read(sys.argv[1], sys.argv[2], sys.argv[3], afi)
+    for line in all_results:
+        print(line)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+#
+
+#
+# The s6350_iso_find_tags program checks if tags with known UIDs are in
+# the RFID reader field.  Instead of doing a full inventory and looking
+# for the UIDs in the results, which takes more rounds the more tags are
+# in the field, it does one ISO inventory per UID with a single time slot
+# and the whole 64 bit UID as the mask.  Only the tag with that UID can
+# answer, so each check is one command to the reader no matter how many
+# other tags are around.
+#
+# See TI 6350 user manual and the ISO 15693-3 document for more information.
+#
+# This is the CLI tool version.
+#
+
+import io
+import sys
+import s6350_session
+import s6350_tags
+
+
+#
+# The checkTag function does the presence check for one UID on an open
+# session.  The UID is given as an integer.  It returns True if the tag
+# answered, False if it did not, or a string saying what went wrong with
+# the reader.
+#
+# After the ISO wrapper the command bytes are:
+#
+# 7: ISO reader config byte 0.  The value in this case is 0x11
+# 8: Tag flags.  In this case indicating 1 time slot (0x27)
+# 9: The ISO command.  In this case 0x01, inventory
+# 10: The mask length in BITS, all 64 of them
+# 11 to 18: The mask, which is the UID, LSB first
+#
+# If the tag is there the first valid data flag is set in byte 7 of the
+# reply, and the UID it sent back is in bytes 13 to 20.
+#
+
+def checkTag(session, uid):
+
+    check_tag = [0x11, 0x27, 0x01, 64]
+    check_tag.extend(s6350_tags.uidToBytes(uid))
+
+    command = s6350_session.formCommand(0x60, check_tag)
+    response = session.transact(command)  # send the command and read the response
+
+    if len(response) < 2:  # no reply or a bad one
+        return response[0]
+
+    if len(response) < 23 or (response[7] & 0x01) == 0:
+        return False
+
+    return s6350_tags.uidFromBytes(response[13:21]) == uid
+
+
+####################################
+#
+# The real application code starts here.
+#
+####################################
+
+#
+# The find function checks a list of UIDs, given as integers or hex
+# strings, over one session.  It returns a dictionary with an entry for
+# each UID that is True if the tag is in the field, False if it is not,
+# or a string saying why it could not be checked.  If the port can't be opened the list of
+# error strings from openSession is returned instead.
+#
+
+def find(port_to_use, tag_UIDs):
+
+    session = s6350_session.openSession(port_to_use)
+    if isinstance(session, list):  # the port could not be opened
+        return session
+
+    found = {}
+
+    for tag_UID in tag_UIDs:
+        uid = s6350_tags.uidFromInput(tag_UID)
+        if isinstance(uid, str):
+            found[tag_UID] = "Error: " + uid
+        else:
+            found[tag_UID] = checkTag(session, uid)
+
+    session.release()
+    return found
+
+
+#
+# The is_present function checks a single UID.  It returns what find
+# returns for that UID, or the list of errors if the port can't be opened.
+#
+
+def is_present(port_to_use, tag_UID):
+
+    found = find(port_to_use, [tag_UID])
+    if isinstance(found, list):
+        return found
+
+    return found[tag_UID]
+
+
+#
+# The ti_find_tags function is the CLI version of find.  It returns a list
+# of lines to show, one for each UID.
+#
+
+def ti_find_tags(port_to_use, tag_UIDs):
+
+    result = []
+
+    found = find(port_to_use, tag_UIDs)
+    if isinstance(found, list):
+        return found
+
+    for tag_UID in tag_UIDs:
+        shown = str(tag_UID)
+        if isinstance(tag_UID, int):
+            shown = s6350_tags.uidToHex(tag_UID)
+
+        if found[tag_UID] is True:
+            result.append("ID: " + shown + " is in the field.")
+        elif found[tag_UID] is False:
+            result.append("ID: " + shown + " is not in the field.")
+        else:
+            result.append("ID: " + shown + " " + found[tag_UID])
+
+    return result
+
+#
+# Standalone 'main' starts here.
+#
+
+if __name__ == '__main__':
+#
+# Check that there are at least two arguments which hopefully will be
+# the serial port ID that is to be used and a tag UID.
+#
+
+    if len(sys.argv) < 3 :
+        print ("Usage: ")
+        print (sys.argv[0] + " serial_port_to_use tag_UID [tag_UID ...]")
+        print ("Where each tag_UID is a number in hex.")
+        sys.exit()
+
+    all_results = ti_find_tags(sys.argv[1], sys.argv[2:])
+    for line in all_results:
+        print(line)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+#
+
+#
+# The s6350_iso_helpers module has the helper routines shared by the tag
+# programs that read and write tag memory blocks.  They used to be
+# copied into each program.
+#
+
+#
+# The chkErrorISO function will take a packet returned by the
+# reader as a list of bytes and check it for any operational
+# errors.  Operational errors are ones where the reader is
+# functional and communication is functional but something
+# went wrong with the requested operation, for example asking
+# for a tag UID that does not belong to any tag in the field.
+#
+# Note that functional errors and communication errors are
+# checked for in the session transact routine.
+#
+# The routine will return a list that contains the ISO error
+# code as an integer and the meaning of the error as a string.
+# An error code of 0 means no error (OK or command success).
+#
+# An error from the tag has the error flag (0x01) set in the ISO
+# response flags, byte 7, and the ISO error code in byte 8.  An error
+# from the reader itself, like no tag answering, has the error flag
+# (0x10) set in the reader command flags, byte 5, and the reader's error
+# code in byte 7.  The code is only looked at when its flag is set.
+#
+
+ISO_ERROR_FLAG = 0x01  # in the ISO response flags, byte 7
+READER_ERROR_FLAG = 0x10  # in the reader command flags, byte 5
+
+def chkErrorISO(rddat): 
+    if (len(rddat)==11) and (rddat[7] & ISO_ERROR_FLAG):  # if there is an error
+        error_code = rddat[8]  # get the code from the reader
+        error_meaning = {
+            "0x3" : "The option is not supported" ,
+            "0x2" : "Command not supported.",
+            "0x0f" : "Error with no information given",
+            "0x10" : "Specified block is not available",
+            "0x11" : "The specified block is already locked and thus cannot be locked again",
+            "0x12" : "The specified block is locked and its content cannot be changed",
+            "0x13" : "The specified block was not successfully programmed",
+            "0x14" : "The specified block was not successfully locked",
+            "0x15" : "The specified block is read−protectedx",
+            }.get(hex(rddat[8]), "Unknown error code.")
+    elif (len(rddat)==10) and (rddat[5] & READER_ERROR_FLAG):  # if the reader says so
+        error_code = rddat[7]  # get the code from the reader
+        error_meaning = {
+            "0x1" : "Transponder not found.",
+            "0x2" : "Command not supported.",
+            "0x4" : "Packet flags invalid for command.",
+            }.get(hex(rddat[7]), "Unknown error code.")
+    else:
+        error_code = 0  # else 0 = all OK
+        error_meaning = "OK"
+
+    return [error_code, error_meaning]  # return code and meaning as a list
+
+
+#
+# The do_Hex_Input routine will take a string argument representing a number
+# in hex and also an argument for a number of bytes.  It will turn the string
+# argument into a little-endian list of bytes, each byte represented by an
+# integer having a length of the requested number of bytes.  If all is well,
+# it will return the list of bytes.  If an error occurs, it will instead
+# return a string with the meaning of the error.  A calling program can
+# determine what is coming back (a list or an error string) by using the
+# builtin isinstance function.
+#
+# The user input string representing the hex number can optionally have a
+# leading 0x.
+#
+
+
+def do_Hex_Input(user_input, num_bytes):
+
+    formatter = "%0." + str(num_bytes * 2) + "x"
+
+    try:
+        s = formatter % int(user_input, base=16)
+    except ValueError:
+        return_bytes = "User input contains non-hex characters."
+        return return_bytes
+
+    if len(s) > (num_bytes * 2):
+        return_bytes = "User input greater than required length."
+        return return_bytes
+
+    return_bytes = []
+    x = 0
+
+    while (x < num_bytes):
+        return_bytes.append(int(s[-2 - (x * 2)] + s[-1 - (x * 2)], base=16))
+        x = x + 1
+
+    return return_bytes
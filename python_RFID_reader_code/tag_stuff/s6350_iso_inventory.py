@@ -10,6 +10,10 @@
 # Transponder ID
 # The Data Storage Format Identifier (DSFID)
 #
+# The progress of the inventory is kept in an InventoryState, so an
+# inventory that is stopped by an error can be carried on later instead
+# of starting over.
+#
 # See TI 6350 user manual and the ISO 15693-3 document for more information.
 #
 # This is the CLI tool version.
@@ -18,99 +22,10 @@
 
 import io
 import sys
-import serial
-
-#
-# The getReturnPacket function reads a reply packet from the S6350 reader.
-# It does some checking of the data and if the packet is intact and the
-# checksum is right it will return the packet to the calling program as a
-# list of integers.
-#
-# The get return packet also checks for functional and communication errors.
-# A functional error occurs if the RFID reader doesn't work.  This is
-# indicated if no data is read from the RFID reader and the serial connection
-# times out.  Communication errors are those where the reader works, but the
-# returned data is corrupt as indicated by the checksum bytes.  Both of these
-# errors are fatal, so if they occur a message will be printed and the program
-# will exit.
-#
-# There could also be ISO command errors.  Those are not necessarily fatal
-# and are handled in the chkErrorISO routine.
-#
-
-def getReturnPacket(tiser):
-
-    result = []
-
-#
-# We read the returned data from the reader in 2 passes.  First we read
-# the first two bytes.  The second byte is the length of the entire returned
-# packet.  From that we determine how many more bytes to read which are then
-# read in the second pass.
-#
-
-    line_size = tiser.read(2)  # first pass, read first two bytes of reply
-    print(line_size)
-
-    if len(line_size) < 2:
-        result.append("No data returned.  Is the reader turned on?")
-        tiser.close()
-        return result
-
-# second pass
-#    print ("Reply length is " + line_size[1] + " bytes.")
-    line_data = tiser.read(line_size[1] - 2)  # get the rest of the reply
-    print ("I read " + str(len(line_data)) + " bytes.")
-
-#
-# The returned data is in the form of string objects.  Use that data to form
-# a single response list of integers.  Integers are exactly what the RFID reader
-# is sending back.  Doing this makes it easier to process the returned data.
-#
-
-    rddat_len = line_size[1] # this is the length of the entire response
-    rddat = []
-    idx = 0
-
-    rddat.append(line_size[0]) # response SOF
-    rddat.append(line_size[1]) # response size
-# In the next line the -2 accounts for the SOF and size bytes done above.
-    while idx < (rddat_len - 2): # do the rest of the response
-        rddat.append(line_data[idx])
-        idx += 1
-
-#
-# Compute the checksum.  To compute the checksum of the returned data you
-# just take the XOR of all the data bytes that were returned and compare with
-# the checksum bytes that were returned.
-#
-# The 'while' statment ranges from 0 to the length of the returned data - 2.
-# The minus 2 is to adjust for the index (we number from 0) and also so that
-# we do not include the returned last checksum bytes in our own calculation.
-# We compute the checksum on the returned data bytes, but not including the
-# returned checksum bytes.
-#
-
-    chksum = 0
-    idx = 0
-    while idx < (rddat_len - 2):
-        chksum ^= rddat[idx]
-        idx += 1
-
-#
-# Compare the checksums and if they don't match then bail out.
-# If they do match then all is well and all that remains is to
-# dig out and print the tag data.
-#
-
-    if chksum != (rddat[rddat_len - 2]):  # and compare them
-        result.append("Checksum error!")
-#    print (chksum)
-#    print (rddat[rddat_len - 2])
-        tiser.close()
-        return result
-    print(rddat)
-    return rddat   #  return the reader data as a list
+import math
+import time
+import s6350_session
+import s6350_tags
 
 #
 # The chkErrorISO function will take a packet returned by the
@@ -121,7 +36,7 @@ def getReturnPacket(tiser):
 # for a tag UID that does not belong to any tag in the field.
 #
 # Note that functional errors and communication errors are
-# checked for in the getReturnPacket routine.
+# checked for in the session transact routine.
 #
 # The routine will return a list that contains the ISO error
 # code as an integer and the meaning of the error as a string.
@@ -144,131 +59,171 @@ def chkErrorISO(rddat):
     return [error_code, error_meaning]  # return code and meaning as a list
 
 
-####################################
 #
-# The real application code starts here.
+# The InventoryState class holds where a multi-tag inventory is at.
+#
+# An inventory is a walk down a collision tree.  The root is an inventory
+# with no mask, where every tag in the field answers in one of 16 time
+# slots picked by the 4 least significant bits of its UID.  When more
+# than one tag answers in the same slot there is a collision, and the
+# slot number is added to the mask to form a child node.  An inventory
+# with that mask only gets answers from tags whose UID starts (LSB first)
+# with the mask bits, and they answer in slots picked by the next 4 bits.
+#
+# The 'pending' list holds the masks of the nodes still to be done, each
+# as a list of [mask length in bits, mask value, estimate].  The mask
+# value is an integer with the first mask bit as bit 0, so adding a time
+# slot to the mask is just an OR of the slot number shifted up by the
+# mask length.  The estimate is how many tags we expect to answer to the
+# mask (see inventoryRound).  Normally the last mask in the list is the
+# next one done, so the tree is walked depth first just like the old mask
+# stack.  When an inventory has a time budget the mask with the highest
+# estimate is done next instead, so each round finds as many tags as it
+# can before time runs out.
+#
+# The 'tags' TagSet holds the UID and DSFID of every tag found so far,
+# in the order they were found.  UIDs are integers (see s6350_tags).
+#
+# 'identified' and 'collisions' count the time slots so far that had one
+# tag answer and the ones that had a collision.
+#
+# If 'afi' is set only tags with that Application Family Identifier take
+# part in the inventory (see formInventoryCommand).  It is part of the
+# state so an inventory that is carried on keeps asking the same tags.
+#
+# A mask is only taken off the pending list once its reply has been
+# handled, so if the reader stops answering part way through nothing is
+# lost.  Calling ti_iso_inventory again with the same state carries on
+# where it stopped.  The checkpoint method turns the state into plain
+# lists and numbers that can be saved (with json for example), and
+# fromCheckpoint turns that back into an InventoryState.
 #
-####################################
 
-def ti_iso_inventory(port_to_use):
+class InventoryState:
 
-    result = []
+    def __init__(self, afi=None):
 
+        self.afi = afi
+        self.pending = [[0, 0, 0.0]]  # start at the root, no mask
+        self.tags = s6350_tags.TagSet()
+        self.rounds = 0  # inventory commands done
+        self.identified = 0  # time slots with a tag identified
+        self.collisions = 0  # time slots with a collision
 
-#
-# The TI reader defaults to 57600 baud, 8 bit data, 1 stop bit and no parity.
-# There is no handshaking.
-#
-# Note that the timeout here is set to 5 seconds.  That is more than enough
-# time to allow the TI RFID reader to turn on its radio, command a tag, and get
-# data back from it.  We assume that if we time out and we don't have any data
-# then the RFID reader is not on line.
-#
+    def done(self):
 
+        return len(self.pending) == 0
 
-    try:
-        tiser = serial.Serial(port_to_use, baudrate=57600, bytesize=8,
-                              parity='N', stopbits=1, timeout=0.5,
-                              xonxoff=0, rtscts=0, dsrdtr=0)
-    except:
-        result.append("Can't open " + port_to_use + ".")
-        result.append("Under linux or Apple OS you need the full path, ie /dev/ttyUSB0.")
-        result.append("Under windows use the communication port name, ie COM8.")
-        return result
+    def nextIndex(self, best_first=False):
 
-# Construct a simple python list to use as a stack to store inventory
-# masks in the event of a collision.  Python is great for this.  In
-# this application all mask values are handled as collections of bytes.
+        if not best_first:
+            return len(self.pending) - 1
 
-    maskStack = []
+        best = 0
+        idx = 1
+        while idx < len(self.pending):
+            mask = self.pending[idx]
+            if (mask[2], -mask[0]) > (self.pending[best][2], -self.pending[best][0]):
+                best = idx
+            idx += 1
+        return best
 
-#
-# To use the write() method in python it needs to be in the form of a
-# string or a buffer, which is just a pointer into memory.  This code
-# forms an array of bytes from a list that contains the command to send
-# and then uses a buffer (memoryview) to write it out.
-#
-# Note that the S6350 reader uses a wrapper that encapsulates all
-# ISO commands.  Every ISO commands needs to have this wrapper with
-# the S6350 reader.  For some commands the entire length is not
-# known ahead of time, so some pieces are filled in later and the
-# checksum bytes generated last and filled in.  This command is a
-# good example of a command where the length can change, in this
-# case as the mask grows in length.
-#
-# In this wrapper, the bytes are as follows:
-#
-# 0: SOF
-# 1 & 2: length LSB and MSB respectively, filled in later
-# 3 & 4: TI reader address fields, alsways set to 0
-# 5: TI reader command flags
-# 6: TI reader ISO pass thru command, always 0x60
-#
+    def addTag(self, uid, dsfid):
+
+        return self.tags.add(uid, dsfid)
+
+    def checkpoint(self):
+
+        return {"afi": self.afi,
+                "pending": [list(mask) for mask in self.pending],
+                "tags": [[uid, dsfid] for uid, dsfid in self.tags.items()],
+                "rounds": self.rounds}
+
+    @classmethod
+    def fromCheckpoint(cls, saved):
+
+        state = cls(saved.get("afi"))
+        state.pending = [list(mask) for mask in saved["pending"]]
+        for mask in state.pending:
+            if len(mask) < 3:  # saved before masks had estimates
+                mask.append(2.0)
+        for uid, dsfid in saved["tags"]:
+            if isinstance(uid, str):  # saved when UIDs were hex strings
+                uid = s6350_tags.uidFromHex(uid)
+            state.addTag(uid, dsfid)
+        state.rounds = saved["rounds"]
+        return state
 
-    read_transponder_details = [0x01, 0, 0, 0, 0, 0, 0x60]  # the ISO wrapper
 
 #
-# Extend the list with the actual ISO command without the SOF, CRC16 and EOF
-# On the first inventory pass, the mask length is zero.  It will grow as
-# collisions are encountered, but for now form the ISO inventory command
-# asking for 16 time slots, and no mask.
-#
-# The bytes that extend the list are as follows:
+# The formInventoryCommand function builds an ISO inventory command with
+# 16 time slots for a mask.  After the ISO wrapper the bytes are:
 #
-# 7: ISO reader config byte 0.The value in this case is 0x11
+# 7: ISO reader config byte 0.  The value in this case is 0x11
 # 8: Tag flags.  In this case indicating 16 time slots (0x07)
 # 9: The ISO command.  In this case 0x01
-# 10: The mask length in BITS for doing the inventory.  In this case it is 0
+# 10: The mask length in BITS
+# 11 on: The mask, LSB first, in as many bytes as needed for the bits
+#
+# If an AFI is given the AFI flag (0x10) is set in the tag flags and the
+# AFI byte goes in front of the mask length.  Only tags with a matching
+# Application Family Identifier answer, so when the field holds tags of
+# different families the ones we don't want don't take up time slots.
+# This works the same with a mask, so it combines with the collision
+# handling as usual.
 #
 
-    read_transponder_details.extend([0x11, 0x07, 0x01, 0])
+def formInventoryCommand(mask_len, mask, afi=None):
 
-#
-# Extend the list 1 more time with places for the checksum bytes.
-# Those will be computed and added later to the resulting byte array
-# that is formed to send to the reader.
-#
+    num_mask_bytes = (mask_len + 7) // 8
 
-    read_transponder_details.extend([0, 0])  # the two checksum bytes
+    if afi is None:
+        inventory = [0x11, 0x07, 0x01, mask_len]
+    else:
+        inventory = [0x11, 0x17, 0x01, afi, mask_len]
 
-#
-# Now that the list containing the initial command template is done, it
-# is possible to compute the length of the command and create the byte
-# array.
-#
+    inventory.extend(mask.to_bytes(num_mask_bytes, "little"))
 
-    command_len = len(read_transponder_details)
-    command = bytearray(command_len)
-    idx = 0
+    return s6350_session.formCommand(0x60, inventory)
 
-    for i in read_transponder_details:
-        command[idx] = i
-        idx += 1
 
-# Fill in the length
+#
+# The inventoryRound function does the inventory command for the next
+# pending mask in the state and handles the reply.  Tags that identified
+# themselves are added to the state, and a new pending mask is added for
+# every time slot that had a collision.  It returns a list of strings
+# describing an error, or an empty list if all went well.  On an error
+# the mask stays pending so the round can be done again later.
+#
+# If best_first is set the pending mask with the most tags expected is
+# done, otherwise the last one.
+#
 
-    command[1] = command_len
+def inventoryRound(session, state, best_first=False):
 
-# Compute and fill in the two checksum bytes
+    result = []
 
-    chksum = 0
-    idx = 0
-    while idx < (command_len - 2):
-        chksum ^= command[idx]
-        idx += 1
+    pending_idx = state.nextIndex(best_first)
+    mask_len, mask, estimate = state.pending[pending_idx]
 
-    command[command_len - 2] = chksum  # 1st byte is the checksum
-    command[command_len - 1] = chksum ^ 0xff  # 2nd byte is ones comp of the checksum
+#
+# At this point, we should check to see that the mask is not 64 bits
+# in length. Such a condition can only occur if there are two identical
+# tags in the field, or some other very strange fault.  Trying again will
+# not help, so the mask is dropped.
+#
 
-# Send out the command to the reader and get the reply
+    if mask_len >= 64:
+        del state.pending[pending_idx]
+        result.append("Identical (cloned) tags or operational fault!")
+        return result
 
-    tiser.write(memoryview(command))  # memoryview is the same as buffer
-    response = getReturnPacket(tiser)  # read the response from the reader
+    command = formInventoryCommand(mask_len, mask, state.afi)
+    response = session.transact(command)  # send the command and read the response
 
-    if(len(response) < 2):
-        tiser.close()
+    if len(response) < 2:  # no reply or a bad one
         return response
-    
+
 #
 # Check if any ISO errors have occurred.
 #
@@ -278,288 +233,235 @@ def ti_iso_inventory(port_to_use):
         result.append("Error code is: " + hex(iso_errors[0]))  # for grins, print the error code
         result.append(iso_errors[1])  # and the meaning
         result.append("")
+        return result
 
-
-# Now enter into a processing loop where we look for tags to identify
-# themselves.  There are three subloops that take place here.
-#
-# The first loop is to process valid data timeslot flags.  If there
-# is a tag in a time slot and no collision, then the tag ID and
-# the Data Storage Format Identifier (DSFI) will be shown.
-#
-# The second loop is to process the collision timeslot flags.
-# If there is a collision, then the time slot number is combined with
-# the mask to create a new mask, and it is pushed onto the mask stack.
-#
-# The third loop is to process any masks that have been pushed onto
-# the mask stack.  If the mask stack is not empty, the stack is
-# popped and the data is used to form a new inventory commend.  The
-# command is sent to the reader and these three loops are run again.
-# The inventory is complete when we reach the end of this loop and
-# the stack is empty.
-#
-
-    tagCount = 0
-    moreToDo = True
-
-
-    while moreToDo and (iso_errors[0] == 0): # while there is data to do and no errors
+    del state.pending[pending_idx]
+    state.rounds += 1
 
 #
 # Check the Valid Data Flags first.  If no flags are set, then it means that no
 # RFID tag was seen in the field.  Set flags mean that tags successfully
 # identified themselves, and the data can be dug out of the returned data field.
-# Tag data is an 80 bit (10 byte) field.
+# Tag data is an 80 bit (10 byte) field, one for each set flag in order of the
+# time slots.  In each one byte 1 is the DSFID and bytes 2 to 9 are the UID,
+# LSB first.
 #
 # There is never supposed to be a Valid Data Flag and a Collision Flag set for
 # the same time slot, so Collisions can be handled after we deal with the
 # Valid Data Flags.
 #
 
-        if response[7] != 0 or response[8] != 0:  # we have data
-
-            numTags = 0 # number of tags found on this loop
-            z = 0
-
-            while z < 8:  # compute how much data there is
-                if (response[7] & (0x01 << z)) != 0:
-                    numTags += 1
-                if (response[8] & (0x01 << z)) != 0:
-                    numTags += 1
-                z += 1
-
-            z = 0
-            while z < numTags:  # dig out tag data
-                tagCount += 1
-                result.append("Transponder " + str(tagCount))
-                idx = z * 10  # each collection of tag data takes 10 bytes
-                result.append("ID: " + "0x%0.2x" % response[idx + 20]
-                      + "%0.2x" % response[idx + 19]
-                      + "%0.2x" % response[idx + 18]
-                      + "%0.2x" % response[idx + 17]
-                      + "%0.2x" % response[idx + 16]
-                      + "%0.2x" % response[idx + 15]
-                      + "%0.2x" % response[idx + 14]
-                      + "%0.2x" % response[idx + 13])
-
-                result.append("DSFID: " +  "0x%0.2x" % response[idx + 12])
-                result.append("")
-                z += 1
-
-
-#
-# Next process the collisions.  When a collision is found, combine the
-# time slot where the collision took place with the inventory mask to
-# form a new mask.  Push the mask byte by byte onto the stack with a
-# bit count at the end.  Data from the stack will be used every time
-# the loop iterates.
-#
-
-        if response[9] != 0 or response[10] != 0:  # we have collisions
+    valid_flags = response[7] | (response[8] << 8)
+    collision_flags = response[9] | (response[10] << 8)
 
+    idx = 11  # index of the first tag data field
+    slot = 0
+    while slot < 16:
+        if valid_flags & (0x01 << slot):
+            uid = s6350_tags.uidFromBytes(response[idx + 2:idx + 10])
+            state.addTag(uid, response[idx + 1])
+            idx += 10
+        slot += 1
 
 #
-# Do the collision flags.  Here's how it works:
-#
-# If a flag is set:
-#
-# 1. Compute the number of BYTES in the existing mask.
-#
-# 2. Push all bytes except the MSByte onto the stack.
-#
-# 3. If the MSByte is NOT a padded nibble, push it onto the stack too.
-#
-# 4. If the MSByte is a padded nibble, put the time slot value
-# into the 4 MSbits and push it onto the stack.
+# Next process the collisions.  When a collision is found, the time slot
+# where it took place is put in the 4 bits above the existing mask to form
+# a new mask 4 bits longer, which goes on the pending list.
 #
-# 5. If the MSByte was not a padded nibble, then use the time slot
-# value to form a new paddded nibble & push it onto the stack.
+# Each new mask also gets an estimate of how many tags are behind it.  If
+# tags pick their time slot at random, the number in a slot follows a
+# Poisson distribution, and the fraction of empty slots tells us the mean
+# number per slot (the load).  A collision slot has at least 2 tags, and
+# the expected number given that is
 #
-# 6. Push one more byte onto the stack containing the number of
-# BITS in the mask.  This will be used to form the next inventory
-# command, and indicate how many times the stack needs to be popped
-# to get off the entire new mask.
+#   (load - load * e^-load) / (1 - e^-load - load * e^-load)
 #
-# Note that the number of bits in the mask will increase in units
-# of 4 bits.  That's the length of the time slot counter.
-#
-# Both the least significant and most significant collision
-# flags can be processed at the same time.  Just add 8 to the
-# time slot value for the most significant flags.
+# If no slot was empty the load can't be worked out that way, so it is
+# taken from the parent's estimate, but at least 3 (the load that leaves
+# less than 1 of 16 slots empty).
 #
 
-            numMaskBytes = 0
-            z = 0
-            while z < 8:
+    num_valid = bin(valid_flags).count("1")
+    num_collisions = bin(collision_flags).count("1")
+    num_empty = 16 - num_valid - num_collisions
 
-# Do the Least Significant collision bits
+    state.identified += num_valid
+    state.collisions += num_collisions
 
-                if (response[9] & (0x01 << z)) != 0:
-                    numMaskBytes = command[10] / 8  # compute BYTES
-                    idx = 0
-                    while idx < numMaskBytes:  # push existing mask bytes onto the stack
-                        maskStack.extend([command[11 + idx]])
-                        idx += 1
+    if num_empty > 0:
+        load = math.log(16.0 / num_empty)
+    else:
+        load = max(estimate / 16.0, 3.0)
 
-        
-# Adjust MSB with the time slot value
+    if load > 1e-6:
+        e = math.exp(-load)
+        child_estimate = (load - load * e) / (1.0 - e - load * e)
+    else:
+        child_estimate = 2.0
 
-                    if (command[10] % 8) != 0:  # if a MS nibble exists
-                        timeSlot = z << 4 # compute and position time slot value
-                        timeSlot |= command[11 + idx]
-                        maskStack.extend([timeSlot])  # push MS bits onto the stack
+    slot = 15
+    while slot >= 0:  # backwards, so slot 0 is done first
+        if collision_flags & (0x01 << slot):
+            state.pending.append([mask_len + 4, mask | (slot << mask_len), child_estimate])
+        slot -= 1
 
-                    else:  # no existing MS nibble
-                        timeSlot = z  # get time slot value
-                        maskStack.extend([timeSlot])  # push MS bits onto the stack
+    return result
 
-                    maskStack.extend([command[10] + 4])  # push number of bits onto stack
 
 #
-# Now do the Most Significant collision bits.  It's the same as the Least
-# Significant bits but just add 8 to the timeSlot values.
+# The runInventory function does inventory rounds until there are no
+# masks left, something goes wrong, or the deadline passes.  The deadline
+# is a time.monotonic() value, or None for no deadline.  The first round
+# is always done, so there is always an answer.  After that a round is
+# not started if the reader is not expected to answer it before the
+# deadline.  With a deadline the masks are done best first.  It returns the error
+# strings from the round that went wrong, if any.
 #
 
-                if (response[10] & (0x01 << z)) != 0:
-                    numMaskBytes = command[10] / 8  # compute BYTES
-                    idx = 0
-                    while idx < numMaskBytes:  # push existing mask bytes onto the stack
-                        maskStack.extend([command[11 + idx]])
-                        idx += 1
+def runInventory(session, state, deadline=None):
 
-# Adjust MSB with the time slot value
+    best_first = deadline is not None
+    key = s6350_session.commandKey(formInventoryCommand(0, 0, state.afi))
+    first = True
 
-                    if (command[10] % 8) != 0:  # if a MS nibble exists
-                        timeSlot = (z + 8) << 4 # compute and position time slot value
-                        timeSlot |= command[11 + idx]
-                        maskStack.extend([timeSlot])  # push MS bits onto the stack
+    while not state.done():
+        if deadline is not None and not first:
+            round_time = session.timer.expectedTime(key, 13)
+            if time.monotonic() + round_time > deadline:
+                break
 
-                    else:  # no existing MS nibble
-                        timeSlot = z + 8  # get time slot value
-                        maskStack.extend([timeSlot])  # push MS bits onto the stack
+        errors = inventoryRound(session, state, best_first)
+        if len(errors) > 0:
+            return errors
+        first = False
 
-                    maskStack.extend([command[10] + 4])  # push number of bits onto stack
+    return []
 
-                z += 1  # increment to next time slot bit
 
 #
-# Last is to process the mask stack.
-# If the stack is not empty, then set up and start the next
-# inventory iteration.  If the stack is empty, or if an error
-# has occurred, then we are done.  See comments above for what
-# is in the ISO command wrapper.
+# The measureInventory function does one full inventory on a session and
+# also works out how well it went, for the live charts in the GUIs.  It
+# returns the InventoryState, the error strings if any, and a dictionary
+# with:
+#
+# tags_per_second: tags found divided by the time the inventory took
+# rounds: inventory commands it took
+# collision_ratio: the fraction of the answering time slots that had a
+#                  collision
+# latency_ms: the average time per inventory command in milliseconds
 #
 
-        if len(maskStack) != 0:  # if the mask stack is not empty
-
-            moreToDo = True
-            read_transponder_details = [0x01, 0, 0, 0, 0, 0, 0x60]  # the ISO wrapper
+def measureInventory(session, afi=None):
 
-#
-# 7: ISO reader config byte 0.The value in this case is 0x11
-# 8: Tag flags.  In this case indicating 16 time slots (0x07)
-# 9: The ISO command.  In this case 0x01
-# 10: The mask length in BITS for doing the inventory
-#
+    state = InventoryState(afi)
 
-            numMaskBits = maskStack.pop()  # Mask length in bits
-            read_transponder_details.extend([0x11, 0x07, 0x01, numMaskBits])
+    start = time.monotonic()
+    errors = runInventory(session, state)
+    elapsed = max(time.monotonic() - start, 1e-6)
 
-#
-# At this point, we should check to see that the mask is not 64 bits
-# in length. Such a condition can only occur if there are two identical
-# tags in the field, or some other very strange fault.
-#
+    stats = {"tags_per_second": len(state.tags) / elapsed,
+             "rounds": state.rounds,
+             "collision_ratio": 0.0,
+             "latency_ms": 0.0}
 
-            if numMaskBits == 64:
-                result.append("Identical (cloned) tags or operational fault!")
-                tiser.close()
-                return result # bail out
+    answered = state.identified + state.collisions
+    if answered > 0:
+        stats["collision_ratio"] = state.collisions / answered
+    if state.rounds > 0:
+        stats["latency_ms"] = 1000.0 * elapsed / state.rounds
 
-# Continue
+    return state, errors, stats
 
-            numMaskBytes = numMaskBits / 8  # compute number of mask bytes to pop
-            if (numMaskBits % 8) != 0:  # adjust if a MS nibble exists
-                numMaskBytes += 1
 
+####################################
 #
-# Next form the mask. It goes into the command LSBs first,
-# but the MSBs are popped off the stack first.  As we know
-# how many bytes there should be, we just adjust how they
-# are put into the command to account for this.  Fortunately
-# python's pop method makes this very easy by using a negative
-# index.
+# The real application code starts here.
 #
-
-            idx = numMaskBytes * -1  # form a negative index
-            while idx < 0:
-                read_transponder_details.extend([maskStack.pop(idx)]) # mask, LSBs first
-                idx += 1
+####################################
 
 #
-# Now account for the checksums
+# The ti_iso_inventory function does the full inventory.  If 'state' is
+# given it carries on with that InventoryState, for example one that was
+# stopped by an error or loaded from a checkpoint.  Otherwise a fresh
+# inventory is started.  Either way the state is updated as the inventory
+# goes, so a caller that passed one in can look at it afterwards.  Only
+# tags found by this call are listed, but they are numbered and counted
+# across the whole inventory.
 #
-
-            read_transponder_details.extend([0, 0])  # the two checksum bytes
-
+# If 'budget_ms' is given the inventory stops after that many milliseconds
+# even if it is not done.  The tags found so far are listed, and the masks
+# not yet done stay in the state, ready to be carried on with.
 #
-# Now that the list containing the initial command template is done, it
-# is possible to compute the length of the command and create the byte
-# array.
+# If 'afi' is given only tags with that Application Family Identifier are
+# inventoried.  It is only used for a fresh inventory, one that is carried
+# on keeps the AFI it was started with.
 #
 
-            command_len = len(read_transponder_details)
-            command = bytearray(command_len)
-            idx = 0
+def ti_iso_inventory(port_to_use, state=None, budget_ms=None, afi=None):
 
-            for i in read_transponder_details:
-                command[idx] = i
-                idx += 1
+    result = []
+
+    if state is None:
+        state = InventoryState(afi)
 
-# Fill in the length
+    deadline = None
+    if budget_ms is not None:
+        deadline = time.monotonic() + budget_ms / 1000.0
 
-            command[1] = command_len
+#
+# Open a session to the reader, or use the one we were given.  The TI
+# reader defaults to 57600 baud, 8 bit data, 1 stop bit and no parity.
+# There is no handshaking.
+#
+# The session does not use a fixed timeout.  It works out how long to
+# wait for each reply from the length of the reply and how long the
+# reader took to answer this kind of command before.  We assume that if
+# we time out and we don't have any data then the RFID reader is not on
+# line.
+#
 
-# Compute and fill in the two checksum bytes
+    session = s6350_session.openSession(port_to_use)
+    if isinstance(session, list):  # the port could not be opened
+        return session
 
-            chksum = 0
-            idx = 0
-            while idx < (command_len - 2):
-                chksum ^= command[idx]
-                idx += 1
+# Keep doing rounds until there are no masks left, something goes wrong,
+# or the time budget runs out.
 
-            command[command_len - 2] = chksum  # 1st byte is the checksum
-            command[command_len - 1] = chksum ^ 0xff  # 2nd byte is ones comp of the checksum
+    first_new = len(state.tags)
 
-# Send out the command to the reader and read the response
+    errors = runInventory(session, state, deadline)
+    result.extend(errors)
 
-            tiser.write(memoryview(command))  # memoryview is the same as buffer
-            response = getReturnPacket(tiser)  # read the response from the reader
+    tagCount = first_new
+    for uid, dsfid in list(state.tags.items())[first_new:]:
+        tagCount += 1
+        result.append("Transponder " + str(tagCount))
+        result.append("ID: " + s6350_tags.uidToHex(uid))
+        result.append("DSFID: " + "0x%0.2x" % dsfid)
+        result.append("")
 
 #
-# Check if any ISO errors have occurred.
+# If the budget ran out the masks not done yet are still in the state, so
+# the inventory can be carried on by passing the state in again.  Say so,
+# so the tags found are not taken for all of them.
 #
-            if(len(response) == 0):
-                tiser.close()
-                return response
-
-            iso_errors = chkErrorISO(response)
-            if iso_errors[0] != 0:
-                result.append("Error code is: " + hex(iso_errors[0]))  # for grins, print the error code
-                result.append(iso_errors[1])  # and the meaning
-                result.append("")
-
-        else:  # else if the mask stack is empty
-            moreToDo = False
 
+    if not state.done():
+        if len(errors) == 0:
+            result.append("Time budget ran out, inventory cut short.")
+        result.append("Inventory stopped with " + str(len(state.pending))
+                      + " masks still to do.")
 
     if tagCount == 0:
         result.append("No RFID tags found.")
 
+    elif not state.done():
+        result.append("Tags found so far: " + str(tagCount))
+
     else:
         result.append("Total tags found: " + str(tagCount))
 
-    tiser.close()
+    session.release()
     return result
 
 #
@@ -573,10 +475,15 @@ if __name__ == '__main__':
 #
 
     if len(sys.argv) < 2 :
-        print ("Usage: " + sys.argv[0] + " serial_port_to_use")
+        print ("Usage: " + sys.argv[0] + " serial_port_to_use [AFI]")
+        print ("Where AFI is an optional Application Family Identifier in hex.")
         sys.exit()
 
-    all_results = ti_iso_inventory(sys.argv[1])
+    afi = None
+    if len(sys.argv) > 2:
+        afi = int(sys.argv[2], base=16) & 0xff
+
+    all_results = ti_iso_inventory(sys.argv[1], afi=afi)
     for line in all_results:
         print(line)
 
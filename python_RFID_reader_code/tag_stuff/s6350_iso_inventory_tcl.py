@@ -10,6 +10,11 @@
 # Transponder ID
 # The Data Storage Format Identifier (DSFID)
 #
+# With 'Continuous' ticked it does one inventory after another on a
+# background thread, and the chart under the tag table shows the tags
+# found per second, the rounds per inventory, the collision ratio and
+# the command latency as they go.
+#
 # See TI 6350 user manual and the ISO 15693-3 document for more information.
 #
 # This is the tkinter version providing a GUI.
@@ -18,23 +23,100 @@
 
 import io
 import sys
+import threading
 import serial
 import list_ports
 import s6350_iso_inventory
 from s6350_iso_inventory import *
+import s6350_session
+import s6350_tag_view
+import s6350_rate_chart
 import tkinter
 from tkinter import *
 
+#
+# The found tags go into the table, one row per tag, and the total or
+# any error goes into the message line under it.
+#
+
 def do_it():
 
-    all_results = ti_iso_inventory(topbox.e1.get())
-    for line in all_results:
-        write_text(line)
+    if running.is_set():
+        write_text("Untick 'Continuous' first.")
+        return
+
+    session = s6350_session.openSession(topbox.e1.get())
+    if isinstance(session, list):  # the port could not be opened
+        write_text(" ".join(session))
+        return
+
+    one_inventory(session)
+    session.release()
+
+
+def one_inventory(session):
+
+    state, errors, stats = measureInventory(session)
+
+    win.v1.addTags(state.tags)
+    win.c1.addSample(stats)
+    if len(errors) > 0:
+        write_text(" ".join(errors))
+    else:
+        write_text("Total tags found: " + str(len(state.tags)))
+
+#
+# The continuous inventories run on a thread of their own with one
+# session, until 'Continuous' is unticked.  The table and the chart can
+# be handed results from any thread and redraw themselves at a fixed rate.
+#
+# Each run has its own Event, so a run that was stopped can't be started
+# again by ticking 'Continuous' before it has seen it was stopped.  A new
+# run waits for the one before it to finish and let go of the port.
+#
+
+running = threading.Event()  # set while the latest run should go on
+runner = None  # the thread of the latest run
+
+
+def run_continuous(port_to_use, run, before):
+
+    if before is not None:
+        before.join()  # the last run may still be in an inventory
+
+    if not run.is_set():
+        return  # unticked again while waiting
+
+    session = s6350_session.openSession(port_to_use)
+    if isinstance(session, list):  # the port could not be opened
+        write_text(" ".join(session))
+        run.clear()
+        return
+
+    while run.is_set():
+        one_inventory(session)
+
+    session.release()
+
+
+def toggle_continuous():
+
+    global running, runner
+
+    if topbox.v1.get():
+        running.clear()
+        running = threading.Event()
+        running.set()
+        runner = threading.Thread(target=run_continuous,
+                                  args=(topbox.e1.get(), running, runner), daemon=True)
+        runner.start()
+    else:
+        running.clear()
 
 
 def write_text(text_to_write):
 
-    win.t1.insert(END, text_to_write + '\n')
+    win.v1.setMessage(text_to_write)
 
 #
 # The next routine scans and find the first listed connected serial port.
@@ -50,8 +132,8 @@ def scan_ports():
     if( len(active_ports) > 0 ):
         topbox.e1.insert(0, active_ports[0])
     else:
-        win.t1.insert(END, "No connected serial ports found."+"\n")
-        win.t1.insert(END, "Connect RFID reader and click 'Rescan Ports'."+"\n")
+        write_text("No connected serial ports found.  "
+                   "Connect RFID reader and click 'Rescan Ports'.")
 
 
 #
@@ -70,12 +152,16 @@ topbox = Label(win, relief=RAISED, bd=2)
 topbox.pack(side=TOP, fill='x')
 
 #
-# The main text box and the scroll bar that goes with it.
+# The table of tags found, with its own scroll bar.
+
+win.v1 = s6350_tag_view.TagView(win, relief=RAISED, bd=2)
+win.v1.pack(side=TOP, fill='both', expand=True)
+
+#
+# The live chart.
 
-win.t1 = Text(win, relief=RAISED, bd= 2)
-win.sb1 = Scrollbar(win, background='#ffffff')
-win.sb1.pack(side=RIGHT, fill='y')
-win.t1.pack (side=TOP)
+win.c1 = s6350_rate_chart.RateChart(win, relief=RAISED, bd=2)
+win.c1.pack(side=TOP, fill='x')
 
 #
 # Widgets that go into the topbox container
@@ -84,11 +170,14 @@ topbox.l1 = Label(topbox, text='Serial Port: ')
 topbox.e1 = Entry(topbox, width=25, relief=SUNKEN, bd=2,)
 topbox.b1 = Button(topbox, relief = RAISED, text='Rescan Ports')
 topbox.b2 = Button(topbox, relief = RAISED, text='Tag Inventory')
+topbox.v1 = BooleanVar(value=False)
+topbox.c1 = Checkbutton(topbox, text='Continuous', variable=topbox.v1)
 
 topbox.l1.pack(side=LEFT)
 topbox.e1.pack(side=LEFT)
 topbox.b1.pack(side=LEFT)
 topbox.b2.pack(side=LEFT, expand=True)
+topbox.c1.pack(side=LEFT)
 
 #
 # Show the first found active serial port in the label.
@@ -107,10 +196,9 @@ scan_ports()
 # The commented command for the button b2 is a good example of
 # how to provide callback references that include arguments.
 #
-win.t1['yscrollcommand'] = win.sb1.set
-win.sb1['command'] = win.t1.yview
 topbox.b1['command'] = scan_ports
 topbox.b2['command'] = do_it
+topbox.c1['command'] = toggle_continuous
 #topbox.b2['command'] = lambda: ti_iso_inventory(e1.get())
 
 win.mainloop()
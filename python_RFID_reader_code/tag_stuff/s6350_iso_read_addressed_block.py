@@ -22,191 +22,35 @@
 
 import io
 import sys
-import serial
+import s6350_session
+import s6350_tags
+from s6350_iso_helpers import chkErrorISO, do_Hex_Input
 
-#
-# The getReturnPacket function reads a reply packet from the S6350 reader.
-# It does some checking of the data and if the packet is intact and the
-# checksum is right it will return the packet to the calling program as a
-# list of integers.
-#
-# The get return packet also checks for functional and communication errors.
-# A functional error occurs if the RFID reader doesn't work.  This is
-# indicated if no data is read from the RFID reader and the serial connection
-# times out.  Communication errors are those where the reader works, but the
-# returned data is corrupt as indicated by the checksum bytes.  Both of these
-# errors are fatal, so if they occur a message will be printed and the program
-# will exit.
-#
-# There could also be ISO command errors.  Those are not necessarily fatal
-# and are handled in the chkErrorISO routine.
-#
-
-def getReturnPacket(tiser):
-
-    result = []
-
-#
-# We read the returned data from the reader in 2 passes.  First we read
-# the first two bytes.  The second byte is the length of the entire returned
-# packet.  From that we determine how many more bytes to read which are then
-# read in the second pass.
-#
-#
-# We read the returned data from the reader in 2 passes.  First we read
-# the first two bytes.  The second byte is the length of the entire returned
-# packet.  From that we determine how many more bytes to read which are then
-# read in the second pass.
-#
-
-    rddat = []
-    line_size = tiser.read(2)  # first pass, read first two bytes of reply
-
-    if len(line_size) < 2:
-        result.append("No data returned.  Is the reader turned on?")
-        tiser.close()
-        return result
-
-# second pass
-#    print("Reply length is " + str(ord(line_size[1])) + " bytes.")
-    line_data = tiser.read(line_size[1] - 2)  # get the rest of the reply
-#    print("I read " + str(len(line_data)) + " bytes.")
-
-#
-# The returned data is in the form of string objects.  Use that data to form
-# a single response list of integers.  Integers are exactly what the RFID
-# reader is sending back.  Doing this makes it easier to process the returned
-# data.
-#
-
-    rddat_len = line_size[1] # this is the length of the entire response
-    idx = 0
 
-    rddat.append(line_size[0]) # response SOF
-    rddat.append(line_size[1]) # response size
-# In the next line the -2 accounts for the SOF and size bytes done above.
-    while idx < (rddat_len - 2): # do the rest of the response
-        rddat.append(line_data[idx])
-        idx += 1
-
-#
-# Compute the checksum.  To compute the checksum of the returned data you
-# just take the XOR of all the data bytes that were returned and compare with
-# the checksum bytes that were returned.  The 'while' statment ranges from 0
-# to the length of the returned data - 2.  The minus 2 is to adjust for the
-# index (we number from 0) and also so that we do not include the returned
-# last checksum bytes in our own calculation.  We compute the checksum on the
-# returned data bytes, but not including the returned checksum bytes.
-#
-
-    chksum = 0
-    idx = 0
-    while idx < (rddat_len - 2):
-        chksum ^= rddat[idx]
-        idx += 1
-
-#
-# Compare the checksums and if they don't match then bail out.
-# If they do match then all is well and all that remains is to
-# dig out and print the tag data.
-#
-
-    if chksum != (rddat[rddat_len - 2]):  # and compare them
-        result.append("Checksum error!")
-#    print(chksum)
-#    print(rddat[rddat_len - 2])
-        tiser.close()
-        return result
-
-    return rddat   #  return the reader data as a list
-
-
-#
-# The chkErrorISO function will take a packet returned by the
-# reader as a list of bytes and check it for any operational
-# errors.  Operational errors are ones where the reader is
-# functional and communication is functional but something
-# went wrong with the requested operation, for example asking
-# for a tag UID that does not belong to any tag in the field.
 #
-# Note that functional errors and communication errors are
-# checked for in the getReturnPacket routine.
+# The formReadBlockCommand function builds a read single block command
+# for a tag UID (an integer) and a block number.
 #
-# The routine will return a list that contains the ISO error
-# code as an integer and the meaning of the error as a string.
-# An error code of 0 means no error (OK or command success).
-# 
-
-def chkErrorISO(rddat): 
-    if (len(rddat)==11) and (rddat[7] == 0x01):  # if there is an error
-        error_code = rddat[8]  # get the code from the reader
-        error_meaning = {
-            "0x3" : "The option is not supported" ,
-            "0x2" : "Command not supported.",
-            "0x0f" : "Error with no information given",
-            "0x10" : "Specified block is not available",
-            "0x11" : "The specified block is already locked and thus cannot be locked again",
-            "0x12" : "The specified block is locked and its content cannot be changed",
-            "0x13" : "The specified block was not successfully programmed",
-            "0x14" : "The specified block was not successfully locked",
-            "0x15" : "The specified block is read−protectedx",
-            }.get(hex(rddat[8]), "Unknown error code.")
-    elif (len(rddat)==10) and (rddat[6] == 0x01):  # if there is an error
-        error_code = rddat[7]  # get the code from the reader
-        error_meaning = {
-            "0x3" : "The option is not supported" ,
-            "0x2" : "Command not supported.",
-            "0x0f" : "Error with no information given",
-            "0x10" : "Specified block is not available",
-            "0x11" : "The specified block is already locked and thus cannot be locked again",
-            "0x12" : "The specified block is locked and its content cannot be changed",
-            "0x13" : "The specified block was not successfully programmed",
-            "0x14" : "The specified block was not successfully locked",
-            "0x15" : "The specified block is read−protectedx",
-            }.get(hex(rddat[7]), "Unknown error code.") + " \n... Error ISO passtrhough byte not found"
-    else:
-        error_code = 0  # else 0 = all OK
-        error_meaning = "OK"
-
-    return [error_code, error_meaning]  # return code and meaning as a list
-
-
+# Note that the S6350 reader uses a wrapper that encapsulates all ISO
+# commands (see formCommand in s6350_session).  After the wrapper the
+# bytes are as follows:
 #
-# The do_Hex_Input routine will take a string argument representing a number
-# in hex and also an argument for a number of bytes.  It will turn the string
-# argument into a little-endian list of bytes, each byte represented by an
-# integer having a length of the requested number of bytes.  If all is well,
-# it will return the list of bytes.  If an error occurs, it will instead
-# return a string with the meaning of the error.  A calling program can
-# determine what is coming back (a list or an error string) by using the
-# builtin isinstance function.  The user input string representing the hex
-# number can optionally have a leading 0x.
+# 7: ISO reader config byte 0.  The value in this case is 0x11
+# 8: Tag flags.  Option flag is set to get security status too, and the
+#    protocol extension flag for a 2 byte block number (0x6b)
+# 9: The ISO command.  In this case 0x20
+# 10 to 17: The UID, LSB first
+# 18 & 19: The block number, LSB first like all ISO 15693 numbers, the
+#          same as for read multiple blocks
 #
 
+def formReadBlockCommand(uid, block):
 
-def do_Hex_Input(user_input, num_bytes):
-
-    formatter = "%0." + str(num_bytes * 2) + "x"
-
-    try:
-        s = formatter % int(user_input, base=16)
-    except ValueError:
-        return_bytes = "User input contains non-hex characters."
-        return return_bytes
-
-    if len(s) > (num_bytes * 2):
-        return_bytes = "User input greater than required length."
-        return return_bytes
-
-    return_bytes = []
-    x = 0
-
-    while (x < num_bytes):
-        return_bytes.append(int(s[-2 - (x * 2)] + s[-1 - (x * 2)], base=16))
-        x = x + 1
-
-    return return_bytes
+    read_addressed_block = [0x11, 0x6b, 0x20]
+    read_addressed_block.extend(s6350_tags.uidToBytes(uid))
+    read_addressed_block.extend([block & 0xff, block >> 8])
 
+    return s6350_session.formCommand(0x60, read_addressed_block)
 
 
 ####################################
@@ -221,106 +65,29 @@ def ti_read_addressed_block(port_to_use, tag_UID, tag_BLK):
     result = []
 
 #
-# The TI reader defaults to 57600 baud, 8 bit data, 1 stop bit and no parity.
+# Open a session to the reader, or use the one we were given.  The TI
+# reader defaults to 57600 baud, 8 bit data, 1 stop bit and no parity.
 # There is no handshaking.
 #
-# Note that the timeout here is set to 5 seconds.  That is more than enough
-# time to allow the TI RFID reader to turn on its radio, command a tag, and get
-# data back from it.  We assume that if we time out and we don't have any data
-# then the RFID reader is not on line.
-#
-
-    try:
-        tiser = serial.Serial(port_to_use, baudrate=57600, bytesize=8,
-                              parity='N', stopbits=1, timeout=0.5,
-                              xonxoff=0, rtscts=0, dsrdtr=0)
-    except:
-        result.append("Can't open " + port_to_use + ".")
-        result.append("Under linux or Apple OS you need the full path, ie /dev/ttyUSB0.")
-        result.append("Under windows use the communication port name, ie COM8.")
-        return result
-
-#
-# To use the write() method in python it needs to be in the form of a
-# string or a buffer, which is just a pointer into memory.  This code
-# forms an array of bytes from a list that contains the command to send
-# and then uses a buffer (memoryview) to write it out.
-#
-# Note that the S6350 reader uses a wrapper that encapsulates all
-# ISO commands.  Every ISO commands needs to have this wrapper with
-# the S6350 reader.  For some commands the entire length is not
-# known ahead of time, so some pieces are filled in later and the
-# checksum bytes generated last and filled in.  This command is a
-# good example of a command where the length can change, in this
-# case as the mask grows in length.
-#
-# In this wrapper, the bytes are as follows:
-#
-# 0: SOF
-# 1 & 2: length LSB and MSB respectively, filled in later
-# 3 & 4: TI reader address fields, alsways set to 0
-# 5: TI reader command flags
-# 6: TI reader ISO pass thru command, always 0x60
-#
-
-    read_addressed_block = [0x01, 0, 0, 0, 0, 0, 0x60]  # the ISO wrapper
-
-#
-# Extend the list with the actual ISO command without the SOF, CRC16 and EOF
-# On the first inventory pass, the mask length is zero.  It will grow as
-# collisions are encountered, but for now form the ISO inventory command
-# asking for 16 time slots, and no mask.  The bytes that extend the list are
-# as follows: 7: ISO reader config byte 0.The value in this case is 0x11 8:
-# Tag flags. Option flag is set to get security status too. o_f=1, s_f=0,
-# a_f=1 9: The ISO command.  In this case 0x20
+# The session does not use a fixed timeout.  It works out how long to
+# wait for each reply from the length of the reply and how long the
+# reader took to answer this kind of command before.  We assume that if
+# we time out and we don't have any data then the RFID reader is not on
+# line.
 #
 
-    read_addressed_block.extend([0x11, 0x6b, 0x20])
-
-#
-# Extend the list again to provide space for the requested tag address (UID)
-# and memory block number.  Eight bytes for the UID and 1 byte for the block.
-
-    read_addressed_block.extend([0, 0, 0, 0, 0, 0, 0, 0, 0,0])
-
-#
-# Extend the list 1 more time with places for the checksum bytes.
-# Those will be computed and added later to the resulting byte array
-# that is formed to send to the reader.
-#
-
-    read_addressed_block.extend([0, 0])  # the two checksum bytes
-
-#
-# Now that the list containing the command template is done, it
-# is possible to compute the length of the command and create
-# the byte array.
-#
-
-    command_len = len(read_addressed_block)
-    command = bytearray(command_len)
-    idx = 0
-
-    for i in read_addressed_block:
-        command[idx] = i
-        idx += 1
-
-# Fill in the length
-
-    command[1] = command_len
-
+    session = s6350_session.openSession(port_to_use)
+    if isinstance(session, list):  # the port could not be opened
+        return session
 
 # Get the requested UID from the argument list and fill it in
 
-    uid = " "  # init this to be some string
-
-    usr_str = tag_UID
-    uid = do_Hex_Input(usr_str, 8)
+    uid = s6350_tags.uidFromInput(tag_UID)  # the UID as an integer, or an error string
 
     if isinstance(uid, str):
         result.append("Error: " + uid)
         result.append("")
-        tiser.close()
+        session.release()
         return result
 
 # Get the requested block from argument list and fill it in
@@ -333,39 +100,35 @@ def ti_read_addressed_block(port_to_use, tag_UID, tag_BLK):
     if isinstance(blk, str):
         result.append("Error: " + blk)
         result.append("")
-        tiser.close()
+        session.release()
         return result
 
+#
+# If the session reads ahead, the block may already be here.  See the
+# ReadAhead class in s6350_iso_read_multiple_blocks.
+#
 
-# Fill in UID
-
-    idx = 10  # init to index in command array for first byte of UID
-
-    for i in uid:
-        command[idx] = i
-        idx += 1
-
-# Fill in block number.
-
-    command[18] = blk[1]
-    command[19] = blk[0]
+    block = (blk[1] << 8) | blk[0]
 
+    if session.read_ahead is not None:
+        got = session.read_ahead.readBlock(uid, block)
+        if got is not None:
+            result.append("Block Data: 0x" + got[1][::-1].hex())
+            result.append("Block Security Bits: " + "0x%0.2x" % got[0])
+            result.append("")
+            session.release()
+            return result
 
-# Compute and fill in the two checksum bytes
 
-    chksum = 0
-    idx = 0
-    while idx < (command_len - 2):
-        chksum ^= command[idx]
-        idx += 1
+#
+# Build the command.  See formReadBlockCommand above for its bytes.
+#
 
-    command[command_len - 2] = chksum  # 1st byte is the checksum
-    command[command_len - 1] = chksum ^ 0xff  # 2nd byte is ones comp of the checksum
+    command = formReadBlockCommand(uid, block)
 
 # Send out the command to the reader and get the reply
 
-    tiser.write(memoryview(command))  # memoryview is the same as buffer
-    response = getReturnPacket(tiser)  # read the response from the reader
+    response = session.transact(command)  # send the command and read the response
 
 
 #
@@ -373,7 +136,7 @@ def ti_read_addressed_block(port_to_use, tag_UID, tag_BLK):
 #
 
     if(len(response) < 2):  # if the reader sent nothing back
-        tiser.close()
+        session.release()
         return response
 
     iso_errors = chkErrorISO(response)
@@ -382,7 +145,7 @@ def ti_read_addressed_block(port_to_use, tag_UID, tag_BLK):
         result.append("Error code is: " + hex(iso_errors[0]))  # for grins, print the error code
         result.append(iso_errors[1])  # and the meaning
         result.append("")
-        tiser.close()
+        session.release()
         return result
 
     else:
@@ -403,7 +166,7 @@ def ti_read_addressed_block(port_to_use, tag_UID, tag_BLK):
         result.append("Block Security Bits: " +  "0x%0.2x" % response[8])
         result.append("")
 
-    tiser.close()
+    session.release()
     return result
 
 #
@@ -35,192 +35,460 @@
 
 import io
 import sys
-import serial
+import time
+import threading
+import concurrent.futures
+import s6350_session
+import s6350_tags
+import s6350_iso_select
+from s6350_iso_helpers import chkErrorISO, do_Hex_Input
+
 
 #
-# The getReturnPacket function reads a reply packet from the S6350 reader.
-# It does some checking of the data and if the packet is intact and the
-# checksum is right it will return the packet to the calling program as a
-# list of integers.
+# The formReadMultipleCommand function builds a read multiple blocks
+# command for a tag UID (an integer), a starting block and a number of
+# blocks (1 to MAX_BLOCKS).  The bytes are the same ones that
+# ti_read_multiple_blocks below fills in one at a time.  If 'selected'
+# is set the command is for the selected tag instead, and the UID is
+# left out (see s6350_iso_select).
 #
-# The get return packet also checks for functional and communication errors.
-# A functional error occurs if the RFID reader doesn't work.  This is
-# indicated if no data is read from the RFID reader and the serial connection
-# times out.  Communication errors are those where the reader works, but the
-# returned data is corrupt as indicated by the checksum bytes.  Both of these
-# errors are fatal, so if they occur a message will be printed and the program
-# will exit.
+
+MAX_BLOCKS = 49  # most blocks the reader can return in one reply
+
+def formReadMultipleCommand(uid, start, count, selected=False):
+
+    if selected:
+        read_multiple = [0x11, s6350_iso_select.SELECTED_FLAGS, 0x23]
+    else:
+        read_multiple = [0x11, 0x6b, 0x23]
+        read_multiple.extend(s6350_tags.uidToBytes(uid))
+    read_multiple.extend([start & 0xff, start >> 8, count - 1])
+
+    return s6350_session.formCommand(0x60, read_multiple)
+
+
 #
-# There could also be ISO command errors.  Those are not necessarily fatal
-# and are handled in the chkErrorISO routine.
+# The parseReadMultiple function picks the blocks out of the reply to a
+# read multiple blocks command.  It returns a list with [security byte,
+# 4 data bytes] for each block, or a string saying what went wrong.  The
+# data bytes are in the order they are in the tag's memory.
 #
 
-def getReturnPacket(tiser):
+def parseReadMultiple(response, count):
+
+    if len(response) < 2:  # no reply or a bad one
+        return response[0]
+
+    iso_errors = chkErrorISO(response)
+    if iso_errors[0] != 0:
+        return "Error code is: " + hex(iso_errors[0]) + " " + iso_errors[1]
+
+    if len(response) < 10 + 5 * count:
+        return "Reply too short for " + str(count) + " blocks."
+
+    blocks = []
+    idx = 8
+    while len(blocks) < count:
+        blocks.append([response[idx], bytes(response[idx + 1:idx + 5])])
+        idx += 5
+
+    return blocks
+
+
+#
+# The readBlocks function reads any number of blocks from a tag over an
+# open session.  The reader can only return MAX_BLOCKS blocks at a time,
+# so the read is split into chunks.  All the chunks are put on the
+# session's command queue at once, so each command is built and each
+# reply is picked apart while the reader is busy with another chunk.  It
+# returns a list with [security byte, 4 data bytes] for each block, or a
+# string saying what went wrong.
+#
+# The work is split in two so a caller can start reads for several tags
+# before waiting on any of them.  submitReadBlocks puts the chunks on the
+# queue and returns their futures, and collectBlocks waits for them and
+# puts the blocks together.
+#
+# With 'selected' set the tag is selected first, if it isn't already,
+# and the chunks are read in select mode, which saves sending the UID
+# with each one.  If that fails when the tag was already selected, it
+# may have lost its selection, so it is selected again and the read is
+# tried once more.
+#
+# If the session is coalescing reads (see coalesceReads below) addressed
+# reads go through its ReadCoalescer instead, which gives back a single
+# future for the whole range.
+#
+
+def submitReadBlocks(session, uid, start, count, selected=False):
+
+    if not selected and session.coalescer is not None:
+        return [session.coalescer.submit(uid, start, count)]
+
+    return submitChunks(session, uid, start, count, selected)
+
+
+def submitChunks(session, uid, start, count, selected=False):
+
+    commands = session.commandQueue()
+    futures = []
+
+    with session.lock:  # nobody selects another tag until the reads are queued
+        if selected:
+            select = s6350_iso_select.submitSelect(session, uid)
+            if select is not None:
+                futures.append(select)  # its result is None if it worked
+
+        block = start
+        while block < start + count:
+            chunk = min(MAX_BLOCKS, start + count - block)
+            futures.append(commands.submit(formReadMultipleCommand(uid, block, chunk, selected),
+                                           lambda response, chunk=chunk:
+                                           parseReadMultiple(response, chunk)))
+            block += chunk
+
+    return futures
+
+
+def readBlocks(session, uid, start, count, selected=False):
+
+    was_selected = selected and s6350_iso_select.isSelected(session, uid)
+
+    blocks = collectBlocks(submitReadBlocks(session, uid, start, count, selected))
+
+    if was_selected and isinstance(blocks, str):
+        s6350_iso_select.lostSelection(session, uid)
+        blocks = collectBlocks(submitReadBlocks(session, uid, start, count, selected))
+
+    return blocks
+
+
+def collectBlocks(futures):
+
+    blocks = []
+    for future in futures:
+        chunk = future.result()
+        if chunk is None:  # a select that worked
+            continue
+        if isinstance(chunk, str):
+            for other in futures:
+                other.cancel()  # no point reading the rest
+            return chunk
+        blocks.extend(chunk)
+
+    return blocks
+
+
+#
+# The runs function turns a sorted list of block numbers into runs of
+# neighbouring blocks, as [first, count] pairs, so each run can be read
+# or written in one go.
+#
+
+def runs(blocks):
 
     result = []
+    for block in blocks:
+        if len(result) > 0 and result[-1][0] + result[-1][1] == block:
+            result[-1][1] += 1
+        else:
+            result.append([block, 1])
+    return result
+
+
+#
+# The ReadCoalescer class merges block reads of the same tag that come
+# in at about the same time.
 #
-# We read the returned data from the reader in 2 passes.  First we read
-# the first two bytes.  The second byte is the length of the entire returned
-# packet.  From that we determine how many more bytes to read which are then
-# read in the second pass.
+# When several threads, or a program and the GUI, each want some blocks
+# of the same tag, every one of them would be its own read multiple
+# blocks command.  The coalescer holds the first read of a tag for
+# 'window' seconds.  Any other reads of that tag that come in meanwhile
+# join it.  When the window is up the block ranges that overlap or touch
+# are merged, each merged range is read with as few commands as it takes
+# (see submitChunks), and every caller gets its own blocks cut out of
+# the shared reply.  Ranges with a gap between them are still read
+# separately, so no blocks nobody asked for are read.
 #
+# A caller gets a future whose result is the list of blocks it asked
+# for, or a string saying what went wrong, like readBlocks returns.  The
+# stats dictionary counts the reads asked for and the ranges actually
+# read.
 #
-# We read the returned data from the reader in 2 passes.  First we read
-# the first two bytes.  The second byte is the length of the entire returned
-# packet.  From that we determine how many more bytes to read which are then
-# read in the second pass.
+# Reads in select mode are not coalesced, the selected tag can change
+# between the submit and the end of the window.
 #
 
-    rddat = []
-    line_size = tiser.read(2)  # first pass, read first two bytes of reply
-#   print(line_size)
+class ReadCoalescer:
 
-    if len(line_size) < 2:
-        result.append("No data returned.  Is the reader turned on?")
-        tiser.close()
-        return result
+    def __init__(self, session, window=0.01):
+
+        self.session = session
+        self.window = window
+        self.pending = {}  # UID -> [time the window ends, [(start, count, future)]]
+        self.stats = {"requests": 0, "ranges": 0}
+        self.running = True
+        self.wake = threading.Condition()
+
+        self.thread = threading.Thread(target=self.watch, daemon=True)
+        self.thread.start()
 
-# second pass
-#    print ("Reply length is " + str(ord(line_size[1])) + " bytes.")
-    line_data = tiser.read(line_size[1] - 2)  # get the rest of the reply
-  # print ("I read " + str(len(line_data)) + " bytes.")
+    def submit(self, uid, start, count):
+
+        future = concurrent.futures.Future()
+
+        with self.wake:
+            waiting = self.pending.get(uid)
+            if waiting is None:
+                waiting = [time.monotonic() + self.window, []]
+                self.pending[uid] = waiting
+                self.wake.notify()
+            waiting[1].append((start, count, future))
+            self.stats["requests"] += 1
+
+        return future
 
 #
-# The returned data is in the form of string objects.  Use that data to form
-# a single response list of integers.  Integers are exactly what the RFID reader
-# is sending back.  Doing this makes it easier to process the returned data.
+# The watch method runs on the coalescer's own thread.  It sleeps until
+# the earliest window is up and then sends the reads of that tag.  Once
+# stop is called everything still waiting is sent straight away.
 #
 
-    rddat_len = line_size[1] # this is the length of the entire response
-    idx = 0
+    def watch(self):
 
-    rddat.append(line_size[0]) # response SOF
-    rddat.append(line_size[1]) # response size
-# In the next line the -2 accounts for the SOF and size bytes done above.
-    while idx < (rddat_len - 2): # do the rest of the response
-        rddat.append(line_data[idx])
-        idx += 1
+        while True:
+            with self.wake:
+                now = time.monotonic()
+                due = []
+                wait = None
+                for uid, (ends, requests) in list(self.pending.items()):
+                    if ends <= now or not self.running:
+                        due.append((uid, requests))
+                        del self.pending[uid]
+                    elif wait is None or ends - now < wait:
+                        wait = ends - now
+
+                if len(due) == 0:
+                    if not self.running:
+                        return
+                    self.wake.wait(wait)
+                    continue
+
+            for uid, requests in due:
+                self.flush(uid, requests)
 
 #
-# Compute the checksum.  To compute the checksum of the returned data you
-# just take the XOR of all the data bytes that were returned and compare with
-# the checksum bytes that were returned.  The 'while' statment ranges from 0
-# to the length of the returned data - 2.  The minus 2 is to adjust for the
-# index (we number from 0) and also so that we do not include the returned
-# last checksum bytes in our own calculation.  We compute the checksum on the
-# returned data bytes, but not including the returned checksum bytes.
+# The flush method merges the reads of one tag into ranges and puts them
+# on the session's command queue.  The callers' futures are filled in by
+# fanOut, on the queue's parse thread, when the last chunk of a range
+# is done.  The queue does its commands in order, so by then the other
+# chunks are done too.
 #
 
-    chksum = 0
-    idx = 0
-    while idx < (rddat_len - 2):
-        chksum ^= rddat[idx]
-        idx += 1
+    def flush(self, uid, requests):
+
+        ranges = []  # [first block, block after the last, requests]
+        for request in sorted(requests, key=lambda request: request[0]):
+            start, count, future = request
+            if len(ranges) > 0 and start <= ranges[-1][1]:
+                ranges[-1][1] = max(ranges[-1][1], start + count)
+                ranges[-1][2].append(request)
+            else:
+                ranges.append([start, start + count, [request]])
+
+        for first, end, waiting in ranges:
+            self.readRange(uid, first, end - first, waiting)
+
+    def readRange(self, uid, first, count, waiting):
+
+        self.stats["ranges"] += 1
+        chunks = submitChunks(self.session, uid, first, count)
+        chunks[-1].add_done_callback(lambda done: self.fanOut(uid, first, chunks, waiting))
 
 #
-# Compare the checksums and if they don't match then bail out.
-# If they do match then all is well and all that remains is to
-# dig out and print the tag data.
+# If a merged read fails, it may only be because of one of the reads in
+# it, like one running past the end of the tag's memory.  So each read
+# in it is tried again on its own, and only fails if it fails by itself.
 #
 
-    if chksum != (rddat[rddat_len - 2]):  # and compare them
-        result.append("Checksum error!")
-#    print (chksum)
-#    print (rddat[rddat_len - 2])
-        tiser.close()
-        return result
-    
-    return rddat   #  return the reader data as a list
-
-
-#
-# The chkErrorISO function will take a packet returned by the
-# reader as a list of bytes and check it for any operational
-# errors.  Operational errors are ones where the reader is
-# functional and communication is functional but something
-# went wrong with the requested operation, for example asking
-# for a tag UID that does not belong to any tag in the field.
-#
-# Note that functional errors and communication errors are
-# checked for in the getReturnPacket routine.
-#
-# The routine will return a list that contains the ISO error
-# code as an integer and the meaning of the error as a string.
-# An error code of 0 means no error (OK or command success).
-# 
-
-def chkErrorISO(rddat): 
-    if (len(rddat)==11) and (rddat[7] == 0x01):  # if there is an error
-        error_code = rddat[8]  # get the code from the reader
-        error_meaning = {
-            "0x3" : "The option is not supported" ,
-            "0x2" : "Command not supported.",
-            "0x0f" : "Error with no information given",
-            "0x10" : "Specified block is not available",
-            "0x11" : "The specified block is already locked and thus cannot be locked again",
-            "0x12" : "The specified block is locked and its content cannot be changed",
-            "0x13" : "The specified block was not successfully programmed",
-            "0x14" : "The specified block was not successfully locked",
-            "0x15" : "The specified block is read−protectedx",
-            }.get(hex(rddat[8]), "Unknown error code.")
-    elif (len(rddat)==10) and (rddat[5] == 0x01):  # if there is an error
-        error_code = rddat[7]  # get the code from the reader
-        error_meaning = {
-            "0x3" : "The option is not supported" ,
-            "0x2" : "Command not supported.",
-            "0x0f" : "Error with no information given",
-            "0x10" : "Specified block is not available",
-            "0x11" : "The specified block is already locked and thus cannot be locked again",
-            "0x12" : "The specified block is locked and its content cannot be changed",
-            "0x13" : "The specified block was not successfully programmed",
-            "0x14" : "The specified block was not successfully locked",
-            "0x15" : "The specified block is read−protectedx",
-            }.get(hex(rddat[7]), "Unknown error code.") + " \n... Error ISO passtrhough byte not found"
-    else:
-        error_code = 0  # else 0 = all OK
-        error_meaning = "OK"
+    def fanOut(self, uid, first, chunks, waiting):
+
+        try:
+            blocks = collectBlocks(chunks)
+        except Exception as error:  # the port went away, for example
+            for start, count, future in waiting:
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(error)
+            return
 
-    return [error_code, error_meaning]  # return code and meaning as a list
+        if isinstance(blocks, str) and len(waiting) > 1:
+            for request in waiting:
+                self.readRange(uid, request[0], request[1], [request])
+            return
 
+        for start, count, future in waiting:
+            if not future.set_running_or_notify_cancel():
+                continue  # the caller changed its mind
+            if isinstance(blocks, str):
+                future.set_result(blocks)
+            else:
+                future.set_result(blocks[start - first:start - first + count])
 
 #
-# The do_Hex_Input routine will take a string argument representing a number
-# in hex and also an argument for a number of bytes.  It will turn the string
-# argument into a little-endian list of bytes, each byte represented by an
-# integer having a length of the requested number of bytes.  If all is well,
-# it will return the list of bytes.  If an error occurs, it will instead
-# return a string with the meaning of the error.  A calling program can
-# determine what is coming back (a list or an error string) by using the
-# builtin isinstance function.
+# The stop method sends whatever is still waiting and stops the thread.
 #
-# The user input string representing the hex number can optionally have a
-# leading 0x.
+
+    def stop(self):
+
+        with self.wake:
+            self.running = False
+            self.wake.notify()
+        if threading.current_thread() is not self.thread:
+            self.thread.join()
+
+
+#
+# The coalesceReads function starts coalescing the addressed block reads
+# of a session, holding each for 'window' seconds, and returns the
+# session's ReadCoalescer.  A window of None stops coalescing.
 #
 
+def coalesceReads(session, window=0.01):
 
-def do_Hex_Input(user_input, num_bytes):
+    if window is None:
+        if session.coalescer is not None:
+            session.coalescer.stop()
+            session.coalescer = None
+        return None
 
-    formatter = "%0." + str(num_bytes * 2) + "x"
+    if session.coalescer is None:
+        session.coalescer = ReadCoalescer(session, window)
+    session.coalescer.window = window
+    return session.coalescer
 
-    try:
-        s = formatter % int(user_input, base=16)
-    except ValueError:
-        return_bytes = "User input contains non-hex characters."
-        return return_bytes
 
-    if len(s) > (num_bytes * 2):
-        return_bytes = "User input greater than required length."
-        return return_bytes
+#
+# The ReadAhead class speeds up programs that walk through a tag one
+# block at a time.
+#
+# Reading one block costs a whole command and reply for 4 bytes.  The
+# read ahead watches the blocks asked for from each tag.  When they go
+# up by the same step (the stride) each time, the next blocks are read
+# with one read multiple blocks command, and the single block reads
+# after that are answered from what was read.  The number of steps read
+# ahead (the window) starts at 1, doubles every time the pattern holds,
+# and goes back to 1 when it breaks.  The blocks in between the steps
+# come along in the same command, so the most blocks read at a time is
+# still MAX_BLOCKS.
+#
+# Blocks read ahead are kept for at most 'max_age' seconds, and a tag
+# that has not been read from for that long is forgotten altogether, so
+# a long running session doesn't pile up blocks that were skipped over
+# or tags that have gone.  A write to a tag through writeBlocks,
+# WriteBehind or ti_write_addressed_block on the same session forgets
+# what was read ahead for that tag, and so does selecting the tag or
+# another one (see s6350_iso_select), since a tag that lost its
+# selection may have left the field.
+#
+# readBlock returns [security byte, 4 data bytes], or None when the
+# block should just be read the usual way: the pattern isn't clear yet,
+# or the read ahead failed, for example because it ran past the end of
+# the tag's memory.
+#
+
+class ReadAhead:
+
+    def __init__(self, session, max_age=1.0):
+
+        self.session = session
+        self.max_age = max_age
+        self.tags = {}  # UID -> [last block, stride, window, {block: (time, block)}, last used]
+        self.stats = {"hits": 0, "misses": 0, "reads": 0, "blocks_read": 0}
+        self.lock = threading.Lock()
+
+    def readBlock(self, uid, block):
+
+        now = time.monotonic()
+
+        with self.lock:
+            self.prune(now)
+            state = self.tags.setdefault(uid, [None, None, 1, {}, now])
+            last, stride, window, kept = state[0:4]
+            state[4] = now
+
+            if last is not None and block - last == stride:
+                window = min(window * 2, MAX_BLOCKS)
+            else:
+                window = 1
+                if last is not None and block > last:
+                    stride = block - last
+            state[0:3] = [block, stride, window]
+
+            got = kept.pop(block, None)
+            if got is not None and now - got[0] <= self.max_age:
+                self.stats["hits"] += 1
+                return got[1]
+
+            self.stats["misses"] += 1
+            if window == 1:
+                return None
+            count = min(window * stride, MAX_BLOCKS)
+
+        blocks = readBlocks(self.session, uid, block, count)
+
+        with self.lock:
+            if isinstance(blocks, str):
+                state[2] = 1  # start over with single blocks
+                return None
+
+            self.stats["reads"] += 1
+            self.stats["blocks_read"] += count
+            for idx in range(1, count):
+                kept[block + idx] = (now, blocks[idx])
 
-    return_bytes = []
-    x = 0
+        return blocks[0]
 
-    while (x < num_bytes):
-        return_bytes.append(int(s[-2 - (x * 2)] + s[-1 - (x * 2)], base=16))
-        x = x + 1
+#
+# The prune method drops the blocks that are too old to be used, and the
+# tags that have not been read from for 'max_age' seconds.  It is called
+# with the lock held.
+#
+
+    def prune(self, now):
+
+        for uid in list(self.tags):
+            state = self.tags[uid]
+            if now - state[4] > self.max_age:
+                del self.tags[uid]
+                continue
+            kept = state[3]
+            for block in [block for block, got in kept.items() if now - got[0] > self.max_age]:
+                del kept[block]
 
-    return return_bytes
+    def forget(self, uid):
 
+        with self.lock:
+            state = self.tags.get(uid)
+            if state is not None:
+                state[3].clear()
+
+
+#
+# The readAhead function starts read ahead on a session, for the single
+# block reads of ti_read_addressed_block, and returns the session's
+# ReadAhead.  A max_age of None stops it.
+#
+
+def readAhead(session, max_age=1.0):
+
+    if max_age is None:
+        session.read_ahead = None
+        return None
+
+    if session.read_ahead is None:
+        session.read_ahead = ReadAhead(session, max_age)
+    session.read_ahead.max_age = max_age
+    return session.read_ahead
 
 
 ####################################
@@ -234,24 +502,20 @@ def ti_read_multiple_blocks(port_to_use, tag_UID, tag_BLK, num_BLKS):
     result = []
 
 #
-# The TI reader defaults to 57600 baud, 8 bit data, 1 stop bit and no parity.
+# Open a session to the reader, or use the one we were given.  The TI
+# reader defaults to 57600 baud, 8 bit data, 1 stop bit and no parity.
 # There is no handshaking.
 #
-# Note that the timeout here is set to 5 seconds.  That is more than enough
-# time to allow the TI RFID reader to turn on its radio, command a tag, and get
-# data back from it.  We assume that if we time out and we don't have any data
-# then the RFID reader is not on line.
+# The session does not use a fixed timeout.  It works out how long to
+# wait for each reply from the length of the reply and how long the
+# reader took to answer this kind of command before.  We assume that if
+# we time out and we don't have any data then the RFID reader is not on
+# line.
 #
 
-    try:
-        tiser = serial.Serial(port_to_use, baudrate=57600, bytesize=8,
-                              parity='N', stopbits=1, timeout=0.5,
-                              xonxoff=0, rtscts=0, dsrdtr=0)
-    except:
-        result.append("Can't open " + port_to_use + ".")
-        result.append("Under linux or Apple OS you need the full path, ie /dev/ttyUSB0.")
-        result.append("Under windows use the communication port name, ie COM8.")
-        return result
+    session = s6350_session.openSession(port_to_use)
+    if isinstance(session, list):  # the port could not be opened
+        return session
 
 #
 # To use the write() method in python it needs to be in the form of a
@@ -330,15 +594,12 @@ def ti_read_multiple_blocks(port_to_use, tag_UID, tag_BLK, num_BLKS):
 
 # Get the requested UID from the argument list and fill it in
 
-    uid = " "  # init this to be some string
-
-    usr_str = tag_UID
-    uid = do_Hex_Input(usr_str, 8)
+    uid = s6350_tags.uidFromInput(tag_UID)  # the UID as an integer, or an error string
 
     if isinstance(uid, str):
         result.append("Error: " + uid)
         result.append("")
-        tiser.close()
+        session.release()
         return result
 
 # Get the requested starting block from the argument list and fill it in
@@ -351,7 +612,7 @@ def ti_read_multiple_blocks(port_to_use, tag_UID, tag_BLK, num_BLKS):
     if isinstance(stblk, str):
         result.append("Error: " + stblk)
         result.append("")
-        tiser.close()
+        session.release()
         return result
 
 # Get the requested number of blocks from the user arg list fill it in
@@ -365,7 +626,7 @@ def ti_read_multiple_blocks(port_to_use, tag_UID, tag_BLK, num_BLKS):
     if isinstance(numblk, str):
         result.append("Error: " + numblk)
         result.append("")
-        tiser.close()
+        session.release()
         return result
 
 # Check to see if too many blocks have been requested.  As this code
@@ -387,7 +648,7 @@ def ti_read_multiple_blocks(port_to_use, tag_UID, tag_BLK, num_BLKS):
     if inumblk > 49:
         result.append("Error: Reader can only return up to 49 (0x31) blocks in one command.\n")
         numblk = " "  # reinit this
-        tiser.close()
+        session.release()
         return result
 
 
@@ -395,7 +656,7 @@ def ti_read_multiple_blocks(port_to_use, tag_UID, tag_BLK, num_BLKS):
 
     idx = 10 # init to index in command array for first byte of UID
 
-    for i in uid:
+    for i in s6350_tags.uidToBytes(uid):
         command[idx] = i
         idx += 1
 
@@ -425,15 +686,14 @@ def ti_read_multiple_blocks(port_to_use, tag_UID, tag_BLK, num_BLKS):
 
 # Send out the command to the reader and get the reply
     print("Request : ",command.hex())
-    tiser.write(memoryview(command))  # memoryview is the same as buffer
-    response = getReturnPacket(tiser)  # read the response from the reader
+    response = session.transact(command)  # send the command and read the response
     print("Responce :",response)
 
 #
 # Check if any ISO operational errors have occurred.
 #
     if(len(response) < 2):  # if the reader sent nothing back
-        tiser.close()
+        session.release()
         return response
 
     iso_errors = chkErrorISO(response)
@@ -442,7 +702,7 @@ def ti_read_multiple_blocks(port_to_use, tag_UID, tag_BLK, num_BLKS):
         result.append("Error code is: " + hex(iso_errors[0]))  # for grins, print the error code
         result.append(iso_errors[1])  # and the meaning
         result.append("")
-        tiser.close()
+        session.release()
         return result
 
     else:
@@ -472,7 +732,7 @@ def ti_read_multiple_blocks(port_to_use, tag_UID, tag_BLK, num_BLKS):
             idx = idx + 5  # each block of data is 4 bytes total.
             inumblk = inumblk - 1
     
-    tiser.close()
+    session.release()
     return result
 
 #
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+#
+
+#
+# The s6350_iso_select module handles ISO 15693 select mode.
+#
+# An addressed command (tag flags 0x6b) carries the whole 8 byte UID of
+# the tag it is for.  When a program does a lot of commands to one tag,
+# like writing a block image, those 8 bytes go over the 57600 baud link
+# with every command, and every tag in the field has to check them.  The
+# ISO Select command (0x25) puts one tag in the selected state.  After
+# that commands can have the select flag (0x10) set instead of the
+# address flag (0x20), and leave the UID out.  Only the selected tag
+# answers them.
+#
+# A tag stays selected until another tag is selected, or it loses power,
+# for example by leaving the field.  The session keeps the UID of the
+# tag it last selected in session.selected, so a tag is only selected
+# again when a different tag is wanted, or a command to the selected tag
+# failed and it may have lost its selection.
+#
+# Select commands go through the session's command queue, so they are
+# always sent before the selected mode commands queued after them.  A
+# program queues the select and the commands that depend on it while
+# holding session.lock, so no other thread can queue a select of another
+# tag in between and have the commands go to the wrong tag.  The lock is
+# let go before waiting for the answers.  The tag programs use addressed commands and don't touch the selection, so
+# they can share a session with a program using select mode.
+#
+# After the ISO wrapper the select command bytes are:
+#
+# 7: ISO reader config byte 0.  The value in this case is 0x11
+# 8: Tag flags.  Addressed, without the option flag (0x2b)
+# 9: The ISO command.  In this case 0x25
+# 10 to 17: The UID, LSB first
+#
+# See TI 6350 user manual and the ISO 15693-3 document for more information.
+#
+
+import s6350_session
+import s6350_tags
+from s6350_iso_helpers import chkErrorISO
+
+SELECT_FLAGS = 0x2b  # tag flags for the select command itself
+SELECTED_FLAGS = 0x5b  # tag flags for a command to the selected tag
+
+
+def formSelectCommand(uid):
+
+    select = [0x11, SELECT_FLAGS, 0x25]
+    select.extend(s6350_tags.uidToBytes(uid))
+
+    return s6350_session.formCommand(0x60, select)
+
+
+#
+# The parseSelect function checks the reply to a select command.  It
+# returns None if the tag is now selected, or a string saying what went
+# wrong.
+#
+
+def parseSelect(response):
+
+    if len(response) < 2:  # no reply or a bad one
+        return response[0]
+
+    iso_errors = chkErrorISO(response)
+    if iso_errors[0] != 0:
+        return "Select failed, error code is: " + hex(iso_errors[0]) + " " + iso_errors[1]
+
+    return None
+
+
+#
+# The submitSelect function puts a select command for 'uid' on the
+# session's command queue and returns its future, whose result is what
+# parseSelect returns.  If the tag is already selected nothing is sent
+# and None is returned.  The session is marked as having the tag selected
+# straight away, so commands queued next don't select it again, and the
+# mark is taken off if the select fails.  The caller should hold
+# session.lock until its selected mode commands are queued too.
+#
+
+def submitSelect(session, uid):
+
+    with session.lock:
+        if session.selected == uid:
+            return None
+        if session.selected is not None:
+            forgetReadAhead(session, session.selected)
+        forgetReadAhead(session, uid)
+        session.selected = uid
+
+    def parse(response):
+        error = parseSelect(response)
+        if error is not None:
+            lostSelection(session, uid)
+        return error
+
+    return session.commandQueue().submit(formSelectCommand(uid), parse)
+
+
+#
+# The selectTag function selects a tag and waits for the answer.  It
+# returns None if the tag is selected, or a string saying what went wrong.
+#
+
+def selectTag(session, uid):
+
+    with session.lock:
+        future = submitSelect(session, uid)
+    if future is None:
+        return None
+
+    return future.result()
+
+
+#
+# The lostSelection function is called when a command to the selected
+# tag failed.  The tag may have left the field and lost its selection,
+# so it will be selected again before the next command to it.
+#
+
+def lostSelection(session, uid):
+
+    with session.lock:
+        if session.selected == uid:
+            session.selected = None
+            forgetReadAhead(session, uid)
+
+
+#
+# The forgetReadAhead function throws away the blocks the session has
+# read ahead from a tag whose selection changed (see ReadAhead in
+# s6350_iso_read_multiple_blocks).
+#
+
+def forgetReadAhead(session, uid):
+
+    if session.read_ahead is not None:
+        session.read_ahead.forget(uid)
+
+
+def isSelected(session, uid):
+
+    return session.selected == uid
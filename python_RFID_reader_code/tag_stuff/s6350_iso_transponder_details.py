@@ -18,7 +18,7 @@
 
 import io
 import sys
-import serial
+import s6350_session
 
     
 #
@@ -32,29 +32,20 @@ def ti_iso_transponder_details(port_to_use):
     result = []
 
 #
-# The TI reader defaults to 57600 baud, 8 bit data, 1 stop bit and no parity.
+# Open a session to the reader, or use the one we were given.  The TI
+# reader defaults to 57600 baud, 8 bit data, 1 stop bit and no parity.
 # There is no handshaking.
 #
-# Note that the timeout here is set to 5 seconds.  That is more than enough
-# time to allow the TI RFID reader to turn on its radio, command a tag, and get
-# data back from it.  We assume that if we time out and we don't have any data
-# then the RFID reader is not on line.
+# The session does not use a fixed timeout.  It works out how long to
+# wait for each reply from the length of the reply and how long the
+# reader took to answer this kind of command before.  We assume that if
+# we time out and we don't have any data then the RFID reader is not on
+# line.
 #
 
-#
-# The TI reader defaults to 57600 baud, 8 bit data, 1 stop bit and no parity.
-# There is also no handshaking.
-#
-
-    try:
-        tiser = serial.Serial(port_to_use, baudrate=57600, bytesize=8,
-                              parity='N', stopbits=1, timeout=0.5,
-                              xonxoff=0, rtscts=0, dsrdtr=0)
-    except:
-        result.append("Can't open " + port_to_use + ".")
-        result.append("Under linux or Apple OS you need the full path, ie /dev/ttyUSB0.")
-        result.append("Under windows use the communication port name, ie COM8.")
-        return result
+    session = s6350_session.openSession(port_to_use)
+    if isinstance(session, list):  # the port could not be opened
+        return session
 
 #
 # Form an ISO read transponder details command with a slot length of 1.
@@ -131,77 +122,13 @@ def ti_iso_transponder_details(port_to_use):
     command[command_len - 2] = chksum  # 1st byte is the checksum
     command[command_len - 1] = chksum ^ 0xff  # 2nd byte is ones comp of the checksum
 
-# Send out the command to the reader
-
-    tiser.write(memoryview(command))  # memoryview is the same as buffer
-
-#
-# We read the returned data from the reader in 2 passes.  First we read
-# the first two bytes.  The second byte is the length of the entire returned
-# packet.  From that we determine how many more bytes to read which are then
-# read in the second pass.
-#
-
-    line_size = tiser.read(2)  # first pass, read first two bytes of reply
-    print(line_size)
-    
-    if len(line_size) < 2:
-        result.append("No data returned.  Is the reader turned on?")
-        tiser.close()
-        return result
-
-# second pass
-#    print ("Reply length is " + line_size[1] + " bytes.")
-    line_data = tiser.read(line_size[1] - 2)  # get the rest of the reply
-    print ("I read " + str(len(line_data)) + " bytes.")
+# Send out the command to the reader and read the response
 
-#
-# The returned data is in the form of string objects.  Use that data to form
-# a single response list of integers.  Integers are exactly what the RFID reader
-# is sending back.  Doing this makes it easier to process the returned data.
-#
-
-    response_len = line_size[1] # this is the length of the entire response
-    response = []
-    idx = 0
-
-    response.append(line_size[0]) # response SOF
-    response.append(line_size[1]) # response size
-# In the next line the -2 accounts for the SOF and size bytes done above.
-    while idx < (response_len - 2): # do the rest of the response
-        response.append(line_data[idx])
-        idx += 1
-
-#
-# Compute the checksum.  To compute the checksum of the returned data you
-# just take the XOR of all the data bytes that were returned and compare with
-# the checksum bytes that were returned.
-#
-# The 'while' statment ranges from 0 to the length of the returned data - 2.
-# The minus 2 is to adjust for the index (we number from 0) and also so that
-# we do not include the returned last checksum bytes in our own calculation.
-# We compute the checksum on the returned data bytes, but not including the
-# returned checksum bytes.
-#
-
-    chksum = 0
-    idx = 0
-    while idx < (response_len - 2):
-        chksum ^= response[idx]
-        idx += 1
-
-#
-# Compare the checksums and if they don't match then bail out.
-# If they do match then all is well and all that remains is to
-# dig out and print the tag data.
-#
+    response = session.transact(command)
 
-    if chksum != (response[response_len - 2]):  # and compare them
-        result.append("Checksum error!")
-#    print (chksum)
-#    print (response[response_len - 2])
-        tiser.close()
-        return result
+    if len(response) < 2:  # no reply or a checksum error
+        session.release()
+        return response
 
     if response[7] == 0x01:
         result.append("Transponder ID: " + "0x%0.2X" % response[20] + "%0.2X" % response[19]
@@ -213,8 +140,7 @@ def ti_iso_transponder_details(port_to_use):
 
     else:
         result.append("RFID tag not read.")
-    print(response)
-    tiser.close()
+    session.release()
     return result
 
 
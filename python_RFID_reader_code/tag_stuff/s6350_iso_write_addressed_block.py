@@ -22,311 +22,326 @@
 
 import io
 import sys
-import serial
+import time
+import threading
+import s6350_session
+import s6350_tags
+import s6350_iso_select
+from s6350_iso_helpers import chkErrorISO, do_Hex_Input
+
 
 #
-# The getReturnPacket function reads a reply packet from the S6350 reader.
-# It does some checking of the data and if the packet is intact and the
-# checksum is right it will return the packet to the calling program as a
-# list of integers.
+# The formWriteCommand function builds a write single block command for
+# a tag UID (an integer), a block number and 4 data bytes, in the order
+# they go into the tag's memory.  After the S6350 wrapper (see formCommand
+# in s6350_session) the bytes are:
 #
-# The get return packet also checks for functional and communication errors.
-# A functional error occurs if the RFID reader doesn't work.  This is
-# indicated if no data is read from the RFID reader and the serial connection
-# times out.  Communication errors are those where the reader works, but the
-# returned data is corrupt as indicated by the checksum bytes.  Both of these
-# errors are fatal, so if they occur a message will be printed and the program
-# will exit.
+# 7: ISO reader config byte 0.  The value in this case is 0x11
+# 8: Tag flags.  Option flag must be set in this command. o_f=1, s_f=0, a_f=1
+# 9: The ISO command.  In this case 0x21
+# 10 to 17: The UID, LSB first
+# 18 & 19: The block number, LSB first like the other block commands
+# 20 to 23: The block data
 #
-# There could also be ISO command errors.  Those are not necessarily fatal
-# and are handled in the chkErrorISO routine.
+# If 'selected' is set the command is for the selected tag instead, and
+# the UID is left out (see s6350_iso_select).
 #
 
-def getReturnPacket(tiser):
+def formWriteCommand(uid, block, data, selected=False):
+
+    if selected:
+        write_block = [0x11, s6350_iso_select.SELECTED_FLAGS, 0x21]
+    else:
+        write_block = [0x11, 0x6b, 0x21]
+        write_block.extend(s6350_tags.uidToBytes(uid))
+    write_block.extend([block & 0xff, block >> 8])
+    write_block.extend(data)
+
+    return s6350_session.formCommand(0x60, write_block)
 
-    result = []
 
 #
-# We read the returned data from the reader in 2 passes.  First we read
-# the first two bytes.  The second byte is the length of the entire returned
-# packet.  From that we determine how many more bytes to read which are then
-# read in the second pass.
-#
-#
-# We read the returned data from the reader in 2 passes.  First we read
-# the first two bytes.  The second byte is the length of the entire returned
-# packet.  From that we determine how many more bytes to read which are then
-# read in the second pass.
+# The parseWrite function checks the reply to a write command.  It
+# returns None if the write worked, or a string saying what went wrong.
 #
 
-    rddat = []
-    line_size = tiser.read(2)  # first pass, read first two bytes of reply
+def parseWrite(response):
 
-    if len(line_size) < 2:
-        result.append("No data returned.  Is the reader turned on?")
-        tiser.close()
-        return result
+    if len(response) < 2:  # no reply or a bad one
+        return response[0]
 
-# second pass
-#    print ("Reply length is " + str(ord(line_size[1])) + " bytes.")
-    line_data = tiser.read(line_size[1] - 2)  # get the rest of the reply
-#    print ("I read " + str(len(line_data)) + " bytes.")
+    iso_errors = chkErrorISO(response)
+    if iso_errors[0] != 0:
+        return "Error code is: " + hex(iso_errors[0]) + " " + iso_errors[1]
 
+    return None
+
+
+#
+# The writeBlocks function writes a run of blocks starting at 'start'
+# over an open session.  'data' holds 4 bytes per block.  All the writes
+# are put on the session's command queue at once.  It returns None if
+# they all worked, or a string saying what went wrong with the first one
+# that failed.
 #
-# The returned data is in the form of string objects.  Use that data to form
-# a single response list of integers.  Integers are exactly what the RFID
-# reader is sending back.  Doing this makes it easier to process the returned
-# data.
+# With 'selected' set the writes are done in select mode, the same way
+# readBlocks in s6350_iso_read_multiple_blocks does its reads.
 #
 
-    rddat_len = line_size[1] # this is the length of the entire response
-    idx = 0
+def writeBlocks(session, uid, start, data, selected=False):
 
-    rddat.append(line_size[0]) # response SOF
-    rddat.append(line_size[1]) # response size
-# In the next line the -2 accounts for the SOF and size bytes done above.
-    while idx < (rddat_len - 2): # do the rest of the response
-        rddat.append(line_data[idx])
-        idx += 1
+    if session.read_ahead is not None:
+        session.read_ahead.forget(uid)
 
-#
-# Compute the checksum.  To compute the checksum of the returned data you
-# just take the XOR of all the data bytes that were returned and compare with
-# the checksum bytes that were returned.  The 'while' statment ranges from 0
-# to the length of the returned data - 2.  The minus 2 is to adjust for the
-# index (we number from 0) and also so that we do not include the returned
-# last checksum bytes in our own calculation.  We compute the checksum on the
-# returned data bytes, but not including the returned checksum bytes.
-#
+    was_selected = selected and s6350_iso_select.isSelected(session, uid)
 
-    chksum = 0
-    idx = 0
-    while idx < (rddat_len - 2):
-        chksum ^= rddat[idx]
-        idx += 1
+    error = submitWrites(session, uid, start, data, selected)
 
-#
-# Compare the checksums and if they don't match then bail out.
-# If they do match then all is well and all that remains is to
-# dig out and print the tag data.
-#
+    if was_selected and error is not None:
+        s6350_iso_select.lostSelection(session, uid)
+        error = submitWrites(session, uid, start, data, selected)
 
-    if chksum != (rddat[rddat_len - 2]):  # and compare them
-        result.append("Checksum error!")
-#    print (chksum)
-#    print (rddat[rddat_len - 2])
-        tiser.close()
-        return result
+    return error
 
-    return rddat   #  return the reader data as a list
-
-
-#
-# The chkErrorISO function will take a packet returned by the
-# reader as a list of bytes and check it for any operational
-# errors.  Operational errors are ones where the reader is
-# functional and communication is functional but something
-# went wrong with the requested operation, for example asking
-# for a tag UID that does not belong to any tag in the field.
-#
-# Note that functional errors and communication errors are
-# checked for in the getReturnPacket routine.
-#
-# The routine will return a list that contains the ISO error
-# code as an integer and the meaning of the error as a string.
-# An error code of 0 means no error (OK or command success).
-# 
-
-def chkErrorISO(rddat): 
-    if (len(rddat)==11) and (rddat[7] == 0x01):  # if there is an error
-        error_code = rddat[8]  # get the code from the reader
-        error_meaning = {
-            "0x3" : "The option is not supported" ,
-            "0x2" : "Command not supported.",
-            "0x0f" : "Error with no information given",
-            "0x10" : "Specified block is not available",
-            "0x11" : "The specified block is already locked and thus cannot be locked again",
-            "0x12" : "The specified block is locked and its content cannot be changed",
-            "0x13" : "The specified block was not successfully programmed",
-            "0x14" : "The specified block was not successfully locked",
-            "0x15" : "The specified block is read−protectedx",
-            }.get(hex(rddat[8]), "Unknown error code.")
-    elif (len(rddat)==10) and (rddat[6] == 0x01):  # if there is an error
-        error_code = rddat[7]  # get the code from the reader
-        error_meaning = {
-            "0x3" : "The option is not supported" ,
-            "0x2" : "Command not supported.",
-            "0x0f" : "Error with no information given",
-            "0x10" : "Specified block is not available",
-            "0x11" : "The specified block is already locked and thus cannot be locked again",
-            "0x12" : "The specified block is locked and its content cannot be changed",
-            "0x13" : "The specified block was not successfully programmed",
-            "0x14" : "The specified block was not successfully locked",
-            "0x15" : "The specified block is read−protectedx",
-            }.get(hex(rddat[7]), "Unknown error code.") + " \n... Error ISO passtrhough byte not found"
-    else:
-        error_code = 0  # else 0 = all OK
-        error_meaning = "OK"
 
-    return [error_code, error_meaning]  # return code and meaning as a list
+def submitWrites(session, uid, start, data, selected):
+
+    commands = session.commandQueue()
+    futures = []
 
+    with session.lock:  # nobody selects another tag until the writes are queued
+        if selected:
+            select = s6350_iso_select.submitSelect(session, uid)
+            if select is not None:
+                futures.append(select)  # its result is None if it worked
 
+        idx = 0
+        while idx < len(data):
+            futures.append(commands.submit(formWriteCommand(uid, start + idx // 4,
+                                                            data[idx:idx + 4], selected),
+                                           parseWrite))
+            idx += 4
+
+    error = None
+    for future in futures:
+        outcome = future.result()
+        if error is None and outcome is not None:
+            error = outcome
+
+    return error
+
+
+#
+# The WriteBehind class holds block writes for a while before sending
+# them, keeping only the latest data for each block.
 #
-# The do_Hex_Input routine will take a string argument representing a number
-# in hex and also an argument for a number of bytes.  It will turn the string
-# argument into a little-endian list of bytes, each byte represented by an
-# integer having a length of the requested number of bytes.  If all is well,
-# it will return the list of bytes.  If an error occurs, it will instead
-# return a string with the meaning of the error.  A calling program can
-# determine what is coming back (a list or an error string) by using the
-# builtin isinstance function.
+# A program that keeps a counter or a status in a tag block may write
+# the same block many times a second, and every write is a full EEPROM
+# program cycle for the tag.  With write behind a write only notes the
+# data for (UID, block).  Writing the same block again before it is sent
+# just replaces the data, so only the last value is programmed.
 #
-# The user input string representing the hex number can optionally have a
-# leading 0x.
+# The held writes are sent:
+#
+# - by the WriteBehind's own thread, once a block has been held for
+#   'max_delay' seconds.  That is how stale a tag can get, counting from
+#   the first write that was held, so a block written over and over is
+#   still sent every 'max_delay' seconds.
+# - when flush is called, for all tags or just one.  A program should
+#   flush a tag before it lets the tag go out of the field.
+# - when stop is called, or the session is closed.
+#
+# The writes are put on the session's command queue while the lock is
+# held, so a newer value for a block can never be sent before an older
+# one.  A write that fails is not tried again, as newer data may be on
+# the way.  The failure goes in the errors list, and to 'callback' if
+# given, called as callback(uid, block, data, error).  flush also
+# returns the failures it saw.
+#
+# Reads of a block with a write held still get what is in the tag.
 #
 
+class WriteBehind:
 
-def do_Hex_Input(user_input, num_bytes):
+    def __init__(self, session, max_delay=1.0, callback=None):
 
-    formatter = "%0." + str(num_bytes * 2) + "x"
+        self.session = session
+        self.max_delay = max_delay
+        self.callback = callback
+        self.held = {}  # (UID, block) -> [time held since, 4 data bytes]
+        self.errors = []
+        self.stats = {"writes": 0, "replaced": 0, "sent": 0, "failed": 0}
+        self.running = True
+        self.wake = threading.Condition()
 
-    try:
-        s = formatter % int(user_input, base=16)
-    except ValueError:
-        return_bytes = "User input contains non-hex characters."
-        return return_bytes
+        self.thread = threading.Thread(target=self.watch, daemon=True)
+        self.thread.start()
 
-    if len(s) > (num_bytes * 2):
-        return_bytes = "User input greater than required length."
-        return return_bytes
+    def write(self, uid, block, data):
 
-    return_bytes = []
-    x = 0
+        with self.wake:
+            held = self.held.get((uid, block))
+            if held is None:
+                self.held[(uid, block)] = [time.monotonic(), bytes(data)]
+                self.wake.notify()
+            else:
+                held[1] = bytes(data)
+                self.stats["replaced"] += 1
+            self.stats["writes"] += 1
 
-    while (x < num_bytes):
-        return_bytes.append(int(s[-2 - (x * 2)] + s[-1 - (x * 2)], base=16))
-        x = x + 1
+#
+# The flush method sends the held writes, all of them or only those for
+# tag 'uid', and waits for them.  It returns a list of strings saying
+# which writes failed, empty if they all worked.
+#
 
-    return return_bytes
+    def flush(self, uid=None):
 
+        with self.wake:
+            sent = self.send([key for key in self.held if uid is None or key[0] == uid])
 
+        return self.check(sent)
 
-####################################
 #
-# Main body of the code starts here.
+# send takes the writes off the held table and submits them, and is
+# called with the lock held.  check waits for them and reports any that
+# failed.
 #
-####################################
 
-def ti_write_addressed_block(port_to_use, tag_UID, tag_BLK, tag_DAT):
+    def send(self, keys):
 
-    result = []
+        commands = self.session.commandQueue()
+        sent = []
+        for key in sorted(keys):
+            since, data = self.held.pop(key)
+            uid, block = key
+            if self.session.read_ahead is not None:
+                self.session.read_ahead.forget(uid)
+            sent.append((uid, block, data,
+                         commands.submit(formWriteCommand(uid, block, data), parseWrite)))
+        self.stats["sent"] += len(sent)
+        return sent
 
-#
-# The TI reader defaults to 57600 baud, 8 bit data, 1 stop bit and no parity.
-# There is no handshaking.
-#
-# Note that the timeout here is set to 5 seconds.  That is more than enough
-# time to allow the TI RFID reader to turn on its radio, command a tag, and get
-# data back from it.  We assume that if we time out and we don't have any data
-# then the RFID reader is not on line.
-#
+    def check(self, sent):
 
-    try:
-        tiser = serial.Serial(port_to_use, baudrate=57600, bytesize=8,
-                              parity='N', stopbits=1, timeout=0.5,
-                              xonxoff=0, rtscts=0, dsrdtr=0)
-    except:
-        result.append("Can't open " + port_to_use + ".")
-        result.append("Under linux or Apple OS you need the full path, ie /dev/ttyUSB0.")
-        result.append("Under windows use the communication port name, ie COM8.")
-        return result
+        failures = []
+        for uid, block, data, future in sent:
+            try:
+                error = future.result()
+            except Exception as exception:  # the port went away, for example
+                error = str(exception)
+            if error is None:
+                continue
 
-#
-# To use the write() method in python it needs to be in the form of a
-# string or a buffer, which is just a pointer into memory.  This code
-# forms an array of bytes from a list that contains the command to send
-# and then uses a buffer (memoryview) to write it out.
-#
-# Note that the S6350 reader uses a wrapper that encapsulates all
-# ISO commands.  Every ISO commands needs to have this wrapper with
-# the S6350 reader.  For some commands the entire length is not
-# known ahead of time, so some pieces are filled in later and the
-# checksum bytes generated last and filled in.  This command is a
-# good example of a command where the length can change, in this
-# case as the mask grows in length.
-#
-# In this wrapper, the bytes are as follows:
-#
-# 0: SOF
-# 1 & 2: length LSB and MSB respectively, filled in later
-# 3 & 4: TI reader address fields, always set to 0
-# 5: TI reader command flags
-# 6: TI reader ISO pass thru command, always 0x60
-#
+            failure = ("Write of block " + hex(block) + " of ID: " + s6350_tags.uidToHex(uid)
+                       + " failed: " + error)
+            failures.append(failure)
+            with self.wake:
+                self.stats["failed"] += 1
+                self.errors.append(failure)
+            if self.callback is not None:
+                self.callback(uid, block, data, error)
 
-    write_addressed_block = [0x01, 0, 0, 0, 0, 0, 0x60]  # the ISO wrapper
+        return failures
 
 #
-# Extend the list with the actual ISO command without the SOF, CRC16 and EOF
-# On the first inventory pass, the mask length is zero.  It will grow as
-# collisions are encountered, but for now form the ISO inventory command
-# asking for 16 time slots, and no mask.
+# The watch method runs on the WriteBehind's own thread.  It sleeps until
+# the oldest held write is due and then sends all the writes that are.
 #
-# The bytes that extend the list are as follows:
+
+    def watch(self):
+
+        while True:
+            with self.wake:
+                if not self.running:
+                    return
+
+                now = time.monotonic()
+                due = [key for key, (since, data) in self.held.items()
+                       if now - since >= self.max_delay]
+                if len(due) == 0:
+                    wait = None
+                    if len(self.held) > 0:
+                        oldest = min(since for since, data in self.held.values())
+                        wait = oldest + self.max_delay - now
+                    self.wake.wait(wait)
+                    continue
+
+                sent = self.send(due)
+
+            self.check(sent)
+
 #
-# 7: ISO reader config byte 0.The value in this case is 0x11
-# 8: Tag flags. Option flag must be set in this command. o_f=1, s_f=0, a_f=1
-# 9: The ISO command.  In this case 0x21
+# The stop method stops the thread and flushes whatever is still held.
+# It returns the failures, like flush.
 #
 
-    write_addressed_block.extend([0x11, 0x6b, 0x21])
+    def stop(self):
 
-#
-# Extend the list again to provide space for the requested tag address (UID),
-# memory block number and block data to write.  Eight bytes for the UID,
-# 1 byte for the block number and 4 bytes for the block data.
+        with self.wake:
+            self.running = False
+            self.wake.notify()
+        if threading.current_thread() is not self.thread:
+            self.thread.join()
+
+        return self.flush()
 
-    write_addressed_block.extend([0, 0, 0, 0, 0, 0, 0, 0]) # UID
-    write_addressed_block.extend([0, 0, 0, 0, 0, 0]) #block number and data
 
 #
-# Extend the list 1 more time with places for the checksum bytes.
-# Those will be computed and added later to the resulting byte array
-# that is formed to send to the reader.
+# The writeBehind function starts write behind on a session, holding
+# writes for up to 'max_delay' seconds, and returns the session's
+# WriteBehind.  ti_write_addressed_block then holds its writes too.  A
+# max_delay of None flushes the held writes and stops write behind.
 #
 
-    write_addressed_block.extend([0, 0])  # the two checksum bytes
+def writeBehind(session, max_delay=1.0, callback=None):
+
+    if max_delay is None:
+        if session.write_behind is not None:
+            session.write_behind.stop()
+            session.write_behind = None
+        return None
 
+    if session.write_behind is None:
+        session.write_behind = WriteBehind(session, max_delay, callback)
+    session.write_behind.max_delay = max_delay
+    return session.write_behind
+
+
+####################################
 #
-# Now that the list containing the command template is done, it
-# is possible to compute the length of the command and create
-# the byte array.
+# Main body of the code starts here.
 #
+####################################
 
-    command_len = len(write_addressed_block)
-    command = bytearray(command_len)
-    idx = 0
-
-    for i in write_addressed_block:
-        command[idx] = i
-        idx += 1
+def ti_write_addressed_block(port_to_use, tag_UID, tag_BLK, tag_DAT):
 
-# Fill in the length
+    result = []
 
-    command[1] = command_len
+#
+# Open a session to the reader, or use the one we were given.  The TI
+# reader defaults to 57600 baud, 8 bit data, 1 stop bit and no parity.
+# There is no handshaking.
+#
+# The session does not use a fixed timeout.  It works out how long to
+# wait for each reply from the length of the reply and how long the
+# reader took to answer this kind of command before.  We assume that if
+# we time out and we don't have any data then the RFID reader is not on
+# line.
+#
 
+    session = s6350_session.openSession(port_to_use)
+    if isinstance(session, list):  # the port could not be opened
+        return session
 
 # Get the requested UID from the arg line
 
-    uid = " "  # init this to be some string
-
-    usr_str = tag_UID
-    uid = do_Hex_Input(usr_str, 8)
+    uid = s6350_tags.uidFromInput(tag_UID)  # the UID as an integer, or an error string
 
     if isinstance(uid, str):
         result.append("Error: " + uid)
         result.append("")
-        tiser.close()
+        session.release()
         return result
 
 # Get the requested block from the arg line
@@ -339,7 +354,7 @@ def ti_write_addressed_block(port_to_use, tag_UID, tag_BLK, tag_DAT):
     if isinstance(blk, str):
         result.append("Error: " + blk)
         result.append("")
-        tiser.close()
+        session.release()
         return result
 
 # Get the requested block data from the arg line
@@ -352,47 +367,38 @@ def ti_write_addressed_block(port_to_use, tag_UID, tag_BLK, tag_DAT):
     if isinstance(blk_data, str):
         result.append("Error: " + blk_data)
         result.append("")
-        tiser.close()
+        session.release()
         return result
 
+#
+# Anything the session has read ahead from this tag is out of date now.
+# If the session has write behind on, the write is only held for now.
+# See the WriteBehind class above.
+#
 
-# Fill in UID
-
-    idx = 10  # init to index in command array for first byte of UID
-
-    for i in uid:
-        command[idx] = i
-        idx += 1
-
-# Fill in block number.
-
-    command[18] = blk[1]
-    command[19] = blk[0]
-
-
-# Fill in block data
+    block = (blk[1] << 8) | blk[0]
 
-    idx = 20  # init to index in command array for first byte of block data
+    if session.read_ahead is not None:
+        session.read_ahead.forget(uid)
 
-    for i in blk_data:
-        command[idx] = i
-        idx += 1
+    if session.write_behind is not None:
+        session.write_behind.write(uid, block, bytes(blk_data))
+        result.append("Block Data Write held, it will be written within " +
+                      str(session.write_behind.max_delay) + " seconds.")
+        result.append("")
+        session.release()
+        return result
 
-# Compute and fill in the two checksum bytes
 
-    chksum = 0
-    idx = 0
-    while idx < (command_len - 2):
-        chksum ^= command[idx]
-        idx += 1
+#
+# Build the command.  See formWriteCommand above for its bytes.
+#
 
-    command[command_len - 2] = chksum  # 1st byte is the checksum
-    command[command_len - 1] = chksum ^ 0xff  # 2nd byte is ones comp of the checksum
+    command = formWriteCommand(uid, block, bytes(blk_data))
 
 # Send out the command to the reader and get the reply
     print("request : ", command.hex())
-    tiser.write(memoryview(command))  # memoryview is the same as buffer
-    response = getReturnPacket(tiser)  # read the response from the reader
+    response = session.transact(command)  # send the command and read the response
     print("Responce : ", response)
 
 #
@@ -400,7 +406,7 @@ def ti_write_addressed_block(port_to_use, tag_UID, tag_BLK, tag_DAT):
 #
 
     if(len(response) < 2):
-       tiser.close()
+       session.release()
        return response
        
     iso_errors = chkErrorISO(response)
@@ -423,7 +429,7 @@ def ti_write_addressed_block(port_to_use, tag_UID, tag_BLK, tag_DAT):
         result.append("Block Data Write OK.")
         result.append("")
 
-    tiser.close()
+    session.release()
     return result
 
 #
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+#
+
+#
+# The s6350_ndef program reads the NDEF messages out of an ISO 15693 tag
+# (an NFC Forum Type 5 tag).
+#
+# The tag memory starts with the capability container (CC), 4 or 8
+# bytes that say the memory holds NDEF data and how big the data area
+# is.  After it come TLV blocks, each a type byte, a length and that
+# many bytes of value:
+#
+# 0x00: NULL TLV, one byte with no length, used as padding
+# 0x03: NDEF message TLV, the value is the NDEF message
+# 0xFD: proprietary TLV
+# 0xFE: terminator TLV, one byte with no length, nothing after it counts
+#
+# A length is one byte, or if that byte is 0xFF the two bytes after it,
+# high byte first.
+#
+# The memory is not dumped in one go.  The TagMemoryStream reads only
+# the blocks that hold the bytes asked for, and keeps them so nothing is
+# read twice.  The CC and each TLV's type and length are read as they
+# are needed, so the reading stops at the terminator TLV, and the values
+# of TLVs other than NDEF messages are skipped without being read.  The
+# blocks of a long NDEF message are read with as few read multiple
+# blocks commands as it takes, all put on the command queue at once.
+#
+# See TI 6350 user manual, the ISO 15693-3 document and the NFC Forum
+# Type 5 Tag and NDEF specifications for more information.
+#
+# This is the CLI tool version.
+#
+
+import io
+import sys
+import s6350_session
+import s6350_tags
+import s6350_iso_read_multiple_blocks
+import s6350_tag_schema
+
+BLOCK_SIZE = s6350_tag_schema.BLOCK_SIZE
+
+NULL_TLV = 0x00
+NDEF_TLV = 0x03
+PROPRIETARY_TLV = 0xfd
+TERMINATOR_TLV = 0xfe
+
+
+#
+# The TagMemoryStream class gives the bytes of a tag's memory, reading
+# the blocks they are in the first time they are asked for.  'size' is
+# the number of bytes of memory, if known, so reads past the end are
+# refused without asking the tag.
+#
+
+class TagMemoryStream:
+
+    def __init__(self, session, uid, size=None):
+
+        self.session = session
+        self.uid = uid
+        self.size = size
+        self.blocks = {}  # block number -> 4 data bytes
+        self.stats = {"reads": 0, "blocks_read": 0}
+
+#
+# The read method returns 'length' bytes from byte 'offset', or a string
+# saying what went wrong.
+#
+
+    def read(self, offset, length):
+
+        end = offset + length
+        if self.size is not None and end > self.size:
+            return "Byte " + hex(end - 1) + " is past the end of the tag memory."
+
+        first = offset // BLOCK_SIZE
+        last = (end - 1) // BLOCK_SIZE
+        missing = [block for block in range(first, last + 1) if block not in self.blocks]
+
+        reads = []
+        for start, count in s6350_iso_read_multiple_blocks.runs(missing):
+            reads.append((start, s6350_iso_read_multiple_blocks.submitReadBlocks(
+                self.session, self.uid, start, count)))
+            self.stats["reads"] += 1
+            self.stats["blocks_read"] += count
+
+        for start, futures in reads:
+            blocks = s6350_iso_read_multiple_blocks.collectBlocks(futures)
+            if isinstance(blocks, str):
+                return blocks
+            for idx, block in enumerate(blocks):
+                self.blocks[start + idx] = block[1]
+
+        data = b"".join(self.blocks[block] for block in range(first, last + 1))
+        skip = offset - first * BLOCK_SIZE
+        return data[skip:skip + length]
+
+
+#
+# The readCC function reads the capability container.  It returns the
+# byte offset of the first TLV and the size of the memory in bytes, or
+# a string saying what went wrong.  Magic byte 0xE1 or 0xE2 says the tag
+# holds NDEF data.  The data area size is byte 2 times 8, or if byte 2
+# is 0 the CC is 8 bytes long and the size is bytes 6 and 7 times 8.
+#
+
+def readCC(stream):
+
+    cc = stream.read(0, 4)
+    if isinstance(cc, str):
+        return cc
+
+    if cc[0] not in (0xe1, 0xe2):
+        return "No NDEF capability container, the first byte is " + "0x%0.2x" % cc[0] + "."
+
+    if cc[2] != 0:
+        return 4, 4 + cc[2] * 8
+
+    cc = stream.read(4, 4)
+    if isinstance(cc, str):
+        return cc
+    return 8, 8 + ((cc[2] << 8) | cc[3]) * 8
+
+
+#
+# The readTLVs function goes through the TLVs of an NDEF formatted tag
+# up to the terminator TLV, or the end of the memory.  It returns a list
+# of (type, offset, value) for each TLV, where offset is the byte offset
+# of its value.  Only the values of the TLV types in 'wanted' are read,
+# the others have None.  Or it returns a string saying what went wrong.
+#
+
+def readTLVs(stream, wanted=(NDEF_TLV,)):
+
+    cc = readCC(stream)
+    if isinstance(cc, str):
+        return cc
+    offset, stream.size = cc
+
+    tlvs = []
+    while offset < stream.size:
+        kind = stream.read(offset, 1)
+        if isinstance(kind, str):
+            return kind
+        kind = kind[0]
+        offset += 1
+
+        if kind == TERMINATOR_TLV:
+            break
+        if kind == NULL_TLV:
+            continue
+
+        length = stream.read(offset, 1)
+        if isinstance(length, str):
+            return length
+        length = length[0]
+        offset += 1
+        if length == 0xff:
+            length = stream.read(offset, 2)
+            if isinstance(length, str):
+                return length
+            length = (length[0] << 8) | length[1]
+            offset += 2
+
+        value = None
+        if kind in wanted:
+            value = stream.read(offset, length)
+            if isinstance(value, str):
+                return value
+        elif offset + length > stream.size:
+            return "TLV " + "0x%0.2x" % kind + " runs past the end of the tag memory."
+
+        tlvs.append((kind, offset, value))
+        offset += length
+
+    return tlvs
+
+
+#
+# An NdefRecord is one record of an NDEF message.  'tnf' is the Type Name
+# Format (1 is an NFC Forum well known type, like 'T' for text or 'U' for
+# a URI).
+#
+
+class NdefRecord:
+
+    def __init__(self, tnf, type, id, payload):
+
+        self.tnf = tnf
+        self.type = type
+        self.id = id
+        self.payload = payload
+
+#
+# The describe method gives the record as one line of text, with text
+# and URI records decoded.
+#
+
+    def describe(self):
+
+        if self.tnf == 1 and self.type == b'T' and len(self.payload) > 0:
+            skip = 1 + (self.payload[0] & 0x3f)  # status byte and language code
+            coding = 'utf-16' if self.payload[0] & 0x80 else 'utf-8'
+            return "Text: " + self.payload[skip:].decode(coding, errors='replace')
+
+        if self.tnf == 1 and self.type == b'U' and len(self.payload) > 0:
+            prefix = ""
+            if self.payload[0] < len(URI_PREFIXES):
+                prefix = URI_PREFIXES[self.payload[0]]
+            return "URI: " + prefix + self.payload[1:].decode('utf-8', errors='replace')
+
+        return ("TNF: " + str(self.tnf) + " Type: " + self.type.decode('ascii', errors='replace')
+                + " Payload: " + self.payload.hex())
+
+
+URI_PREFIXES = ["", "http://www.", "https://www.", "http://", "https://", "tel:", "mailto:",
+                "ftp://anonymous:anonymous@", "ftp://ftp.", "ftps://", "sftp://", "smb://",
+                "nfs://", "ftp://", "dav://", "news:", "telnet://", "imap:", "rtsp://", "urn:",
+                "pop:", "sip:", "sips:", "tftp:", "btspp://", "btl2cap://", "btgoep://",
+                "tcpobex://", "irdaobex://", "file://", "urn:epc:id:", "urn:epc:tag:",
+                "urn:epc:pat:", "urn:epc:raw:", "urn:epc:", "urn:nfc:"]
+
+
+#
+# The parseNdef function splits an NDEF message into its records.  Each
+# record starts with a header byte:
+#
+# 0x80: MB, first record
+# 0x40: ME, last record
+# 0x20: CF, chunked record
+# 0x10: SR, short record, the payload length is 1 byte instead of 4
+# 0x08: IL, there is an ID length
+# 0x07: TNF
+#
+# followed by the type length, the payload length, the ID length if IL
+# is set, the type, the ID and the payload.  It returns the list of
+# NdefRecords, or a string saying what went wrong.
+#
+
+def parseNdef(message):
+
+    records = []
+    idx = 0
+
+    while idx < len(message):
+        header = message[idx]
+        idx += 1
+
+        fields = 2 + (0 if header & 0x10 else 3) + (1 if header & 0x08 else 0)
+        if idx + fields > len(message):
+            return "NDEF record " + str(len(records) + 1) + " is cut short."
+
+        type_len = message[idx]
+        if header & 0x10:
+            payload_len = message[idx + 1]
+            idx += 2
+        else:
+            payload_len = int.from_bytes(message[idx + 1:idx + 5], 'big')
+            idx += 5
+        id_len = 0
+        if header & 0x08:
+            id_len = message[idx]
+            idx += 1
+
+        if idx + type_len + id_len + payload_len > len(message):
+            return "NDEF record " + str(len(records) + 1) + " is cut short."
+
+        record_type = message[idx:idx + type_len]
+        idx += type_len
+        record_id = message[idx:idx + id_len]
+        idx += id_len
+        records.append(NdefRecord(header & 0x07, record_type, record_id,
+                                  message[idx:idx + payload_len]))
+        idx += payload_len
+
+        if header & 0x40:  # ME, the last record
+            break
+
+    return records
+
+
+####################################
+#
+# The real application code starts here.
+#
+####################################
+
+#
+# The ti_read_ndef function is the CLI version.  It returns a line for
+# each NDEF message and each of its records, and how much of the tag
+# was read.
+#
+
+def ti_read_ndef(port_to_use, tag_UID):
+
+    result = []
+
+    uid = s6350_tags.uidFromInput(tag_UID)
+    if isinstance(uid, str):
+        result.append("Error: " + uid)
+        return result
+
+    session = s6350_session.openSession(port_to_use)
+    if isinstance(session, list):  # the port could not be opened
+        return session
+
+    stream = TagMemoryStream(session, uid)
+    tlvs = readTLVs(stream)
+    session.release()
+
+    if isinstance(tlvs, str):
+        result.append("Error: " + tlvs)
+        return result
+
+    messages = [tlv for tlv in tlvs if tlv[0] == NDEF_TLV]
+    for kind, offset, value in messages:
+        records = parseNdef(value)
+        if isinstance(records, str):
+            result.append("NDEF message at byte " + hex(offset) + ": " + records)
+            continue
+        result.append("NDEF message at byte " + hex(offset) + ", " + str(len(records)) + " records")
+        for number, record in enumerate(records, start=1):
+            result.append("Record " + str(number) + ": " + record.describe())
+
+    if len(messages) == 0:
+        result.append("No NDEF messages found.")
+    result.append("Blocks read: " + str(stream.stats["blocks_read"]) + " in " +
+                  str(stream.stats["reads"]) + " reads.")
+    return result
+
+#
+# Standalone 'main' starts here.
+#
+
+if __name__ == '__main__':
+#
+# Check that there are at least two arguments which hopefully will be
+# the serial port ID that is to be used and the tag UID.
+#
+
+    if len(sys.argv) < 3 :
+        print ("Usage: ")
+        print (sys.argv[0] + " serial_port_to_use tag_UID")
+        print ("Where tag_UID is a number in hex.")
+        sys.exit()
+
+    all_results = ti_read_ndef(sys.argv[1], sys.argv[2])
+    for line in all_results:
+        print(line)
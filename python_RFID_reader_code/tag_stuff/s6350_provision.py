@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+#
+
+#
+# The s6350_provision program writes block images into batches of tags.
+#
+# The jobs come from a CSV manifest, one job per line:
+#
+# uid,start_block,data
+#
+# where uid is the tag UID in hex, or 'next' for whichever tag is put in
+# front of the reader next, start_block is the first block number in
+# hex, and data is the image in hex, 8 hex digits (4 bytes) per block.
+# A first line starting with 'uid' and lines starting with # are skipped.
+#
+# The runner keeps one session open per reader and does inventories to
+# see which tags have been put in the field.  A tag named in a job gets
+# that job's image.  Any other tag that has not been done yet gets the
+# next 'next' job.  The tag is selected (see s6350_iso_select) so the
+# writes and reads to it don't each carry its UID.  All the blocks of an
+# image are written in one go on the session's command queue, then read
+# back and compared.  Blocks that don't match are written again, up to
+# 'retries' times.
+#
+# With more than one reader each one has its own thread.  Jobs are
+# claimed under a lock, so two readers never write the same job or the
+# same tag, even when a tag is in both fields.
+#
+# Every finished job is added to a journal file, and the file is flushed
+# to disk straight away.  When the runner is started again with the same
+# journal the jobs in it, and the tags they were written to, are skipped,
+# so a crash or a stop part way through a batch does not redo finished
+# tags.
+#
+# See TI 6350 user manual and the ISO 15693-3 document for more information.
+#
+# This is the CLI tool version.
+#
+
+import io
+import os
+import sys
+import csv
+import time
+import threading
+import s6350_session
+import s6350_tags
+import s6350_iso_inventory
+import s6350_iso_read_multiple_blocks
+import s6350_iso_write_addressed_block
+
+DONE = "DONE"
+FAILED = "FAILED"
+
+
+#
+# A ProvisionJob is one line of the manifest.  'uid' is None for a job
+# that goes to the next tag presented.  'number' is the line number in
+# the manifest, which is what the journal records.
+#
+
+class ProvisionJob:
+
+    def __init__(self, number, uid, start, data):
+
+        self.number = number
+        self.uid = uid
+        self.start = start
+        self.data = data  # 4 bytes per block
+
+    def blockCount(self):
+
+        return len(self.data) // 4
+
+
+#
+# The readManifest function reads the jobs from a CSV manifest.  It
+# returns the list of ProvisionJobs, or a string saying what is wrong
+# with the first bad line.
+#
+
+def readManifest(path):
+
+    jobs = []
+
+    with open(path, newline='') as manifest:
+        for number, row in enumerate(csv.reader(manifest), start=1):
+            if len(row) == 0 or row[0].strip().startswith('#'):
+                continue
+            if number == 1 and row[0].strip().lower() == 'uid':
+                continue  # the heading
+            if len(row) < 3:
+                return "Line " + str(number) + ": need uid, start_block and data."
+
+            uid = row[0].strip()
+            if uid.lower() in ('next', '*', ''):
+                uid = None
+            else:
+                uid = s6350_tags.uidFromInput(uid)
+                if isinstance(uid, str):
+                    return "Line " + str(number) + ": " + uid
+
+            try:
+                start = int(row[1].strip(), base=16)
+                data = bytes.fromhex(row[2].strip())
+            except ValueError:
+                return "Line " + str(number) + ": start_block and data must be hex."
+
+            if len(data) == 0 or len(data) % 4 != 0:
+                return "Line " + str(number) + ": data must be whole 4 byte blocks."
+
+            jobs.append(ProvisionJob(number, uid, start, data))
+
+    return jobs
+
+
+#
+# The Provisioner class runs the jobs.  'callback', if given, is called
+# as callback(event, job, uid, detail) when a job is DONE or a try at it
+# FAILED.  A job that fails 'max_attempts' times is given up on, and for
+# a 'next' job the tag it failed on is not used again.
+#
+
+class Provisioner:
+
+    def __init__(self, jobs, journal_path, retries=2, max_attempts=3,
+                 poll_interval=0.2, callback=None):
+
+        self.journal_path = journal_path
+        self.retries = retries
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.callback = callback
+
+        self.lock = threading.Lock()
+        self.done_jobs = set()  # job numbers in the journal
+        self.done_uids = set()  # tags already written
+        self.bad_uids = set()  # tags a 'next' job failed on
+        self.claimed = set()  # tags being written right now
+        self.in_flight = set()  # numbers of the jobs being written right now
+        self.attempts = {}  # failed tries per job number
+        self.failed = []  # jobs given up on
+        self.running = False
+
+        self.readJournal()
+        self.pending = [job for job in jobs if job.number not in self.done_jobs]
+        self.reserved = set(job.uid for job in self.pending if job.uid is not None)
+
+        self.journal = open(journal_path, 'a')
+
+#
+# The journal has one line per finished job: the job number, the tag UID
+# and the time.
+#
+
+    def readJournal(self):
+
+        if not os.path.exists(self.journal_path):
+            return
+
+        with open(self.journal_path) as journal:
+            for line in journal:
+                fields = line.split(',')
+                if len(fields) < 2:
+                    continue  # a line cut short by a crash
+                try:
+                    number = int(fields[0])
+                    uid = s6350_tags.uidFromHex(fields[1].strip())
+                except ValueError:
+                    continue
+                self.done_jobs.add(number)
+                self.done_uids.add(uid)
+
+    def writeJournal(self, job, uid):
+
+        self.journal.write(str(job.number) + "," + s6350_tags.uidToHex(uid) + ","
+                           + "%.3f" % time.time() + "\n")
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+
+#
+# Every job is done or given up on once none are pending and none are
+# being written.  A job being written may still fail and go back on the
+# pending list, so the other readers must keep going until it is over.
+#
+
+    def finished(self):
+
+        with self.lock:
+            return len(self.pending) == 0 and len(self.in_flight) == 0
+
+#
+# The claim method picks a job for one of the tags in the field, and
+# marks the tag as being written.  Jobs for a named tag come first.  A
+# 'next' job can have any tag that is not done, not named by another
+# job, and not claimed by another reader.  It returns (job, uid), or
+# None if there is nothing to do for these tags.
+#
+
+    def claim(self, tags):
+
+        with self.lock:
+            for job in self.pending:
+                if job.uid is not None and job.uid in tags and job.uid not in self.claimed:
+                    self.pending.remove(job)
+                    self.claimed.add(job.uid)
+                    self.in_flight.add(job.number)
+                    return job, job.uid
+
+            for job in self.pending:
+                if job.uid is not None:
+                    continue
+                for uid in tags:
+                    if (uid in self.done_uids or uid in self.reserved
+                            or uid in self.bad_uids or uid in self.claimed):
+                        continue
+                    self.pending.remove(job)
+                    self.claimed.add(uid)
+                    self.in_flight.add(job.number)
+                    return job, uid
+                break  # no free tag for any 'next' job
+
+        return None
+
+#
+# The finish method records how a claimed job went.  A job that worked
+# goes in the journal.  One that failed goes back on the pending list,
+# unless it has used up its attempts.
+#
+
+    def finish(self, job, uid, error):
+
+        with self.lock:
+            self.claimed.discard(uid)
+            self.in_flight.discard(job.number)
+
+            if error is None:
+                self.writeJournal(job, uid)
+                self.done_jobs.add(job.number)
+                self.done_uids.add(uid)
+                self.reserved.discard(uid)
+                event = DONE
+            else:
+                self.attempts[job.number] = self.attempts.get(job.number, 0) + 1
+                if job.uid is None:
+                    self.bad_uids.add(uid)
+                if self.attempts[job.number] < self.max_attempts:
+                    self.pending.insert(0, job)
+                else:
+                    self.failed.append(job)
+                event = FAILED
+
+        if self.callback is not None:
+            self.callback(event, job, uid, error)
+
+#
+# The provision method writes a job's image into a tag and reads it back.
+# It returns None if the tag ends up holding the image, or a string
+# saying what went wrong.
+#
+
+    def provision(self, session, job, uid):
+
+        todo = list(range(job.blockCount()))  # block offsets still to write
+        tries = 0
+
+        while True:
+            for first, count in s6350_iso_read_multiple_blocks.runs(todo):
+                error = s6350_iso_write_addressed_block.writeBlocks(
+                    session, uid, job.start + first, job.data[4 * first:4 * (first + count)],
+                    selected=True)
+                if error is not None:
+                    return "Write failed: " + error
+
+            blocks = s6350_iso_read_multiple_blocks.readBlocks(session, uid, job.start,
+                                                               job.blockCount(), selected=True)
+            if isinstance(blocks, str):
+                return "Verify failed: " + blocks
+
+            todo = [idx for idx, block in enumerate(blocks)
+                    if block[1] != job.data[4 * idx:4 * idx + 4]]
+            if len(todo) == 0:
+                return None
+
+            if tries >= self.retries:
+                return "Verify failed: " + str(len(todo)) + " blocks don't match."
+            tries += 1
+
+#
+# The work method is the loop each reader runs.  It looks at what is in
+# the field and writes whatever jobs it can claim, until every job is
+# done or given up on, or stop is called.
+#
+
+    def work(self, session):
+
+        while self.running and not self.finished():
+            state = s6350_iso_inventory.InventoryState()
+            errors = s6350_iso_inventory.runInventory(session, state)
+
+            claimed_any = False
+            while len(errors) == 0 and self.running:
+                claim = self.claim(state.tags)
+                if claim is None:
+                    break
+                job, uid = claim
+                self.finish(job, uid, self.provision(session, job, uid))
+                claimed_any = True
+
+            if not claimed_any:
+                time.sleep(self.poll_interval)  # wait for the next tag
+
+#
+# The run method runs the jobs on one or more open sessions, each on its
+# own thread, and returns when they are all done or given up on, or when
+# 'timeout' seconds have passed.
+#
+
+    def run(self, sessions, timeout=None):
+
+        self.running = True
+        threads = [threading.Thread(target=self.work, args=(session,), daemon=True)
+                   for session in sessions]
+        for thread in threads:
+            thread.start()
+
+        end = None
+        if timeout is not None:
+            end = time.monotonic() + timeout
+
+        for thread in threads:
+            wait = None
+            if end is not None:
+                wait = max(0.0, end - time.monotonic())
+            thread.join(wait)
+
+        self.stop()
+        for thread in threads:
+            thread.join()
+
+    def stop(self):
+
+        self.running = False
+
+    def close(self):
+
+        self.journal.close()
+
+
+####################################
+#
+# The real application code starts here.
+#
+####################################
+
+#
+# The ti_provision function runs a manifest on one or more readers and
+# returns a line for each job done or failed, and the totals.
+#
+
+def ti_provision(ports_to_use, manifest_path, journal_path, timeout=None):
+
+    result = []
+
+    jobs = readManifest(manifest_path)
+    if isinstance(jobs, str):
+        result.append("Error: " + jobs)
+        return result
+
+    sessions = []
+    for port_to_use in ports_to_use:
+        session = s6350_session.openSession(port_to_use)
+        if isinstance(session, list):  # the port could not be opened
+            for other in sessions:
+                other.release()
+            return session
+        sessions.append(session)
+
+    def report(event, job, uid, detail):
+        line = event + " job " + str(job.number) + " ID: " + s6350_tags.uidToHex(uid)
+        if detail is not None:
+            line += " " + detail
+        result.append(line)
+
+    provisioner = Provisioner(jobs, journal_path, callback=report)
+    skipped = len(jobs) - len(provisioner.pending)
+    provisioner.run(sessions, timeout)
+    provisioner.close()
+
+    for session in sessions:
+        session.release()
+
+    if skipped > 0:
+        result.append("Jobs already in the journal: " + str(skipped))
+    result.append("Jobs done: " + str(len(provisioner.done_jobs)) + " of " + str(len(jobs)))
+    if len(provisioner.failed) > 0:
+        result.append("Jobs given up on: " + str(len(provisioner.failed)))
+    if len(provisioner.pending) > 0:
+        result.append("Jobs still to do: " + str(len(provisioner.pending)))
+
+    return result
+
+#
+# Standalone 'main' starts here.
+#
+
+if __name__ == '__main__':
+#
+# Check that there are at least three arguments which hopefully will be
+# the manifest, the journal and a serial port ID to use.
+#
+
+    if len(sys.argv) < 4 :
+        print ("Usage: ")
+        print (sys.argv[0] + " manifest_file journal_file serial_port_to_use [serial_port_to_use ...]")
+        print ("Where each line of the manifest is uid,start_block,data in hex, uid can be 'next'.")
+        sys.exit()
+
+    all_results = ti_provision(sys.argv[3:], sys.argv[1], sys.argv[2])
+    for line in all_results:
+        print(line)
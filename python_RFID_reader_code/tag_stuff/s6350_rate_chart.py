@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+#
+
+#
+# The s6350_rate_chart module has the RateChart widget, a small live
+# chart of how the inventories are going, so the antenna and the tags
+# can be moved around while watching the effect.
+#
+# It draws one strip per figure, each with the last 'samples' values:
+#
+# Tags/s: tags found per second
+# Rounds: inventory commands per full inventory
+# Collisions: fraction of the answering time slots that had a collision
+# Latency: average time per inventory command in milliseconds
+#
+# These are the figures measureInventory in s6350_iso_inventory returns.
+# addSample only queues the figures, and can be called from any thread.
+# The chart is redrawn at a fixed rate, every FRAME_MS milliseconds, and
+# only if new figures came in, no matter how fast the inventories go.
+# The lines are made once and only have their points moved, so a redraw
+# is cheap.
+#
+
+import queue
+import collections
+from tkinter import *
+
+FRAME_MS = 200  # time between redraws
+
+CHARTS = [("tags_per_second", "Tags/s", "%.0f", '#0000c0'),
+          ("rounds", "Rounds", "%.0f", '#008000'),
+          ("collision_ratio", "Collisions", "%.2f", '#c00000'),
+          ("latency_ms", "Latency ms", "%.1f", '#806000')]
+
+
+class RateChart(Frame):
+
+    def __init__(self, master, samples=120, width=480, strip_height=50, **options):
+
+        Frame.__init__(self, master, **options)
+
+        self.samples = samples
+        self.width = width
+        self.strip_height = strip_height
+        self.incoming = queue.SimpleQueue()  # figures waiting to be drawn
+        self.history = {}  # last 'samples' values of each figure
+        self.lines = {}
+        self.labels = {}
+
+        self.canvas = Canvas(self, width=width, height=strip_height * len(CHARTS),
+                             background='#ffffff', highlightthickness=0)
+        self.canvas.pack(side=TOP, fill='x')
+
+        top = 0
+        for key, title, form, colour in CHARTS:
+            self.history[key] = collections.deque(maxlen=samples)
+            self.canvas.create_line(0, top, width, top, fill='#d0d0d0')
+            self.lines[key] = self.canvas.create_line(0, 0, 0, 0, fill=colour, width=2)
+            self.labels[key] = self.canvas.create_text(4, top + 2, anchor=NW,
+                                                       text=title, fill=colour)
+            top += strip_height
+
+        self.after(FRAME_MS, self.frame)
+
+    def addSample(self, stats):
+
+        self.incoming.put(stats)
+
+    def clear(self):
+
+        for values in self.history.values():
+            values.clear()
+        self.redraw()
+
+    def frame(self):
+
+        changed = False
+        while True:
+            try:
+                stats = self.incoming.get_nowait()
+            except queue.Empty:
+                break
+            for key in self.history:
+                self.history[key].append(stats.get(key, 0.0))
+            changed = True
+
+        if changed:
+            self.redraw()
+
+        self.after(FRAME_MS, self.frame)
+
+#
+# The redraw method scales each strip to the biggest value in it, with
+# 14 pixels at the top for the label.
+#
+
+    def redraw(self):
+
+        step = self.width / max(1, self.samples - 1)
+        top = 0
+
+        for key, title, form, colour in CHARTS:
+            values = self.history[key]
+            bottom = top + self.strip_height - 2
+            span = self.strip_height - 16
+
+            if len(values) == 0:
+                self.canvas.coords(self.lines[key], 0, 0, 0, 0)
+                self.canvas.itemconfigure(self.labels[key], text=title)
+                top += self.strip_height
+                continue
+
+            scale = max(values)
+            if scale <= 0:
+                scale = 1.0
+
+            points = []
+            x = self.width - step * (len(values) - 1)  # newest value at the right
+            for value in values:
+                points.append(x)
+                points.append(bottom - span * value / scale)
+                x += step
+
+            if len(points) < 4:  # a line needs two points
+                points.extend(points)
+
+            self.canvas.coords(self.lines[key], *points)
+            self.canvas.itemconfigure(self.labels[key], text=title + ": "
+                                      + form % values[-1] + "   max " + form % max(values))
+            top += self.strip_height
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+#
+
+#
+# The s6350_reader_farm module runs several S6350 readers together.
+#
+# When the fields of two antennas overlap, running both readers at the
+# same time makes their commands collide and tags get missed.  Running
+# all the readers one after another avoids that but wastes the readers
+# whose fields don't overlap.  The ReaderFarm takes a list of which
+# readers interfere with each other (the interference graph) and runs
+# readers that don't interfere at the same time, while readers that do
+# take turns in time slices.
+#
+# Readers that are waiting for their turn have their RF carrier turned
+# off with the 0xF4 command, so an idle antenna doesn't disturb the ones
+# that are working.
+#
+# See TI 6350 user manual for more information.
+#
+
+import time
+import concurrent.futures
+import s6350_iso_inventory
+
+
+#
+# The ReaderFarm class.  'sessions' is a dictionary of open S6350Session
+# objects by reader name, and 'conflicts' a list of pairs of reader names
+# whose fields overlap.
+#
+
+class ReaderFarm:
+
+    def __init__(self, sessions, conflicts=()):
+
+        self.sessions = dict(sessions)
+        self.neighbours = {name: set() for name in self.sessions}
+
+        for first, second in conflicts:
+            self.neighbours[first].add(second)
+            self.neighbours[second].add(first)
+
+        self.slices = {name: 0 for name in self.sessions}  # slices each reader ran in
+        self.errors = []
+        self.running = False
+        self.pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, len(self.sessions)))
+
+#
+# The groups method splits the readers into groups where no two readers
+# in a group interfere, using greedy graph colouring.  Readers with the
+# most neighbours are placed first (Welsh-Powell order), which tends to
+# give fewer groups, and so more time for each reader.
+#
+
+    def groups(self):
+
+        order = sorted(self.sessions, key=lambda name: -len(self.neighbours[name]))
+        groups = []
+
+        for name in order:
+            for group in groups:
+                if self.neighbours[name].isdisjoint(group):
+                    group.add(name)
+                    break
+            else:
+                groups.append({name})
+
+        return groups
+
+#
+# The activeSet method gives the readers that run in a time slice.  It is
+# the slice's group plus any other reader that doesn't interfere with a
+# reader already in the set, so no reader sits idle when it could run.
+#
+
+    def activeSet(self, group):
+
+        active = set(group)
+        for name in self.sessions:
+            if name not in active and self.neighbours[name].isdisjoint(active):
+                active.add(name)
+        return active
+
+#
+# The setCarriers method turns the carrier on for the active readers and
+# off for the rest.  A command is only sent when the state changes.
+#
+
+    def setCarriers(self, active):
+
+        for name, session in self.sessions.items():
+            on = name in active
+            if session.carrier_on != on:
+                errors = session.setCarrier(on)
+                if len(errors) > 0:
+                    self.errors.append(name + ": " + " ".join(errors))
+
+#
+# The runSlice method runs one time slice.  'work' is a function called
+# as work(name, session) over and over on each active reader, each on its
+# own thread, until 'slice_time' seconds are up.  Whatever work returns
+# is passed to callback(name, result) if a callback is given.
+#
+
+    def runSlice(self, group, work, slice_time, callback=None):
+
+        active = self.activeSet(group)
+        self.setCarriers(active)
+        end = time.monotonic() + slice_time
+
+        def runReader(name):
+            session = self.sessions[name]
+            while True:
+                result = work(name, session)
+                if callback is not None:
+                    callback(name, result)
+                if time.monotonic() >= end:
+                    return
+
+        futures = [self.pool.submit(runReader, name) for name in active]
+        for future in futures:
+            future.result()  # pass on any exception from the work
+
+        for name in active:
+            self.slices[name] += 1
+
+#
+# The run method goes round the groups, one time slice each, for
+# 'rounds' times round, or until stop is called if rounds is None.  At
+# the end all carriers are turned off.
+#
+
+    def run(self, work, slice_time=0.2, rounds=1, callback=None):
+
+        self.running = True
+        done = 0
+        groups = self.groups()
+
+        while self.running and (rounds is None or done < rounds):
+            for group in groups:
+                if not self.running:
+                    break
+                self.runSlice(group, work, slice_time, callback)
+            done += 1
+
+        self.setCarriers(set())
+        self.running = False
+
+    def stop(self):
+
+        self.running = False
+
+    def close(self):
+
+        self.pool.shutdown()
+
+
+#
+# The inventoryWork function is a ready made 'work' function that does one
+# full inventory on a reader and returns the TagSet of tags it found.
+#
+
+def inventoryWork(name, session):
+
+    state = s6350_iso_inventory.InventoryState()
+    s6350_iso_inventory.runInventory(session, state)
+    return state.tags
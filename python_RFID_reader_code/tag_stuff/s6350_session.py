@@ -0,0 +1,821 @@
+#!/usr/bin/env python3
+#
+
+#
+# The s6350_session module holds an open serial connection to a TI S6350
+# RFID reader so that more than one command can be sent over it.  It
+# also takes care of sending a command and reading back the reply
+# packet, which is what the getReturnPacket routines used to do in each
+# of the tag programs.
+#
+# The tag programs (ti_iso_inventory and friends) accept either a serial
+# port name or an already open S6350Session.  If a port name is given
+# the program opens its own session and closes it again when done, just
+# like before.  If a session is given it is used and left open, so a
+# program that talks to the reader a lot only pays for opening the port
+# once.
+#
+# See TI 6350 user manual and the ISO 15693-3 document for more information.
+#
+
+import time
+import queue
+import threading
+import concurrent.futures
+
+#
+# The TI reader defaults to 57600 baud, 8 bit data, 1 stop bit and no
+# parity.  Each byte on the wire is a start bit, 8 data bits and a stop
+# bit, so 10 bit times per byte.
+#
+
+BAUD_RATE = 57600
+BYTE_TIME = 10.0 / BAUD_RATE  # seconds to send one byte
+
+
+#
+# The ReplyTimer class works out how long to wait for a reply from the
+# reader.  A fixed timeout is either too long or too short.  A missing
+# tag or a dead reader stalls every call for the full timeout, and a
+# long multi-block reply can get cut off.
+#
+# The time until a reply is complete is the time the reader needs to
+# turn on its radio and talk to the tags (the RF turnaround) plus the
+# time to send the reply bytes over the serial link.  The second part
+# is known from the reply length.  The first part depends on the
+# command, so the timer learns it for each kind of command as an
+# exponentially weighted moving average (EWMA) of the observed latency.
+#
+# The timeout for a command is the reply time at 57600 baud plus
+# 'margin' times the learned turnaround, kept between 'floor' and
+# 'ceiling' seconds.  The ceiling is the old fixed 0.5 second timeout,
+# so nothing waits longer than it used to.
+#
+
+class ReplyTimer:
+
+    def __init__(self, turnaround=0.05, alpha=0.25, margin=3.0,
+                 floor=0.02, ceiling=0.5):
+
+        self.initial = turnaround  # guess used until a command is seen
+        self.alpha = alpha  # weight of the newest observation
+        self.margin = margin
+        self.floor = floor
+        self.ceiling = ceiling
+        self.turnaround = {}  # learned turnaround in seconds per command
+
+    def timeoutFor(self, key, reply_len):
+
+        wait = reply_len * BYTE_TIME
+        wait += self.margin * self.turnaround.get(key, self.initial)
+        return min(self.ceiling, max(self.floor, wait))
+
+    def expectedTime(self, key, reply_len):
+
+        return reply_len * BYTE_TIME + self.turnaround.get(key, self.initial)
+
+    def observe(self, key, elapsed, reply_len):
+
+        rf_time = max(0.0, elapsed - reply_len * BYTE_TIME)
+
+        if key not in self.turnaround:  # first one seeds the average
+            self.turnaround[key] = rf_time
+        else:
+            self.turnaround[key] += self.alpha * (rf_time - self.turnaround[key])
+
+#
+# If a reply does not come in time the learned value may just be too
+# small, for example when the first replies seen were unusually fast.
+# Doubling it makes the next try wait longer.  The ceiling caps the
+# learned value as well as the timeout, so a reader that is not on line
+# is not waited on for more than the old fixed timeout, and the estimate
+# it leaves behind can't stop time budgeted callers (see runInventory in
+# s6350_iso_inventory) from ever sending a command again.
+#
+
+    def missed(self, key):
+
+        self.turnaround[key] = min(self.ceiling,
+                                   max(self.floor, 2 * self.turnaround.get(key, self.initial)))
+
+
+#
+# One timer is shared by every session in the program, so what is
+# learned by one tool carries over to the next call.
+#
+
+replyTimer = ReplyTimer()
+
+
+#
+# The formCommand function builds a complete command packet for the
+# reader as a bytearray.  The S6350 wraps every command like this:
+#
+# 0: SOF
+# 1 & 2: length LSB and MSB respectively
+# 3 & 4: TI reader address fields, always set to 0
+# 5: TI reader command flags
+# 6: TI reader command, 0x60 for the ISO pass thru commands
+#
+# followed by the data for the command and the two checksum bytes.  The
+# first checksum byte is the XOR of all the bytes before it and the
+# second is the ones complement of the first.
+#
+
+def formCommand(reader_command, data):
+
+    command_len = 7 + len(data) + 2
+    command = bytearray(command_len)
+
+    command[0] = 0x01
+    command[1] = command_len
+    command[6] = reader_command
+    command[7:command_len - 2] = bytes(data)
+
+    chksum = 0
+    idx = 0
+    while idx < (command_len - 2):
+        chksum ^= command[idx]
+        idx += 1
+
+    command[command_len - 2] = chksum  # 1st byte is the checksum
+    command[command_len - 1] = chksum ^ 0xff  # 2nd byte is ones comp of the checksum
+
+    return command
+
+
+#
+# The messages transact hands back when a command fails.
+#
+
+NO_REPLY = "No data returned.  Is the reader turned on?"
+CHECKSUM_ERROR = "Checksum error!"
+SHORT_REPLY = "Short reply from the reader."
+
+
+#
+# The commandKey function picks out the bytes of a command that decide
+# how long the reader takes to answer it.  For ISO pass thru commands
+# that is the reader config byte, the tag flags and the ISO command (an
+# inventory with 16 time slots takes a lot longer than one with 1 slot).
+# For the reader's own commands it is just the command byte.
+#
+
+def commandKey(command):
+
+    if command[6] == 0x60:
+        return bytes(command[7:10])
+
+    return bytes(command[6:7])
+
+
+#
+# The expectedReplyLength function estimates the length in bytes of the
+# reply the reader will send back for a command.  Only the first two
+# bytes of the reply are waited for with this estimate.  The rest of
+# the reply is read using the real length that comes in the second
+# byte, so a bad guess here can not cut a reply short.
+#
+# The reply to an ISO command has 10 bytes of overhead.  A read single
+# block with the option flag set adds 5 bytes (4 data bytes and the
+# security byte), a read multiple blocks adds 5 bytes per block.  An
+# inventory adds 10 bytes per tag found, and we guess 1 tag for a 1
+# slot inventory and none for a 16 slot inventory.
+#
+# The number of blocks of a read multiple comes after the UID, or, for
+# a command to the selected tag (address flag 0x20 not set), straight
+# after the start block.
+#
+
+def expectedReplyLength(command):
+
+    if command[6] != 0x60:
+        return 10
+
+    iso_command = command[9]
+
+    if iso_command == 0x01:  # inventory
+        if command[8] & 0x20:  # 1 time slot
+            return 23
+        return 13
+
+    if iso_command == 0x20:  # read single block
+        return 15
+
+    if iso_command == 0x2b:  # system information, with every field
+        return 24
+
+    if iso_command == 0x23:  # read multiple blocks
+        if command[8] & 0x20:  # addressed, the UID is in the command
+            return 10 + 5 * (command[20] + 1)
+        return 10 + 5 * (command[12] + 1)
+
+    return 10
+
+
+#
+# The S6350Session class wraps an open serial port to the reader.
+#
+# If a 'tiser' is given it must be an already opened serial port (or
+# something that works like one), and port_to_use is then only a name
+# used in messages.  Otherwise the port is opened here.  Opening the
+# port can raise the pyserial exceptions, so use the openSession
+# routine below to get the usual error messages instead.
+#
+# 'retries' is how many more times a command is sent when its reply
+# comes back corrupt or short.  See the transact method.
+#
+# The stats dictionary also keeps the RF carrier on-time.  Every time
+# the carrier is turned off with setCarrier the time it was on is added
+# to stats["carrier_on_time"].  The carrierOnTime method gives the total
+# including the time it has been on so far.
+#
+# A session counts its users.  Whoever creates it is the first user.
+# The tag programs call openSession and release, so a session opened
+# from a port name is closed when the program is done with it, while a
+# session passed in by the caller stays open until the caller closes it.
+#
+
+class S6350Session:
+
+    def __init__(self, port_to_use, tiser=None, timer=None, retries=3):
+
+        if timer is None:
+            timer = replyTimer
+
+        self.port_to_use = port_to_use
+        self.timer = timer
+        self.retries = retries  # extra tries for a corrupt or short reply
+        self.users = 1
+        self.stats = {"commands": 0, "retries": 0, "checksum_errors": 0,
+                      "short_replies": 0, "timeouts": 0, "failures": 0,
+                      "carrier_switches": 0, "carrier_on_time": 0.0}
+        self.lock = threading.RLock()  # one command on the port at a time
+        self.commands = None  # CommandQueue, made when first needed
+        self.carrier_on = None  # RF carrier state, None until we set it
+        self.carrier_since = None  # when the carrier was last turned on
+        self.carrier = None  # CarrierManager, if manageCarrier was called
+        self.selected = None  # UID of the selected tag, see s6350_iso_select
+        self.coalescer = None  # ReadCoalescer, see s6350_iso_read_multiple_blocks
+        self.write_behind = None  # WriteBehind, see s6350_iso_write_addressed_block
+        self.read_ahead = None  # ReadAhead, see s6350_iso_read_multiple_blocks
+
+        if tiser is None:
+            import serial  # only needed when we open a real port
+            tiser = serial.Serial(port_to_use, baudrate=BAUD_RATE, bytesize=8,
+                                  parity='N', stopbits=1, timeout=timer.ceiling,
+                                  xonxoff=0, rtscts=0, dsrdtr=0)
+        self.tiser = tiser
+
+    def acquire(self):
+
+        self.users += 1
+        return self
+
+    def release(self):
+
+        self.users -= 1
+        if self.users <= 0:
+            self.close()
+
+    def close(self):
+
+        self.users = 0
+        if self.write_behind is not None:
+            self.write_behind.stop()  # sends the writes still held
+            self.write_behind = None
+        if self.coalescer is not None:
+            self.coalescer.stop()  # sends the reads still waiting
+            self.coalescer = None
+        if self.commands is not None:
+            self.commands.stop()
+            self.commands = None
+        if self.carrier is not None:
+            self.carrier.stop()  # turns the carrier off too
+            self.carrier = None
+        self.tiser.close()
+
+#
+# The setCarrier method turns the reader's RF carrier on or off with the
+# 0xF4 command, the same one the s6350_RF_carrier_on_off tool sends.  The
+# data byte is 0xFF for on and 0x00 for off.  A zero in byte 7 of the
+# reply means the command worked.  It returns an empty list if all went
+# well, or a list of strings saying what went wrong.
+#
+
+    def setCarrier(self, on):
+
+        result = []
+
+        if on:
+            command = formCommand(0xf4, [0xff])
+        else:
+            command = formCommand(0xf4, [0x00])
+
+        response = self.transact(command)
+
+        if len(response) < 2:  # no reply or a bad one
+            return response
+
+        if response[7] != 0:
+            result.append("Command execution error, returned code is " +
+                          hex(response[7]) + ".")
+            result.append("Carrier state not changed.")
+            return result
+
+        now = time.monotonic()
+        if on and self.carrier_on is not True:
+            self.carrier_since = now
+        elif not on and self.carrier_on and self.carrier_since is not None:
+            self.stats["carrier_on_time"] += now - self.carrier_since
+            self.carrier_since = None
+
+        self.stats["carrier_switches"] += 1
+        self.carrier_on = on
+        return result
+
+#
+# The readVersion method asks the reader for its firmware version with
+# the 0xF0 command, the same one the s6350_reader_version tool sends, and
+# returns the same lines that tool does.  The version number is in bytes
+# 7 and 8 of the reply.
+#
+
+    def readVersion(self):
+
+        result = []
+
+        response = self.transact(formCommand(0xf0, []))
+
+        if len(response) < 2:  # no reply or a bad one
+            return response
+
+        result.append("TI S6350 RFID Reader")
+        result.append("Firmware Version: " + str(response[8]) + "." +
+                      hex(response[7])[2:4])  # the [2:4] cuts off the 0x
+        return result
+
+    def carrierOnTime(self):
+
+        on_time = self.stats["carrier_on_time"]
+        if self.carrier_on and self.carrier_since is not None:
+            on_time += time.monotonic() - self.carrier_since
+        return on_time
+
+#
+# The manageCarrier method hands the RF carrier over to a CarrierManager
+# (see below) with the given idle timeout in seconds, and returns it.
+#
+
+    def manageCarrier(self, idle_timeout=2.0):
+
+        if self.carrier is None:
+            self.carrier = CarrierManager(self, idle_timeout)
+        self.carrier.idle_timeout = idle_timeout
+        return self.carrier
+
+#
+# The commandQueue method gives the session's CommandQueue, starting it
+# the first time it is asked for.  It is started under the session lock,
+# as more than one thread may ask for it at once, and there must only be
+# one queue so commands go out in the order they were submitted.
+#
+
+    def commandQueue(self):
+
+        with self.lock:
+            if self.commands is None:
+                self.commands = CommandQueue(self)
+            return self.commands
+
+#
+# The transact method sends a command to the reader and reads the reply.
+# If the reply is intact and the checksum is right it returns the reply
+# as a list of integers.  Otherwise it returns a list with a single
+# string saying what went wrong, so callers can tell the two apart by
+# checking if the length of what comes back is less than 2.
+#
+# A reply with a checksum error or one that is cut short is not the end
+# of the world.  Radio noise near the reader does that from time to time.
+# In that case whatever is left in the input buffer is thrown away and
+# the same command is sent again, up to 'retries' more times, without
+# closing the port.  Only the failed command is sent again, so a long
+# inventory does not have to start over.  If the reader does not answer
+# at all there is no retry, because a reader that is not on line won't
+# answer the next time either.  The input buffer is emptied after a
+# timeout too, in case the reply was only late.
+#
+# The stats dictionary counts what happened, so a program can report how
+# noisy the link is.
+#
+# Only one thread at a time can have a command going on the port, so the
+# session lock is held for the whole exchange.
+#
+# If the carrier is managed, the carrier is turned on before an ISO
+# command goes out, and the time of the command is noted so the carrier
+# manager knows when the reader went idle.
+#
+
+    def transact(self, command, reply_len=None):
+
+        if reply_len is None:
+            reply_len = expectedReplyLength(command)
+
+        with self.lock:
+            carrier = self.carrier
+            if carrier is None or command[6] != 0x60:
+                return self.transactLocked(command, reply_len)
+
+            carrier.beforeCommand()
+            response = self.transactLocked(command, reply_len)
+            carrier.afterCommand()
+            return response
+
+    def transactLocked(self, command, reply_len):
+
+        key = commandKey(command)
+        self.stats["commands"] += 1
+        tries = 0
+
+        while True:
+            response = self.exchange(command, key, reply_len)
+
+            if len(response) > 1:
+                break  # a good reply
+
+            self.tiser.reset_input_buffer()  # throw away what is left of the bad reply
+
+            if response[0] == NO_REPLY:
+                break  # nothing worth trying again
+
+            if response[0] == CHECKSUM_ERROR:
+                self.stats["checksum_errors"] += 1
+            else:
+                self.stats["short_replies"] += 1
+
+            if tries >= self.retries:
+                break
+
+            tries += 1
+            self.stats["retries"] += 1
+
+        if len(response) < 2:
+            if response[0] == NO_REPLY:
+                self.stats["timeouts"] += 1
+            self.stats["failures"] += 1
+
+        return response
+
+#
+# The exchange method does one try of a command.  The reply is read in 2
+# passes.  First we read the first two bytes.  The second byte is the
+# length of the entire returned packet.  From that we determine how many
+# more bytes to read which are then read in the second pass.  The first
+# pass uses the timeout from the reply timer, the second pass only has
+# to wait for the bytes to come over the serial link.
+#
+# The port stays open between commands, so a reply that came in after we
+# gave up waiting for it is still in the input buffer.  The buffer is
+# emptied before every command so that reply is not taken for the reply
+# to this one.
+#
+
+    def exchange(self, command, key, reply_len):
+
+        result = []
+
+        self.tiser.timeout = self.timer.timeoutFor(key, reply_len)
+
+        self.tiser.reset_input_buffer()  # a late reply to the last command
+
+        start = time.monotonic()
+        self.tiser.write(memoryview(command))  # memoryview is the same as buffer
+        line_size = self.tiser.read(2)  # first pass, read first two bytes of reply
+
+        if len(line_size) < 2:
+            if len(line_size) == 0:
+                self.timer.missed(key)
+                result.append(NO_REPLY)
+            else:
+                result.append(SHORT_REPLY)
+            return result
+
+        rddat_len = line_size[1]  # this is the length of the entire response
+
+        if rddat_len < 4:  # too short to even hold the checksum bytes
+            result.append(CHECKSUM_ERROR)
+            return result
+
+# second pass, allow twice the time the bytes need plus a little slack
+
+        self.tiser.timeout = 2 * (rddat_len - 2) * BYTE_TIME + self.timer.floor
+        line_data = self.tiser.read(rddat_len - 2)  # get the rest of the reply
+
+        if len(line_data) < rddat_len - 2:
+            result.append(SHORT_REPLY)
+            return result
+
+        self.timer.observe(key, time.monotonic() - start, rddat_len)
+
+        rddat = list(line_size)
+        rddat.extend(line_data)
+
+#
+# Compute the checksum.  To compute the checksum of the returned data you
+# just take the XOR of all the data bytes that were returned and compare
+# with the checksum bytes that were returned.  We compute the checksum on
+# the returned data bytes, but not including the returned checksum bytes.
+#
+
+        chksum = 0
+        idx = 0
+        while idx < (rddat_len - 2):
+            chksum ^= rddat[idx]
+            idx += 1
+
+        if chksum != rddat[rddat_len - 2]:
+            result.append(CHECKSUM_ERROR)
+            return result
+
+        return rddat  # return the reader data as a list
+
+
+#
+# The CommandQueue class lets a program keep the serial link busy.
+#
+# Normally every step waits for the one before: build a command, send
+# it, wait for the reply, pick the reply apart, and only then build the
+# next command.  The reader can only do one command at a time, but the
+# work on our side doesn't have to wait.  With a command queue the work
+# is done in three stages:
+#
+# 1. The caller builds (encodes) a command and submits it, along with a
+#    function to parse the reply.  It gets a future back straight away
+#    and can go on to build the next command.
+# 2. An I/O thread sends the commands one after another and reads the
+#    replies, using the session's transact method.
+# 3. A parse thread runs the parse function on each reply and sets the
+#    result on the future.  The I/O thread has already sent the next
+#    command by then.
+#
+# A future's result is what the parse function returns, or the reply
+# from transact if there is no parse function.  Replies that failed are
+# handed to the parse function the same way, so it should check the
+# length of the reply like every other routine does.
+#
+# Once the queue is stopped, the future of a command submitted to it
+# fails with a RuntimeError straight away.
+#
+
+class CommandQueue:
+
+    def __init__(self, session):
+
+        self.session = session
+        self.stopped = False
+        self.lock = threading.Lock()  # so nothing is queued after the stop
+        self.to_send = queue.SimpleQueue()
+        self.to_parse = queue.SimpleQueue()
+
+        self.io_thread = threading.Thread(target=self.sendCommands, daemon=True)
+        self.parse_thread = threading.Thread(target=self.parseReplies, daemon=True)
+        self.io_thread.start()
+        self.parse_thread.start()
+
+    def submit(self, command, parse=None, reply_len=None):
+
+        future = concurrent.futures.Future()
+
+        with self.lock:
+            if self.stopped:
+                future.set_exception(RuntimeError("The command queue is stopped."))
+                return future
+
+            carrier = self.session.carrier
+            if carrier is not None:
+                carrier.expect()  # get the carrier on before it is needed
+            self.to_send.put((future, command, parse, reply_len, carrier))
+
+        return future
+
+#
+# The finished method tells the carrier manager a command is done, but
+# only the one that was told about it in submit.  Commands submitted
+# before the carrier was managed were never counted.
+#
+
+    def finished(self, carrier):
+
+        if carrier is not None:
+            carrier.finished()
+
+    def sendCommands(self):
+
+        while True:
+            job = self.to_send.get()
+            if job is None:
+                self.to_parse.put(None)
+                return
+
+            future, command, parse, reply_len, carrier = job
+            if not future.set_running_or_notify_cancel():
+                self.finished(carrier)
+                continue  # the caller changed its mind
+
+            try:
+                response = self.session.transact(command, reply_len)
+            except Exception as error:  # the port went away, for example
+                self.finished(carrier)
+                future.set_exception(error)
+                continue
+
+            self.finished(carrier)
+
+            self.to_parse.put((future, response, parse))
+
+    def parseReplies(self):
+
+        while True:
+            job = self.to_parse.get()
+            if job is None:
+                return
+
+            future, response, parse = job
+            try:
+                if parse is not None:
+                    response = parse(response)
+                future.set_result(response)
+            except Exception as error:
+                future.set_exception(error)
+
+#
+# The stop method lets the commands already submitted finish and then
+# stops both threads.
+#
+
+    def stop(self):
+
+        with self.lock:
+            if not self.stopped:
+                self.stopped = True
+                self.to_send.put(None)
+        if threading.current_thread() not in (self.io_thread, self.parse_thread):
+            self.io_thread.join()
+            self.parse_thread.join()
+
+
+#
+# The CarrierManager class decides when the reader's RF carrier is on.
+#
+# Normally the reader turns its carrier on for each command and off again
+# after it, so every command pays for the carrier and the tags powering
+# up.  Leaving the carrier on all the time avoids that but heats the
+# reader and disturbs other readers nearby.  The carrier manager keeps
+# the carrier on while commands keep coming, and turns it off once the
+# session has been idle for 'idle_timeout' seconds:
+#
+# - Before an ISO command goes out the carrier is turned on if it is off.
+# - When commands are submitted to the session's CommandQueue the
+#   carrier is turned on straight away by the manager's own thread, so
+#   it is warm by the time the first command is sent.  It is not turned
+#   off while there are queued commands still to do.
+# - After the last command, once 'idle_timeout' seconds go by without
+#   another, the carrier is turned off.
+#
+# Errors from turning the carrier on or off are kept in the errors list.
+# The carrier on-time is in the session stats (see carrierOnTime).
+#
+# The manager thread never holds its own lock while it waits for the
+# session lock, so it can't deadlock with a command in progress.
+#
+
+class CarrierManager:
+
+    def __init__(self, session, idle_timeout=2.0):
+
+        self.session = session
+        self.idle_timeout = idle_timeout
+        self.last_used = time.monotonic()  # when the last command finished
+        self.pending = 0  # queued commands not yet done
+        self.warm_up = False  # True when the carrier should go on now
+        self.running = True
+        self.errors = []
+        self.wake = threading.Condition()
+
+        self.thread = threading.Thread(target=self.watch, daemon=True)
+        self.thread.start()
+
+    def switch(self, on):
+
+        errors = self.session.setCarrier(on)
+        self.errors.extend(errors)
+        self.last_used = time.monotonic()  # don't try again until the next timeout
+
+#
+# beforeCommand and afterCommand are called by transact with the session
+# lock held.
+#
+
+    def beforeCommand(self):
+
+        if self.session.carrier_on is not True:
+            self.switch(True)
+
+    def afterCommand(self):
+
+        with self.wake:
+            self.last_used = time.monotonic()
+            self.wake.notify()
+
+#
+# expect and finished are called by the CommandQueue when a command is
+# submitted and when it is done.
+#
+
+    def expect(self):
+
+        with self.wake:
+            self.pending += 1
+            if self.session.carrier_on is not True:
+                self.warm_up = True
+            self.wake.notify()
+
+    def finished(self):
+
+        with self.wake:
+            self.pending -= 1
+            self.last_used = time.monotonic()
+            self.wake.notify()
+
+#
+# The watch method runs on the manager thread.  It sleeps until there is
+# something to do: turn the carrier on for queued work, or turn it off
+# when the idle timeout is up.
+#
+
+    def watch(self):
+
+        while True:
+            with self.wake:
+                if not self.running:
+                    return
+
+                if self.warm_up:
+                    self.warm_up = False
+                    on = True
+                elif self.session.carrier_on and self.pending == 0:
+                    wait = self.last_used + self.idle_timeout - time.monotonic()
+                    if wait > 0:
+                        self.wake.wait(wait)
+                        continue
+                    on = False
+                else:
+                    self.wake.wait()
+                    continue
+
+            with self.session.lock:  # check again, a command may have come in
+                if on and self.session.carrier_on is not True:
+                    self.switch(True)
+                elif (not on and self.session.carrier_on and self.pending == 0
+                      and time.monotonic() - self.last_used >= self.idle_timeout):
+                    self.switch(False)
+
+#
+# The stop method stops the manager thread and turns the carrier off.
+#
+
+    def stop(self):
+
+        with self.wake:
+            self.running = False
+            self.wake.notify()
+        if threading.current_thread() is not self.thread:
+            self.thread.join()
+
+        with self.session.lock:
+            if self.session.carrier_on:
+                self.switch(False)
+
+
+#
+# The openSession function gives the tag programs a session to work with.
+# If port_to_use is already a session, that session is used.  Otherwise
+# port_to_use is a serial port name and a new session is opened on it.
+# If the port can't be opened a list of error strings is returned, which
+# the calling program can hand straight back to its own caller.
+#
+
+def openSession(port_to_use):
+
+    if isinstance(port_to_use, S6350Session):
+        return port_to_use.acquire()
+
+    result = []
+
+    try:
+        return S6350Session(port_to_use)
+    except (OSError, ValueError):
+        result.append("Can't open " + str(port_to_use) + ".")
+        result.append("Under linux or Apple OS you need the full path, ie /dev/ttyUSB0.")
+        result.append("Under windows use the communication port name, ie COM8.")
+        return result
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+#
+
+#
+# The s6350_sightings module keeps tag sightings and block reads in a
+# local SQLite database, so inventory results don't vanish once they have
+# been printed.  It is optional, nothing else in the library needs it.
+#
+# A sighting is a tag UID, the reader port it was seen on, the time and
+# the tag's DSFID.  A block read is a tag UID, the reader port, the time,
+# the block number, the 4 data bytes and the security byte.
+#
+# Writing to the database must never hold up the reader, so the add
+# methods only put the row on a queue.  A writer thread takes rows off
+# the queue and writes them in batches, one transaction per batch.  The
+# database uses write-ahead logging (WAL), so queries can be done while
+# the writer is busy.
+#
+# There are indexes on UID and time, so questions like "when was this
+# tag last seen" and "how long has it been around" are answered from the
+# index even with millions of rows.
+#
+# This is the CLI tool version.  Run it with the name of a database file
+# to get the number of rows, or with a database file and a UID to see
+# when that tag was first and last seen.
+#
+
+import io
+import sys
+import time
+import queue
+import sqlite3
+import threading
+import s6350_tags
+
+#
+# SQLite integers are signed 64 bit, and a lot of UIDs have the top bit
+# set, so UIDs are stored as the signed integer with the same bits.
+#
+
+def uidToSigned(uid):
+
+    if uid >= (1 << 63):
+        return uid - (1 << 64)
+    return uid
+
+
+def uidFromSigned(value):
+
+    if value < 0:
+        return value + (1 << 64)
+    return value
+
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS sightings ("
+    "uid INTEGER NOT NULL, port TEXT, time REAL NOT NULL, dsfid INTEGER)",
+    "CREATE TABLE IF NOT EXISTS block_reads ("
+    "uid INTEGER NOT NULL, port TEXT, time REAL NOT NULL, "
+    "block INTEGER NOT NULL, data BLOB, security INTEGER)",
+    "CREATE INDEX IF NOT EXISTS sightings_uid_time ON sightings (uid, time)",
+    "CREATE INDEX IF NOT EXISTS sightings_time ON sightings (time)",
+    "CREATE INDEX IF NOT EXISTS block_reads_uid_block ON block_reads (uid, block, time)",
+    "CREATE INDEX IF NOT EXISTS block_reads_time ON block_reads (time)",
+]
+
+
+#
+# The SightingStore class is the sink.  'batch_size' is the most rows
+# written in one transaction and 'flush_interval' the longest time in
+# seconds a row waits on the queue before it is written.
+#
+
+class SightingStore:
+
+    def __init__(self, path, batch_size=500, flush_interval=1.0):
+
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.SimpleQueue()
+        self.written = 0  # rows written so far
+        self.errors = []  # errors from the writer thread
+
+        db = self.connect()
+        for statement in SCHEMA:
+            db.execute(statement)
+        db.commit()
+        db.close()
+
+        self.reader = None  # connection for queries, made when needed
+        self.reader_lock = threading.Lock()
+
+        self.writer = threading.Thread(target=self.writeRows, daemon=True)
+        self.writer.start()
+
+    def connect(self):
+
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+#
+# The add methods queue a row and return straight away.  The time is the
+# time.time() of the sighting, and defaults to now.
+#
+
+    def addSighting(self, uid, port, dsfid, when=None):
+
+        if when is None:
+            when = time.time()
+        self.queue.put(("sightings", (uidToSigned(uid), port, when, dsfid)))
+
+    def addSightings(self, tags, port, when=None):
+
+        if when is None:
+            when = time.time()
+        for uid, dsfid in tags.items():
+            self.queue.put(("sightings", (uidToSigned(uid), port, when, dsfid)))
+
+    def addBlockRead(self, uid, port, block, data, security=None, when=None):
+
+        if when is None:
+            when = time.time()
+        self.queue.put(("block_reads", (uidToSigned(uid), port, when, block,
+                                        bytes(data), security)))
+
+#
+# The writeRows method runs on the writer thread.  It waits for a row,
+# then takes whatever else is on the queue up to the batch size, or until
+# the flush interval has passed, and writes the lot in one transaction.
+# A None on the queue tells it to finish up and stop.
+#
+
+    def writeRows(self):
+
+        db = self.connect()
+        running = True
+
+        while running:
+            row = self.queue.get()
+            if row is None:
+                break
+
+            batch = [row]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                wait = deadline - time.monotonic()
+                if wait <= 0:
+                    break
+                try:
+                    row = self.queue.get(timeout=wait)
+                except queue.Empty:
+                    break
+                if row is None:
+                    running = False
+                    break
+                batch.append(row)
+
+            sightings = [values for table, values in batch if table == "sightings"]
+            block_reads = [values for table, values in batch if table == "block_reads"]
+
+            try:
+                with db:  # one transaction for the batch
+                    db.executemany("INSERT INTO sightings VALUES (?, ?, ?, ?)",
+                                   sightings)
+                    db.executemany("INSERT INTO block_reads VALUES (?, ?, ?, ?, ?, ?)",
+                                   block_reads)
+                self.written += len(batch)
+            except sqlite3.Error as error:
+                self.errors.append(str(error))
+
+        db.close()
+
+#
+# The close method writes out whatever is still queued and stops the
+# writer thread.
+#
+
+    def close(self):
+
+        self.queue.put(None)
+        self.writer.join()
+        with self.reader_lock:
+            if self.reader is not None:
+                self.reader.close()
+                self.reader = None
+
+#
+# Queries.  They see the rows the writer has committed so far.
+#
+
+    def query(self, sql, args=()):
+
+        with self.reader_lock:
+            if self.reader is None:
+                self.reader = self.connect()
+            return self.reader.execute(sql, args).fetchall()
+
+    def lastSeen(self, uid):
+
+        rows = self.query("SELECT MAX(time) FROM sightings WHERE uid = ?",
+                          (uidToSigned(uid),))
+        return rows[0][0]
+
+    def firstSeen(self, uid, since=0.0):
+
+        rows = self.query("SELECT MIN(time) FROM sightings WHERE uid = ? AND time >= ?",
+                          (uidToSigned(uid), since))
+        return rows[0][0]
+
+#
+# The dwellTime method gives the time in seconds between the first and
+# last sightings of a tag at or after 'since', or None if it wasn't seen.
+#
+
+    def dwellTime(self, uid, since=0.0):
+
+        rows = self.query("SELECT MIN(time), MAX(time) FROM sightings "
+                          "WHERE uid = ? AND time >= ?", (uidToSigned(uid), since))
+        if rows[0][0] is None:
+            return None
+        return rows[0][1] - rows[0][0]
+
+    def seenSince(self, since):
+
+        rows = self.query("SELECT DISTINCT uid FROM sightings WHERE time >= ?", (since,))
+        return s6350_tags.TagSet(uidFromSigned(row[0]) for row in rows)
+
+    def lastBlockRead(self, uid, block):
+
+        rows = self.query("SELECT data, security, time FROM block_reads "
+                          "WHERE uid = ? AND block = ? ORDER BY time DESC LIMIT 1",
+                          (uidToSigned(uid), block))
+        if len(rows) == 0:
+            return None
+        return rows[0]
+
+
+#
+# Standalone 'main' starts here.
+#
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 2 :
+        print ("Usage: " + sys.argv[0] + " database_file [tag_UID]")
+        print ("Where tag_UID is a number in hex.")
+        sys.exit()
+
+    store = SightingStore(sys.argv[1])
+
+    if len(sys.argv) < 3:
+        print ("Sightings: " + str(store.query("SELECT COUNT(*) FROM sightings")[0][0]))
+        print ("Block reads: " + str(store.query("SELECT COUNT(*) FROM block_reads")[0][0]))
+    else:
+        uid = s6350_tags.uidFromInput(sys.argv[2])
+        if isinstance(uid, str):
+            print ("Error: " + uid)
+        elif store.lastSeen(uid) is None:
+            print ("ID: " + s6350_tags.uidToHex(uid) + " never seen.")
+        else:
+            print ("ID: " + s6350_tags.uidToHex(uid))
+            print ("First seen: " + time.ctime(store.firstSeen(uid)))
+            print ("Last seen: " + time.ctime(store.lastSeen(uid)))
+            print ("Dwell time: %.1f seconds" % store.dwellTime(uid))
+
+    store.close()
@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+#
+
+#
+# The s6350_tag_image program dumps whole tags to a compact binary file
+# and writes them back.
+#
+# ti_read_multiple_blocks gives text lines, about 60 bytes for every 4
+# bytes of tag memory, and has to be run once per tag.  A tag image is
+# the memory as it is, plus a short header.  Images are added one after
+# another to an archive file, so a whole batch of tags goes in one file.
+#
+# Each image is, with all numbers little endian:
+#
+# 0 to 7: "S6350IMG"
+# 8: format version, 1
+# 9: which of DSFID (0x01), AFI (0x02) and the geometry (0x04) the tag
+#    reported
+# 10 & 11: header size, 32
+# 12 to 19: the tag UID
+# 20: DSFID
+# 21: AFI
+# 22: bytes per block
+# 23: not used, 0
+# 24 & 25: first block in the image
+# 26 & 27: number of blocks in the image
+# 28 to 31: size of the whole image in bytes, so the next one can be
+#           found without looking at this one
+#
+# then the lock bitmap, one bit per block (bit 0 of the first byte is the
+# first block) set if the security status said the block is locked,
+# padded to a multiple of 4 bytes, and then the tag memory.
+#
+# Because the images are fixed layouts, an archive can be opened with
+# mmap and looked through without reading it all in or copying the
+# memory of each tag (see readArchive).
+#
+# Dumping reads the tag's system information for its DSFID, AFI and
+# memory size, then all of its blocks with read multiple blocks.  The
+# commands for every tag dumped are put on the session's command queue
+# before waiting for any of them.  Restoring writes all the blocks of an
+# image in one go on the command queue (see writeBlocks).  Blocks locked
+# in the image are written like the rest, they are not locked on the
+# tag the image is restored to.
+#
+# See TI 6350 user manual and the ISO 15693-3 document for more information.
+#
+# This is the CLI tool version.
+#
+
+import io
+import os
+import sys
+import mmap
+import struct
+import s6350_session
+import s6350_tags
+import s6350_iso_inventory
+import s6350_iso_read_multiple_blocks
+import s6350_iso_write_addressed_block
+from s6350_iso_helpers import chkErrorISO
+
+MAGIC = b"S6350IMG"
+VERSION = 1
+HEADER = struct.Struct("<8sBBHQBBBBHHI")
+
+HAS_DSFID = 0x01
+HAS_AFI = 0x02
+HAS_GEOMETRY = 0x04
+
+
+#
+# A TagImage is one tag's image.  'locked' is the lock bitmap and
+# 'memory' the tag memory, either bytes or memoryviews into an archive.
+#
+
+class TagImage:
+
+    def __init__(self, uid, first, count, memory, locked, dsfid=0, afi=0,
+                 block_size=4, known=0):
+
+        self.uid = uid
+        self.first = first
+        self.count = count
+        self.memory = memory
+        self.locked = locked
+        self.dsfid = dsfid
+        self.afi = afi
+        self.block_size = block_size
+        self.known = known  # HAS_ flags
+
+    def isLocked(self, block):
+
+        idx = block - self.first
+        return bool(self.locked[idx // 8] & (1 << (idx % 8)))
+
+    def block(self, block):
+
+        idx = (block - self.first) * self.block_size
+        return self.memory[idx:idx + self.block_size]
+
+    def pack(self):
+
+        bitmap = padded((self.count + 7) // 8)
+        size = HEADER.size + bitmap + len(self.memory)
+        header = HEADER.pack(MAGIC, VERSION, self.known, HEADER.size, self.uid, self.dsfid,
+                             self.afi, self.block_size, 0, self.first, self.count, size)
+        return header + bytes(self.locked).ljust(bitmap, b"\0") + bytes(self.memory)
+
+
+def padded(size):
+
+    return (size + 3) & ~3
+
+
+#
+# The unpackImage function reads the image at 'offset' in 'buffer' (bytes,
+# or a memoryview of an mmap).  It returns the TagImage and the offset of
+# the image after it, or a string saying what is wrong.  The lock bitmap
+# and the memory of the TagImage are memoryviews into 'buffer', nothing
+# is copied.
+#
+
+def unpackImage(buffer, offset=0):
+
+    if offset + HEADER.size > len(buffer):
+        return "Image at byte " + str(offset) + " is cut short."
+
+    (magic, version, known, header_size, uid, dsfid, afi, block_size, unused,
+     first, count, size) = HEADER.unpack_from(buffer, offset)
+
+    if magic != MAGIC:
+        return "No tag image at byte " + str(offset) + "."
+    if version != VERSION:
+        return "Tag image at byte " + str(offset) + " is version " + str(version) + "."
+    if offset + size > len(buffer):
+        return "Image at byte " + str(offset) + " is cut short."
+
+    view = memoryview(buffer)
+    bitmap = offset + header_size
+    memory = bitmap + padded((count + 7) // 8)
+    image = TagImage(uid, first, count, view[memory:memory + count * block_size],
+                     view[bitmap:bitmap + (count + 7) // 8], dsfid, afi, block_size, known)
+    return image, offset + size
+
+
+#
+# The readArchive function maps an archive file into memory and returns
+# the list of TagImages in it, whose memory is read from the file only
+# when it is looked at, or a string saying what is wrong.  The file
+# stays mapped while any of the images are in use.
+#
+
+def readArchive(path):
+
+    try:
+        with open(path, 'rb') as archive:
+            if os.fstat(archive.fileno()).st_size == 0:
+                return []
+            mapped = mmap.mmap(archive.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as error:
+        return "Can't read " + str(path) + ": " + str(error)
+
+    images = []
+    offset = 0
+    while offset < len(mapped):
+        unpacked = unpackImage(mapped, offset)
+        if isinstance(unpacked, str):
+            return unpacked
+        image, offset = unpacked
+        images.append(image)
+
+    return images
+
+
+#
+# The formSystemInfoCommand function builds an addressed get system
+# information command (0x2B) for a tag UID.  The reply has an info
+# flags byte and the UID, then the fields the info flags say are there:
+#
+# 0x01: DSFID, 1 byte
+# 0x02: AFI, 1 byte
+# 0x04: memory size, the number of blocks - 1 and the bytes per block - 1
+#       (in the low 5 bits)
+# 0x08: IC reference, 1 byte
+#
+# parseSystemInfo returns (known, dsfid, afi, blocks, block_size), with
+# 0 for what the tag didn't report, or a string saying what went wrong.
+#
+
+def formSystemInfoCommand(uid):
+
+    system_info = [0x11, 0x2b, 0x2b]
+    system_info.extend(s6350_tags.uidToBytes(uid))
+
+    return s6350_session.formCommand(0x60, system_info)
+
+
+def parseSystemInfo(response):
+
+    if len(response) < 2:  # no reply or a bad one
+        return response[0]
+
+    iso_errors = chkErrorISO(response)
+    if iso_errors[0] != 0:
+        return "Error code is: " + hex(iso_errors[0]) + " " + iso_errors[1]
+
+    info = response[8]
+    idx = 17  # after the info flags and the UID
+    known = 0
+    dsfid = afi = blocks = block_size = 0
+
+    if info & 0x01:
+        dsfid = response[idx]
+        known |= HAS_DSFID
+        idx += 1
+    if info & 0x02:
+        afi = response[idx]
+        known |= HAS_AFI
+        idx += 1
+    if info & 0x04:
+        blocks = response[idx] + 1
+        block_size = (response[idx + 1] & 0x1f) + 1
+        known |= HAS_GEOMETRY
+
+    return known, dsfid, afi, blocks, block_size
+
+
+#
+# The dumpTags function makes images of tags over an open session.  If
+# 'count' is given that many blocks are dumped from each tag, otherwise
+# as many as the tag says it has.  It returns a list with a TagImage, or
+# a string saying what went wrong, for each UID.
+#
+
+def dumpTags(session, uids, count=None):
+
+    commands = session.commandQueue()
+    infos = [commands.submit(formSystemInfoCommand(uid), parseSystemInfo) for uid in uids]
+
+    reads = []
+    for uid, future in zip(uids, infos):
+        info = future.result()
+        if isinstance(info, str):
+            reads.append(("System information failed: " + info, None))
+            continue
+
+        known, dsfid, afi, blocks, block_size = info
+        if count is not None:
+            blocks = count
+        elif not known & HAS_GEOMETRY:
+            reads.append(("Tag doesn't report its memory size, give the number of blocks.", None))
+            continue
+        if block_size not in (0, 4):
+            reads.append(("Tag has " + str(block_size) + " byte blocks, only 4 are supported.",
+                          None))
+            continue
+
+        reads.append((TagImage(uid, 0, blocks, None, None, dsfid, afi, 4, known),
+                      s6350_iso_read_multiple_blocks.submitReadBlocks(session, uid, 0, blocks)))
+
+    images = []
+    for image, futures in reads:
+        if futures is None:
+            images.append(image)
+            continue
+
+        blocks = s6350_iso_read_multiple_blocks.collectBlocks(futures)
+        if isinstance(blocks, str):
+            images.append("Read failed: " + blocks)
+            continue
+
+        locked = bytearray((image.count + 7) // 8)
+        for idx, block in enumerate(blocks):
+            if block[0] & 0x01:
+                locked[idx // 8] |= 1 << (idx % 8)
+        image.locked = locked
+        image.memory = b"".join(block[1] for block in blocks)
+        images.append(image)
+
+    return images
+
+
+#
+# The restoreImage function writes an image back into a tag, the one it
+# was taken from unless 'uid' is given.  It returns None if it worked, or
+# a string saying what went wrong.
+#
+
+def restoreImage(session, image, uid=None):
+
+    if uid is None:
+        uid = image.uid
+
+    if image.block_size != 4:
+        return "Image has " + str(image.block_size) + " byte blocks, only 4 are supported."
+
+    return s6350_iso_write_addressed_block.writeBlocks(session, uid, image.first, image.memory)
+
+
+####################################
+#
+# The real application code starts here.
+#
+####################################
+
+#
+# The ti_dump_image function dumps tags and adds their images to an
+# archive file.  With no UIDs every tag in the field is dumped.
+# num_BLKS, in hex, is the number of blocks for tags that don't report
+# their memory size.
+#
+
+def ti_dump_image(port_to_use, archive_path, tag_UIDs=(), num_BLKS=None):
+
+    result = []
+
+    count = None
+    if num_BLKS is not None:
+        try:
+            count = int(num_BLKS, base=16)
+        except ValueError:
+            result.append("Error: User input contains non-hex characters.")
+            return result
+
+    uids = []
+    for tag_UID in tag_UIDs:
+        uid = s6350_tags.uidFromInput(tag_UID)
+        if isinstance(uid, str):
+            result.append("Error: " + uid)
+            return result
+        uids.append(uid)
+
+    try:
+        archive = open(archive_path, 'ab')
+    except OSError as error:
+        result.append("Error: Can't write " + str(archive_path) + ": " + str(error))
+        return result
+
+    session = s6350_session.openSession(port_to_use)
+    if isinstance(session, list):  # the port could not be opened
+        archive.close()
+        return session
+
+    if len(uids) == 0:
+        state = s6350_iso_inventory.InventoryState()
+        errors = s6350_iso_inventory.runInventory(session, state)
+        if len(errors) > 0:
+            session.release()
+            archive.close()
+            return errors
+        uids = list(state.tags)
+
+    images = dumpTags(session, uids, count)
+    session.release()
+
+    dumped = 0
+    written = 0
+    with archive:
+        for uid, image in zip(uids, images):
+            if isinstance(image, str):
+                result.append("ID: " + s6350_tags.uidToHex(uid) + " Error: " + image)
+                continue
+            packed = image.pack()
+            archive.write(packed)
+            written += len(packed)
+            dumped += 1
+            result.append("ID: " + s6350_tags.uidToHex(uid) + " Blocks: " + str(image.count))
+
+    result.append("Tags dumped: " + str(dumped) + " Bytes written: " + str(written))
+    return result
+
+#
+# The ti_restore_image function writes the images in an archive back
+# into their tags.  If a UID is given only that tag's image is restored,
+# and if a target UID is given as well it is written into that tag.
+#
+
+def ti_restore_image(port_to_use, archive_path, tag_UID=None, target_UID=None):
+
+    result = []
+
+    images = readArchive(archive_path)
+    if isinstance(images, str):
+        result.append("Error: " + images)
+        return result
+
+    target = None
+    if tag_UID is not None:
+        uid = s6350_tags.uidFromInput(tag_UID)
+        if isinstance(uid, str):
+            result.append("Error: " + uid)
+            return result
+        images = [image for image in images if image.uid == uid][-1:]  # the newest one
+        if len(images) == 0:
+            result.append("Error: No image of " + s6350_tags.uidToHex(uid) + " in the archive.")
+            return result
+        if target_UID is not None:
+            target = s6350_tags.uidFromInput(target_UID)
+            if isinstance(target, str):
+                result.append("Error: " + target)
+                return result
+
+    session = s6350_session.openSession(port_to_use)
+    if isinstance(session, list):  # the port could not be opened
+        return session
+
+    for image in images:
+        uid = image.uid if target is None else target
+        error = restoreImage(session, image, uid)
+        line = "ID: " + s6350_tags.uidToHex(uid)
+        if error is not None:
+            line += " Error: " + error
+        else:
+            line += " Blocks written: " + str(image.count)
+        result.append(line)
+
+    session.release()
+    return result
+
+#
+# The ti_list_images function gives a line for each image in an archive.
+#
+
+def ti_list_images(archive_path):
+
+    result = []
+
+    images = readArchive(archive_path)
+    if isinstance(images, str):
+        result.append("Error: " + images)
+        return result
+
+    for image in images:
+        locked = sum(image.isLocked(block)
+                     for block in range(image.first, image.first + image.count))
+        result.append("ID: " + s6350_tags.uidToHex(image.uid) + " DSFID: " + "0x%0.2x" % image.dsfid
+                      + " AFI: " + "0x%0.2x" % image.afi + " Blocks: " + str(image.count)
+                      + " Locked: " + str(locked))
+    result.append("Images: " + str(len(images)))
+    return result
+
+#
+# Standalone 'main' starts here.
+#
+
+if __name__ == '__main__':
+#
+# Check that there are at least two arguments which hopefully will be
+# what to do and the archive file.
+#
+
+    if len(sys.argv) < 3 or sys.argv[1] not in ('dump', 'restore', 'list'):
+        print ("Usage: ")
+        print (sys.argv[0] + " dump archive_file serial_port_to_use [tag_UID ...]")
+        print (sys.argv[0] + " restore archive_file serial_port_to_use [tag_UID [target_UID]]")
+        print (sys.argv[0] + " list archive_file")
+        print ("Where tag_UID and target_UID are numbers in hex.")
+        sys.exit()
+
+    if sys.argv[1] == 'list':
+        all_results = ti_list_images(sys.argv[2])
+    elif len(sys.argv) < 4:
+        all_results = ["Error: A serial port is needed."]
+    elif sys.argv[1] == 'dump':
+        all_results = ti_dump_image(sys.argv[3], sys.argv[2], sys.argv[4:])
+    else:
+        all_results = ti_restore_image(sys.argv[3], sys.argv[2], *sys.argv[4:6])
+
+    for line in all_results:
+        print(line)
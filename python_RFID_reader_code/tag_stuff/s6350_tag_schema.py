@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+#
+
+#
+# The s6350_tag_schema program reads and writes named fields in tag
+# memory, so nobody has to work out block numbers by hand.
+#
+# A TagSchema is a list of fields.  Each field has a name, a struct
+# format (see the python struct module) that gives its type and byte
+# order, and a byte offset in the tag's memory.  For example:
+#
+# serial,8s
+# made,<I
+# uses,<H
+# limit,>H,20
+#
+# is an 8 byte serial number at byte 0, a little endian 32 bit time at
+# byte 8, a 16 bit counter at byte 12 and a big endian 16 bit limit at
+# byte 0x20 (offsets are in hex, like all the other numbers the tools
+# take).  A field with no offset goes right after the one before it.
+#
+# Reading or writing some fields works out which blocks they are in and
+# only touches those:
+#
+# - A read reads just the blocks the fields are in, neighbouring blocks
+#   in one read multiple blocks command, and decodes each field straight
+#   from the blocks read with struct.unpack_from.
+# - A write only writes the blocks the fields are in.  A block that a
+#   field only partly covers is read first, so the rest of the block is
+#   written back as it was.  Blocks the fields cover completely are not
+#   read at all.
+#
+# See TI 6350 user manual and the ISO 15693-3 document for more information.
+#
+# This is the CLI tool version.
+#
+
+import io
+import sys
+import csv
+import struct
+import s6350_session
+import s6350_tags
+import s6350_iso_read_multiple_blocks
+import s6350_iso_write_addressed_block
+
+BLOCK_SIZE = 4  # bytes per block, as everywhere else in these tools
+
+
+#
+# A Field is one entry of a schema.  'layout' is the compiled struct.
+#
+
+class Field:
+
+    def __init__(self, name, fmt, offset):
+
+        self.name = name
+        self.layout = struct.Struct(fmt)
+        self.offset = offset
+
+    def end(self):
+
+        return self.offset + self.layout.size
+
+    def blocks(self):
+
+        return range(self.offset // BLOCK_SIZE, (self.end() - 1) // BLOCK_SIZE + 1)
+
+
+#
+# The TagSchema class holds the fields.  'fields' is a list of (name,
+# format) or (name, format, byte offset) tuples.
+#
+
+class TagSchema:
+
+    def __init__(self, fields):
+
+        self.fields = {}
+        offset = 0
+        for field in fields:
+            if len(field) > 2 and field[2] is not None:
+                offset = field[2]
+            self.fields[field[0]] = Field(field[0], field[1], offset)
+            offset = self.fields[field[0]].end()
+
+    def select(self, names):
+
+        if names is None:
+            return list(self.fields.values())
+        return [self.fields[name] for name in names]
+
+#
+# The read method reads fields from a tag over an open session.  It
+# returns a dictionary of name: value, or a string saying what went
+# wrong.  A field with one value in its format gives that value,
+# otherwise a tuple.
+#
+
+    def read(self, session, uid, names=None):
+
+        fields = self.select(names)
+
+        blocks = set()
+        for field in fields:
+            blocks.update(field.blocks())
+
+        memory = readRuns(session, uid, s6350_iso_read_multiple_blocks.runs(sorted(blocks)))
+        if isinstance(memory, str):
+            return memory
+        first, image = memory
+
+        values = {}
+        for field in fields:
+            value = field.layout.unpack_from(image, field.offset - first * BLOCK_SIZE)
+            if len(value) == 1:
+                value = value[0]
+            values[field.name] = value
+
+        return values
+
+#
+# The write method writes fields of a tag over an open session.  'values'
+# is a dictionary of name: value, a tuple for a field with more than one
+# value in its format.  It returns None if it worked, or a string saying
+# what went wrong.
+#
+
+    def write(self, session, uid, values):
+
+        fields = self.select(values.keys())
+        if len(fields) == 0:
+            return None  # nothing to write
+
+        covered = {}  # block -> set of the byte offsets in it the fields cover
+        for field in fields:
+            for block in field.blocks():
+                low = max(field.offset, block * BLOCK_SIZE)
+                high = min(field.end(), (block + 1) * BLOCK_SIZE)
+                covered.setdefault(block, set()).update(range(low, high))
+
+        blocks = sorted(covered)
+        first = blocks[0]
+        image = bytearray(BLOCK_SIZE * (blocks[-1] + 1 - first))
+
+        partial = [block for block in blocks if len(covered[block]) < BLOCK_SIZE]
+        if len(partial) > 0:
+            memory = readRuns(session, uid, s6350_iso_read_multiple_blocks.runs(partial),
+                              first, blocks[-1] + 1)
+            if isinstance(memory, str):
+                return "Read before write failed: " + memory
+            image = memory[1]
+
+        for field in fields:
+            value = values[field.name]
+            if not isinstance(value, tuple):
+                value = (value,)
+            try:
+                field.layout.pack_into(image, field.offset - first * BLOCK_SIZE, *value)
+            except struct.error as error:
+                return "Bad value for " + field.name + ": " + str(error)
+
+        view = memoryview(image)
+        for start, count in s6350_iso_read_multiple_blocks.runs(blocks):
+            offset = (start - first) * BLOCK_SIZE
+            error = s6350_iso_write_addressed_block.writeBlocks(
+                session, uid, start, view[offset:offset + count * BLOCK_SIZE])
+            if error is not None:
+                return "Write failed: " + error
+
+        return None
+
+
+#
+# The readRuns function reads runs of blocks from a tag, all of them put
+# on the command queue before waiting for any.  It returns (first block,
+# image), where image is a bytearray with the memory from block 'first'
+# up to block 'end' (by default the first and last blocks of the runs),
+# with the blocks read filled in and zeros for the rest.  Or it returns
+# a string saying what went wrong.
+#
+
+def readRuns(session, uid, block_runs, first=None, end=None):
+
+    if first is None:
+        first = block_runs[0][0]
+    if end is None:
+        end = block_runs[-1][0] + block_runs[-1][1]
+    image = bytearray(BLOCK_SIZE * (end - first))
+
+    reads = [(start, s6350_iso_read_multiple_blocks.submitReadBlocks(session, uid, start, count))
+             for start, count in block_runs]
+
+    for start, futures in reads:
+        blocks = s6350_iso_read_multiple_blocks.collectBlocks(futures)
+        if isinstance(blocks, str):
+            return blocks
+        offset = (start - first) * BLOCK_SIZE
+        for security, data in blocks:
+            image[offset:offset + BLOCK_SIZE] = data
+            offset += BLOCK_SIZE
+
+    return first, image
+
+
+#
+# The readSchema function reads a schema file, one name,format[,offset]
+# line per field as shown at the top.  Lines starting with # are
+# skipped.  It returns the TagSchema, or a string saying what is wrong
+# with the first bad line.
+#
+
+def readSchema(path):
+
+    fields = []
+
+    with open(path, newline='') as schema:
+        for number, row in enumerate(csv.reader(schema), start=1):
+            if len(row) == 0 or row[0].strip().startswith('#'):
+                continue
+            if len(row) < 2:
+                return "Line " + str(number) + ": need name and format."
+
+            name = row[0].strip()
+            fmt = row[1].strip()
+            try:
+                struct.calcsize(fmt)
+            except struct.error:
+                return "Line " + str(number) + ": bad format " + fmt + "."
+
+            offset = None
+            if len(row) > 2 and row[2].strip() != '':
+                try:
+                    offset = int(row[2].strip(), base=16)
+                except ValueError:
+                    return "Line " + str(number) + ": offset must be hex."
+
+            fields.append((name, fmt, offset))
+
+    return TagSchema(fields)
+
+
+#
+# The parseValue function turns a value typed by the user into what the
+# field's format wants: text for a string field, a float for a floating
+# point field, or else a number (hex with 0x, or decimal).
+#
+
+def parseValue(field, text):
+
+    kind = field.layout.format[-1]
+    if kind in 'sp':
+        return text.encode()
+    if kind in 'efd':
+        return float(text)
+    if kind == '?':
+        return text.lower() in ('1', 'true', 'yes', 'on')
+    return int(text, 0)
+
+
+####################################
+#
+# The real application code starts here.
+#
+####################################
+
+#
+# The ti_fields function is the CLI version.  Each of 'requests' is a
+# field name to read, or name=value to write.  The writes are done
+# first, then the reads, and a line is returned for each field read.
+#
+
+def ti_fields(port_to_use, tag_UID, schema_path, requests):
+
+    result = []
+
+    schema = readSchema(schema_path)
+    if isinstance(schema, str):
+        result.append("Error: " + schema)
+        return result
+
+    uid = s6350_tags.uidFromInput(tag_UID)
+    if isinstance(uid, str):
+        result.append("Error: " + uid)
+        return result
+
+    reads = []
+    writes = {}
+    for request in requests:
+        name, equals, text = request.partition('=')
+        if name not in schema.fields:
+            result.append("Error: No field called " + name + ".")
+            return result
+        if equals == '':
+            reads.append(name)
+            continue
+        try:
+            writes[name] = parseValue(schema.fields[name], text)
+        except ValueError:
+            result.append("Error: Bad value for " + name + ": " + text)
+            return result
+
+    if len(reads) == 0 and len(writes) == 0:
+        reads = None  # read them all
+
+    session = s6350_session.openSession(port_to_use)
+    if isinstance(session, list):  # the port could not be opened
+        return session
+
+    if len(writes) > 0:
+        error = schema.write(session, uid, writes)
+        if error is not None:
+            result.append("Error: " + error)
+            session.release()
+            return result
+        result.append("Fields written: " + ", ".join(writes))
+
+    if reads is None or len(reads) > 0:
+        values = schema.read(session, uid, reads)
+        if isinstance(values, str):
+            result.append("Error: " + values)
+        else:
+            for name, value in values.items():
+                result.append(name + ": " + str(value))
+
+    session.release()
+    return result
+
+#
+# Standalone 'main' starts here.
+#
+
+if __name__ == '__main__':
+#
+# Check that there are at least three arguments which hopefully will be
+# the serial port ID that is to be used, the tag UID and the schema file.
+#
+
+    if len(sys.argv) < 4 :
+        print ("Usage: ")
+        print (sys.argv[0] + " serial_port_to_use tag_UID schema_file [field | field=value ...]")
+        print ("Where tag_UID is in hex and each line of the schema file is name,format[,offset].")
+        print ("With no fields all of them are read.")
+        sys.exit()
+
+    all_results = ti_fields(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4:])
+    for line in all_results:
+        print(line)
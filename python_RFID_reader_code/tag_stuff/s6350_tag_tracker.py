@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+#
+
+#
+# The s6350_tag_tracker program keeps track of which tags are in the RFID
+# reader field.  It does one full inventory after another on a session
+# and keeps a table of the tags it has seen, with the time each one was
+# first and last seen.  When a tag shows up it sends an ARRIVED event and
+# when it has not been seen for a while it sends a DEPARTED event.
+#
+# Events are debounced.  A tag has to be seen in 'arrive_hits' inventory
+# cycles in a row before it counts as arrived, and it has to be missed in
+# 'miss_threshold' cycles in a row before it counts as departed, so a tag
+# that drops out of one inventory because of noise does not come and go.
+#
+# Events go to a callback function, called as callback(event, uid, record),
+# and/or to a queue (anything with a put method, like queue.Queue) as
+# (event, uid, time) tuples.
+#
+# If an AFI is given only tags with that Application Family Identifier
+# are tracked.
+#
+# If a 'store' is given (see s6350_sightings) every tag seen in every
+# cycle is also written to it as a sighting.
+#
+# See TI 6350 user manual and the ISO 15693-3 document for more information.
+#
+# This is the CLI tool version.
+#
+
+import io
+import sys
+import time
+import threading
+import s6350_session
+import s6350_iso_inventory
+import s6350_tags
+
+ARRIVED = "ARRIVED"
+DEPARTED = "DEPARTED"
+
+
+#
+# A TagRecord is the entry in the tracker table for one tag.  The UID is
+# an integer (see s6350_tags).
+#
+
+class TagRecord:
+
+    def __init__(self, uid, dsfid, now, cycle):
+
+        self.uid = uid
+        self.dsfid = dsfid
+        self.first_seen = now
+        self.last_seen = now
+        self.last_cycle = cycle  # inventory cycle the tag was last seen in
+        self.hits = 0  # cycles in a row the tag was seen
+        self.present = False  # True once ARRIVED has been sent
+
+
+#
+# The TagTracker class does the tracking on an open session.
+#
+# To keep the work done per cycle down to the tags that changed, and not
+# the size of the whole table, every tag sits in a bucket for the cycle
+# it was last seen in.  Seeing a tag moves it to the current bucket.  At
+# the end of a cycle only the one bucket of tags last seen exactly
+# 'miss_threshold' cycles ago needs to be looked at, and every tag still
+# in it has departed.
+#
+# A cycle where the inventory stopped on an error doesn't count as a miss
+# for the tags that were not seen, as they may just not have been asked.
+#
+
+class TagTracker:
+
+    def __init__(self, session, miss_threshold=3, arrive_hits=1,
+                 callback=None, queue=None, afi=None, store=None):
+
+        self.session = session
+        self.afi = afi
+        self.store = store
+        self.miss_threshold = miss_threshold
+        self.arrive_hits = arrive_hits
+        self.callback = callback
+        self.queue = queue
+
+        self.table = {}  # TagRecord for each UID being tracked
+        self.buckets = {}  # set of UIDs last seen in each cycle
+        self.cycles = 0  # inventory cycles completed
+        self.failed_cycles = 0
+        self.thread = None
+        self.running = False
+
+    def emit(self, event, record):
+
+        if self.callback is not None:
+            self.callback(event, record.uid, record)
+        if self.queue is not None:
+            self.queue.put((event, record.uid, record.last_seen))
+
+#
+# The cycle method does one full inventory and updates the table.  It
+# returns the events of the cycle as a list of (event, uid) tuples.
+#
+
+    def cycle(self):
+
+        events = []
+
+        state = s6350_iso_inventory.InventoryState(self.afi)
+        errors = s6350_iso_inventory.runInventory(self.session, state)
+        now = time.time()
+
+        if self.store is not None:
+            self.store.addSightings(state.tags, self.session.port_to_use, now)
+
+        current = self.buckets.setdefault(self.cycles, set())
+
+        for uid, dsfid in state.tags.items():
+            record = self.table.get(uid)
+
+            if record is None:
+                record = TagRecord(uid, dsfid, now, self.cycles)
+                self.table[uid] = record
+            else:
+                if record.last_cycle != self.cycles:
+                    self.buckets[record.last_cycle].discard(uid)
+                if record.last_cycle < self.cycles - 1:  # missed a cycle
+                    record.hits = 0
+                record.last_seen = now
+                record.last_cycle = self.cycles
+                record.dsfid = dsfid
+
+            if uid not in current:
+                current.add(uid)
+                record.hits += 1
+
+            if not record.present and record.hits >= self.arrive_hits:
+                record.present = True
+                events.append((ARRIVED, uid))
+                self.emit(ARRIVED, record)
+
+        if len(errors) > 0:
+            self.failed_cycles += 1
+            return events
+
+        self.cycles += 1
+
+#
+# Tags last seen miss_threshold + 1 cycles ago have now been missed
+# miss_threshold times in a row.
+#
+
+        gone = self.buckets.pop(self.cycles - 1 - self.miss_threshold, set())
+        for uid in gone:
+            record = self.table.pop(uid)
+            if record.present:
+                events.append((DEPARTED, uid))
+                self.emit(DEPARTED, record)
+
+        return events
+
+#
+# The run method does cycles until stop is called or, if 'cycles' is
+# given, that many have been done.  'interval' is the time in seconds to
+# wait between cycles.
+#
+
+    def run(self, cycles=None, interval=0.0):
+
+        self.running = True
+        done = 0
+
+        while self.running and (cycles is None or done < cycles):
+            self.cycle()
+            done += 1
+            if interval > 0:
+                time.sleep(interval)
+
+        self.running = False
+
+#
+# The start and stop methods run the tracker on a background thread, so
+# the events come in while the program does other things.
+#
+
+    def start(self, interval=0.0):
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run, args=(None, interval),
+                                       daemon=True)
+        self.thread.start()
+
+    def stop(self):
+
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+####################################
+#
+# The real application code starts here.
+#
+####################################
+
+#
+# The ti_track_tags function tracks tags for a number of inventory cycles
+# and returns a line for every event.
+#
+
+def ti_track_tags(port_to_use, cycles, miss_threshold=3):
+
+    result = []
+
+    session = s6350_session.openSession(port_to_use)
+    if isinstance(session, list):  # the port could not be opened
+        return session
+
+    tracker = TagTracker(session, miss_threshold)
+
+    idx = 0
+    while idx < cycles:
+        for event, uid in tracker.cycle():
+            result.append(time.strftime("%H:%M:%S") + " " + event + " ID: "
+                          + s6350_tags.uidToHex(uid))
+        idx += 1
+
+    result.append("Tags in field: " + str(len(tracker.table)))
+
+    session.release()
+    return result
+
+#
+# Standalone 'main' starts here.  It prints events as they happen until
+# it is stopped with control-C.
+#
+
+if __name__ == '__main__':
+#
+# Check that there is at least one argument which hopefully will be
+# the serial port ID that is to be used.
+#
+
+    if len(sys.argv) < 2 :
+        print ("Usage: " + sys.argv[0] + " serial_port_to_use [miss_threshold]")
+        sys.exit()
+
+    session = s6350_session.openSession(sys.argv[1])
+    if isinstance(session, list):
+        for line in session:
+            print(line)
+        sys.exit()
+
+    miss_threshold = 3
+    if len(sys.argv) > 2:
+        miss_threshold = int(sys.argv[2])
+
+    tracker = TagTracker(session, miss_threshold,
+                         callback=lambda event, uid, record:
+                         print(time.strftime("%H:%M:%S") + " " + event + " ID: "
+                               + s6350_tags.uidToHex(uid)))
+    try:
+        tracker.run()
+    except KeyboardInterrupt:
+        pass
+
+    session.close()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+#
+
+#
+# The s6350_tag_view module has the TagView widget, the table the
+# tkinter programs use to show the tags an inventory finds.
+#
+# Putting every result line into a Text widget makes the widget grow
+# without limit when inventories are run over and over, and inserting
+# thousands of lines one at a time slows the GUI to a crawl.  The TagView
+# instead has one row per tag in a ttk.Treeview, with the UID, DSFID,
+# the time it was first and last seen, and how many times it was seen.
+#
+# - A tag seen again only updates its own row, it doesn't add a new one.
+# - Tags are handed to addTags, which only queues them.  The Treeview is
+#   updated once per frame (every FRAME_MS milliseconds) with just the
+#   rows that changed since the last frame, so a burst of inventories
+#   costs one redraw.  addTags can be called from any thread.
+# - At most 'max_rows' tags are kept.  When there are more, the ones
+#   that have not been seen for the longest are dropped.
+#
+# There is also a one line message under the table for errors and
+# totals, set with setMessage.  It is shown at the next frame too, so it
+# can also be set from any thread.
+#
+
+import time
+import queue
+import collections
+from tkinter import *
+from tkinter import ttk
+import s6350_tags
+
+FRAME_MS = 100  # time between Treeview updates
+
+COLUMNS = [("uid", "ID", 160), ("dsfid", "DSFID", 60),
+           ("first", "First Seen", 80), ("last", "Last Seen", 80),
+           ("count", "Count", 60)]
+
+
+class TagView(Frame):
+
+    def __init__(self, master, max_rows=1000, **options):
+
+        Frame.__init__(self, master, **options)
+
+        self.max_rows = max_rows
+        self.incoming = queue.SimpleQueue()  # (TagSet, time) waiting to be shown
+        self.rows = collections.OrderedDict()  # UID -> [dsfid, first, last, count]
+        self.changed = set()  # UIDs whose row needs redrawing
+        self.message = StringVar()
+        self.new_message = None  # message to show at the next frame
+
+        self.tree = ttk.Treeview(self, columns=[c[0] for c in COLUMNS],
+                                 show='headings', height=20)
+        for name, heading, width in COLUMNS:
+            self.tree.heading(name, text=heading)
+            self.tree.column(name, width=width, anchor=W)
+
+        scroll = Scrollbar(self, command=self.tree.yview)
+        self.tree['yscrollcommand'] = scroll.set
+
+        Label(self, textvariable=self.message, anchor=W).pack(side=BOTTOM, fill='x')
+        scroll.pack(side=RIGHT, fill='y')
+        self.tree.pack(side=TOP, fill='both', expand=True)
+
+        self.after(FRAME_MS, self.frame)
+
+#
+# The addTags method queues the tags of a TagSet, all seen at time
+# 'when' (time.time(), now if not given).
+#
+
+    def addTags(self, tags, when=None):
+
+        if when is None:
+            when = time.time()
+        self.incoming.put((tags, when))
+
+    def setMessage(self, text):
+
+        self.new_message = text
+
+    def clear(self):
+
+        self.rows.clear()
+        self.changed.clear()
+        self.tree.delete(*self.tree.get_children())
+
+#
+# The frame method runs every FRAME_MS.  It takes everything that was
+# queued since the last frame into the rows table, drops the oldest rows
+# if there are too many, and then redraws only the rows that changed.
+#
+
+    def frame(self):
+
+        text, self.new_message = self.new_message, None
+        if text is not None:
+            self.message.set(text)
+
+        while True:
+            try:
+                tags, when = self.incoming.get_nowait()
+            except queue.Empty:
+                break
+
+            for uid, dsfid in tags.items():
+                row = self.rows.get(uid)
+                if row is None:
+                    self.rows[uid] = [dsfid, when, when, 1]
+                else:
+                    row[0] = dsfid
+                    row[2] = when
+                    row[3] += 1
+                    self.rows.move_to_end(uid)  # most recently seen last
+                self.changed.add(uid)
+
+        while len(self.rows) > self.max_rows:
+            uid, row = self.rows.popitem(last=False)  # seen longest ago
+            self.changed.discard(uid)
+            iid = s6350_tags.uidToHex(uid)
+            if self.tree.exists(iid):
+                self.tree.delete(iid)
+
+        for uid in self.changed:
+            dsfid, first, last, count = self.rows[uid]
+            iid = s6350_tags.uidToHex(uid)
+            values = (iid, "0x%0.2x" % dsfid,
+                      time.strftime("%H:%M:%S", time.localtime(first)),
+                      time.strftime("%H:%M:%S", time.localtime(last)), count)
+            if self.tree.exists(iid):
+                self.tree.item(iid, values=values)
+            else:
+                self.tree.insert('', END, iid=iid, values=values)
+        self.changed.clear()
+
+        self.after(FRAME_MS, self.frame)
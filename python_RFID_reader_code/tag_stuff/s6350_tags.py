@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+#
+
+#
+# The s6350_tags module has the helpers for handling tag UIDs.
+#
+# An ISO 15693 UID is 64 bits, so inside the library a UID is kept as a
+# plain python integer.  That takes a lot less memory than a hex string,
+# and comparing, hashing and set operations on integers are fast.  A UID
+# is only turned into a hex string when it is shown to a person.
+#
+# The tags send their UID LSB first, which is also the order the UID goes
+# into a command, so uidFromBytes and uidToBytes use little-endian order.
+#
+
+#
+# The uidFromBytes function turns 8 UID bytes, LSB first, into an integer.
+#
+
+def uidFromBytes(uid_bytes):
+
+    return int.from_bytes(bytes(uid_bytes), "little")
+
+
+#
+# The uidToBytes function turns a UID integer into 8 bytes, LSB first.
+#
+
+def uidToBytes(uid):
+
+    return uid.to_bytes(8, "little")
+
+
+#
+# The uidToHex function formats a UID the way the tools always have,
+# as 0x followed by 16 lower case hex digits, MSB first.
+#
+
+def uidToHex(uid):
+
+    return "0x%0.16x" % uid
+
+
+#
+# The uidFromHex function turns a UID typed in as hex, with or without a
+# leading 0x, into an integer.  It raises ValueError if the input is not
+# hex or does not fit in 64 bits.
+#
+
+def uidFromHex(user_input):
+
+    uid = uidFromInput(user_input)
+    if isinstance(uid, str):
+        raise ValueError(uid)
+
+    return uid
+
+
+#
+# The uidFromInput function takes a UID the way a user or a calling
+# program gives it, either already as an integer or as a hex string, and
+# returns it as an integer.  Like do_Hex_Input in the tag programs, if
+# something is wrong it instead returns a string with the meaning of the
+# error, which the caller can check for with isinstance.
+#
+
+def uidFromInput(user_input):
+
+    if isinstance(user_input, int):
+        uid = user_input
+    else:
+        try:
+            uid = int(user_input, base=16)
+        except ValueError:
+            return "User input contains non-hex characters."
+
+    if uid < 0 or uid >= (1 << 64):
+        return "User input greater than required length."
+
+    return uid
+
+
+#
+# The TagSet class is a set of tags, keyed by UID integer, that also keeps
+# the DSFID of each tag.  It is backed by a dictionary, so membership,
+# adding and removing are constant time, and union, difference and
+# intersection only touch the entries involved.  Tags stay in the order
+# they were added.
+#
+# Iterating over a TagSet gives the UID integers.  The hexUids method
+# gives the UIDs as hex strings, one at a time, so nothing is formatted
+# until it is needed.
+#
+
+class TagSet:
+
+    def __init__(self, tags=None):
+
+        self.dsfids = {}  # DSFID for each UID in the set
+
+        if tags is not None:
+            self.update(tags)
+
+    def add(self, uid, dsfid=0):
+
+        if uid in self.dsfids:
+            return False
+
+        self.dsfids[uid] = dsfid
+        return True
+
+    def discard(self, uid):
+
+        self.dsfids.pop(uid, None)
+
+    def update(self, tags):
+
+        if isinstance(tags, TagSet):
+            self.dsfids.update(tags.dsfids)
+        else:
+            for uid in tags:
+                self.dsfids.setdefault(uid, 0)
+
+    def dsfid(self, uid):
+
+        return self.dsfids[uid]
+
+    def items(self):
+
+        return self.dsfids.items()
+
+    def hexUids(self):
+
+        for uid in self.dsfids:
+            yield uidToHex(uid)
+
+    def union(self, other):
+
+        tags = TagSet()
+        tags.dsfids = dict(self.dsfids)
+        tags.update(other)
+        return tags
+
+    def difference(self, other):
+
+        tags = TagSet()
+        tags.dsfids = {uid: dsfid for uid, dsfid in self.dsfids.items()
+                       if uid not in other}
+        return tags
+
+    def intersection(self, other):
+
+        if len(other) < len(self):  # walk the smaller of the two
+            small, large = other, self
+        else:
+            small, large = self, other
+
+        tags = TagSet()
+        for uid in small:
+            if uid in large:
+                tags.dsfids[uid] = self.dsfids[uid]
+        return tags
+
+    __or__ = union
+    __sub__ = difference
+    __and__ = intersection
+
+    def __contains__(self, uid):
+
+        return uid in self.dsfids
+
+    def __len__(self):
+
+        return len(self.dsfids)
+
+    def __iter__(self):
+
+        return iter(self.dsfids)
+
+    def __eq__(self, other):
+
+        if isinstance(other, TagSet):
+            return self.dsfids.keys() == other.dsfids.keys()
+        return NotImplemented
+
+    def __repr__(self):
+
+        return "TagSet([" + ", ".join(self.hexUids()) + "])"